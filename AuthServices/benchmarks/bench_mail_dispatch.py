@@ -0,0 +1,100 @@
+# compares reset mail delivery: one smtplib session per message (old send_reset_email) vs the pooled mailer.MailDispatcher
+# runs against a local aiosmtpd server (pip install aiosmtpd), --flaky makes the server defer some messages with 451
+# run from AuthServices/: python -m benchmarks.bench_mail_dispatch --messages 500
+import argparse
+import asyncio
+import smtplib
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+from aiosmtpd.controller import Controller
+import mailer
+
+class CountingHandler:
+    def __init__(self, flaky_every: int = 0):
+        self.flaky_every = flaky_every
+        self.received = 0
+        self.sessions = 0
+        self._seen = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.sessions += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        self._seen += 1
+        if self.flaky_every and self._seen % self.flaky_every == 0:
+            return "451 Try again later"
+        self.received += 1
+        return "250 OK"
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def make_message(i: int) -> EmailMessage:
+    msg = EmailMessage()
+    msg["Subject"] = "Password Reset Request"
+    msg["From"] = "noreply@example.com"
+    msg["To"] = f"user{i}@example.com"
+    msg.set_content(f"Please click the following link to reset your password:\n\nhttp://localhost/reset?token={i}\n")
+    return msg
+
+def legacy_send(port: int, msg: EmailMessage):
+    try:
+        with smtplib.SMTP("127.0.0.1", port) as server:
+            server.send_message(msg)
+    except smtplib.SMTPException:
+        pass
+
+async def run_legacy(port: int, count: int, threads: int):
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        start = time.perf_counter()
+        await asyncio.gather(*(loop.run_in_executor(pool, legacy_send, port, make_message(i)) for i in range(count)))
+        return time.perf_counter() - start
+
+async def run_pooled(port: int, count: int, pool_size: int, expected: int, handler: CountingHandler):
+    dispatcher = mailer.MailDispatcher(hostname="127.0.0.1", port=port, username="", start_tls=False, pool_size=pool_size)
+    dispatcher.start()
+    start = time.perf_counter()
+    for i in range(count):
+        dispatcher.enqueue(make_message(i))
+    while handler.received < expected and time.perf_counter() - start < 120:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    info = dispatcher.stats()
+    await dispatcher.stop()
+    return elapsed, info
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=40, help="threadpool size for the legacy path (starlette's default is 40)")
+    parser.add_argument("--pool", type=int, default=mailer.MAIL_POOL_SIZE)
+    parser.add_argument("--flaky", type=int, default=0, help="defer every Nth message with 451")
+    args = parser.parse_args()
+    mailer.MAIL_RETRY_BASE = 0.05
+
+    for label in ("legacy", "pooled"):
+        handler = CountingHandler(args.flaky)
+        port = free_port()
+        controller = Controller(handler, hostname="127.0.0.1", port=port)
+        controller.start()
+        try:
+            if label == "legacy":
+                elapsed = await run_legacy(port, args.messages, args.threads)
+                extra = ""
+            else:
+                elapsed, info = await run_pooled(port, args.messages, args.pool, args.messages, handler)
+                extra = f"  retried={info['retried']} send avg={info['mail.send']['avg_ms']}ms"
+        finally:
+            controller.stop()
+        print(f"{label:<7} delivered {handler.received}/{args.messages} in {elapsed:.2f}s "
+              f"({handler.received / elapsed:.0f} msg/s), smtp sessions {handler.sessions}{extra}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,72 @@
+# compares manager PIN verification cost: legacy scan over every manager hash vs the PinLookup index
+# run from AuthServices/: python -m benchmarks.bench_pin_verify --rounds 10
+import argparse
+import os
+import random
+import secrets
+import statistics
+import time
+import bcrypt
+# synthetic pins, a throwaway key per run unless one is set
+os.environ.setdefault("PIN_LOOKUP_KEY", secrets.token_hex(32))
+import hashing
+
+def build_managers(count, rounds):
+    managers = []
+    pins = random.sample(range(10000), count)
+    for i, pin in enumerate(pins):
+        pin = f"{pin:04d}"
+        hashed = bcrypt.hashpw(pin.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+        managers.append({"Username": f"manager{i}", "Pin": hashed, "PinLookup": hashing.pin_lookup(pin), "plain": pin})
+    return managers
+
+# old verify_manager_pin: check the pin against every manager until one matches
+def legacy_verify(managers, pin):
+    for m in managers:
+        if bcrypt.checkpw(pin.encode('utf-8'), m["Pin"].encode('utf-8')):
+            return m["Username"]
+    return None
+
+# new verify_manager_pin: index seek on PinLookup, then one slow hash (a dummy one on a miss)
+def indexed_verify(index, dummy_hash, pin):
+    m = index.get(hashing.pin_lookup(pin))
+    if m is None:
+        bcrypt.checkpw(pin.encode('utf-8'), dummy_hash)
+        return None
+    return m["Username"] if bcrypt.checkpw(pin.encode('utf-8'), m["Pin"].encode('utf-8')) else None
+
+def measure(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=4, help="bcrypt cost used for the fake manager pins")
+    parser.add_argument("--sizes", default="1,10,50,100,250,500")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    dummy_hash = bcrypt.hashpw(b"dummy", bcrypt.gensalt(args.rounds))
+    print(f"bcrypt rounds={args.rounds}, median of {args.repeat} runs (ms)")
+    print(f"{'managers':>9} {'legacy miss':>12} {'legacy hit':>11} {'indexed miss':>13} {'indexed hit':>12}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        managers = build_managers(size, args.rounds)
+        index = {}
+        for m in managers:
+            index.setdefault(m["PinLookup"], m)
+        used = {m["plain"] for m in managers}
+        wrong = next(f"{p:04d}" for p in range(10000) if f"{p:04d}" not in used)
+        last = managers[-1]["plain"]
+
+        legacy_miss = measure(lambda: legacy_verify(managers, wrong), args.repeat)
+        legacy_hit = measure(lambda: legacy_verify(managers, last), args.repeat)
+        indexed_miss = measure(lambda: indexed_verify(index, dummy_hash, wrong), args.repeat)
+        indexed_hit = measure(lambda: indexed_verify(index, dummy_hash, last), args.repeat)
+        print(f"{size:>9} {legacy_miss:>12.2f} {legacy_hit:>11.2f} {indexed_miss:>13.2f} {indexed_hit:>12.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# times the repository calls behind the hot handlers on the sqlite stand-in, with prepared cursors reused per
+# connection vs a fresh cursor per call, and prints each statement's sqlite query plan.
+# run from AuthServices/: python -m benchmarks.bench_repositories --users 20000 --repeat 2000
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+# one repository call per hot path, (name, sql it runs, call)
+def calls(rng: random.Random, users: int, pins: list[str]):
+    import hashing
+    from repositories import STATEMENTS, USER_LIST_COLUMNS, _page_sql
+    lookups = [hashing.pin_lookup(pin) for pin in pins]
+    return [
+        ("auth_rows", STATEMENTS["users.auth"], lambda repo: repo.auth_rows(f"user{rng.randrange(users)}")),
+        ("names", STATEMENTS["users.names"], lambda repo: repo.names(f"user{rng.randrange(users)}")),
+        ("username_taken", STATEMENTS["users.username_taken_in_system"], lambda repo: repo.username_taken(f"user{rng.randrange(users * 2)}", system="OOS")),
+        ("pin_candidates", STATEMENTS["users.pin_candidates"], lambda repo: repo.pin_candidates(rng.choice(lookups))),
+        ("rider", STATEMENTS["users.rider"], lambda repo: repo.rider(rng.randrange(1, users))),
+        ("riders_by_ids", STATEMENTS["users.riders_by_ids"], lambda repo: repo.riders_by_ids(rng.sample(range(1, users), 50))),
+        ("page", _page_sql(("role",), True, USER_LIST_COLUMNS), lambda repo: repo.page({"role": "rider"}, rng.randrange(users), 100)),
+    ]
+
+# stands in for the pooled connection without the per-connection statement cache
+class _Unprepared:
+    def __init__(self, conn):
+        self._conn = conn
+        self._cursor = None
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    async def prepared(self, sql):
+        if self._cursor is not None:
+            await self._cursor.close()
+        self._cursor = await self._conn.cursor()
+        return self._cursor
+
+async def measure(call, prepared: bool, repeat: int) -> list[float]:
+    import database
+    import repositories
+    samples = []
+    async with database.db_connection() as conn:
+        repo = repositories.UserRepository(conn if prepared else _Unprepared(conn))
+        for _ in range(repeat):
+            start = time.perf_counter()
+            await call(repo)
+            samples.append(time.perf_counter() - start)
+    return samples
+
+def explain(path: str, sql: str) -> list[str]:
+    import sqlite3
+    with sqlite3.connect(path) as db:
+        return [row[3] for row in db.execute(f"EXPLAIN QUERY PLAN {sql}", [None] * sql.count("?"))]
+
+async def run(args, path: str, pins: list[str]):
+    import database
+    rng = random.Random(args.seed)
+    await database.init_pool()
+    try:
+        print(f"{'call':<16}{'fresh p50':>12}{'prepared p50':>14}{'fresh p95':>12}{'prepared p95':>14}")
+        for name, sql, call in calls(rng, args.users, pins):
+            fresh = sorted(await measure(call, False, args.repeat))
+            prepared = sorted(await measure(call, True, args.repeat))
+            p95 = int(len(fresh) * 0.95)
+            print(
+                f"{name:<16}{statistics.median(fresh) * 1e6:>10.1f}us{statistics.median(prepared) * 1e6:>12.1f}us"
+                f"{fresh[p95] * 1e6:>10.1f}us{prepared[p95] * 1e6:>12.1f}us"
+            )
+            if args.plans:
+                for step in explain(path, sql):
+                    print(f"    {step}")
+    finally:
+        await database.close_pool()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--managers", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=2000, help="calls per measurement")
+    parser.add_argument("--no-plans", dest="plans", action="store_false", help="skip the EXPLAIN QUERY PLAN output")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="authsvc-repositories-") as workdir:
+        path = os.path.join(workdir, "bench.sqlite3")
+        # database.py and sqlite_backend.py read these at import
+        os.environ.update(DB_BACKEND="sqlite", SQLITE_PATH=path, DB_POOL_MIN_SIZE="1")
+        from benchmarks.loadtest import seed
+        print(f"seeding {args.users} users and {args.managers} managers")
+        pins = seed(path, args.users, args.managers, random.Random(args.seed), 4)
+        asyncio.run(run(args, path, pins))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# times search.SearchIndex on synthetic users: index build, memory, and query latency for selective, broad,
+# short, phone and filtered queries, plus single-user updates as the write endpoints make them.
+# run from AuthServices/: python -m benchmarks.bench_search --users 100000 --repeat 200
+import argparse
+import random
+import statistics
+import time
+import tracemalloc
+import search
+
+FIRST = ["Juan", "Maria", "Jose", "Ana", "Mark", "Angel", "John", "Grace", "Paolo", "Liza", "Carlo", "Bea", "Miguel", "Rosa"]
+LAST = ["Santos", "Reyes", "Cruz", "Bautista", "Garcia", "Mendoza", "Torres", "Flores", "Villanueva", "Ramos", "Aquino"]
+DOMAINS = ["gmail.com", "yahoo.com", "outlook.com", "example.com"]
+ROLES = [("user", "OOS")] * 90 + [("rider", "OOS")] * 6 + [("cashier", "POS")] * 3 + [("manager", "POS")]
+
+def make_rows(count: int, rng: random.Random) -> list[tuple]:
+    rows = []
+    for user_id in range(1, count + 1):
+        first, last = rng.choice(FIRST), rng.choice(LAST)
+        middle = rng.choice(LAST) if rng.random() < 0.5 else None
+        username = f"{first.lower()}{last.lower()}{user_id}"
+        role, system = rng.choice(ROLES)
+        rows.append((user_id, username, f"{username}@{rng.choice(DOMAINS)}", f"0917{rng.randrange(10**7):07d}",
+                     first, middle, last, None, role, system, rng.random() < 0.05))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=200, help="runs per query")
+    parser.add_argument("--limit", type=int, default=20, help="page size")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    rows = make_rows(args.users, rng)
+    index = search.index
+
+    start = time.perf_counter()
+    index._postings, index._records = search._build(rows)
+    index.loaded = True
+    print(f"build {args.users} users: {time.perf_counter() - start:.2f}s, {index.stats()['keys']} keys, "
+          f"{index.stats()['posting_bytes'] / 2**20:.1f} MiB of postings")
+    tracemalloc.start()
+    search._build(rows[: args.users // 10])
+    print(f"memory per 10k users while building: {tracemalloc.get_traced_memory()[1] / 2**20 / (args.users / 10 / 10000):.1f} MiB peak")
+    tracemalloc.stop()
+
+    target = rows[rng.randrange(len(rows))]
+    queries = [
+        ("exact username", target[1], {}),
+        ("name substring", "villanueva", {}),
+        ("full name", f"{target[4]} {target[6]}", {}),
+        ("email domain", "@outlook", {}),
+        ("phone digits", target[3][-6:], {}),
+        ("phone formatted", f"{target[3][:4]}-{target[3][4:7]}", {}),
+        ("two characters", "ma", {}),
+        ("one character", "j", {}),
+        ("broad + filters", "gmail", {"role": "rider", "system": "OOS"}),
+        ("no query, filter", "", {"role": "cashier"}),
+        ("no match", "zzqx", {}),
+        ("deep page", "santos", {}),
+    ]
+    print(f"{'query':<18}{'matches':>9}{'p50':>10}{'p95':>10}{'max':>10}")
+    for name, query, filters in queries:
+        offset = 1000 if name == "deep page" else 0
+        samples = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            total, page = index.search(query, filters, offset, args.limit)
+            samples.append(time.perf_counter() - start)
+        samples.sort()
+        print(f"{name:<18}{total:>9}{statistics.median(samples) * 1e3:>8.2f}ms{samples[int(len(samples) * 0.95)] * 1e3:>8.2f}ms{samples[-1] * 1e3:>8.2f}ms")
+
+    # a profile edit and a new signup, what refresh() applies per write
+    samples = []
+    for i in range(args.repeat):
+        row = list(rows[rng.randrange(len(rows))])
+        row[6] = rng.choice(LAST)
+        start = time.perf_counter()
+        index._apply({"rows": [row, (args.users + i + 1, *row[1:])], "gone": []})
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    print(f"{'update + insert':<18}{'':>9}{statistics.median(samples) * 1e3:>8.2f}ms{samples[int(len(samples) * 0.95)] * 1e3:>8.2f}ms{samples[-1] * 1e3:>8.2f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# compares list-users bodies: the old per-row dict with jsonable_encoder and stdlib json (what JSONResponse sent)
+# vs serialization.View projections encoded with orjson, full, compact and a two-key ?fields= list.
+# run from AuthServices/: python -m benchmarks.bench_serialization --rows 1000 --repeat 200
+import argparse
+import json
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from fastapi.encoders import jsonable_encoder
+import serialization
+from routers.users import USER_LIST_VIEW
+
+def make_users(count: int, rng: random.Random) -> list[dict]:
+    start = datetime(2024, 1, 1)
+    return [
+        {
+            "UserID": i, "Email": f"user{i}@example.com", "UserRole": rng.choice(("rider", "cashier", "user")),
+            "isDisabled": 0, "CreatedAt": start + timedelta(seconds=rng.randrange(10**7)), "System": rng.choice(("POS", "OOS")),
+            "Username": f"user{i}", "PhoneNumber": f"0917{i:07d}", "FirstName": "Load", "MiddleName": None,
+            "LastName": f"User{i}", "Suffix": None,
+        }
+        for i in range(1, count + 1)
+    ]
+
+# old list_users body, row order is the old SELECT list
+def legacy(rows: list[tuple]) -> bytes:
+    users_list = []
+    for u in rows:
+        name_parts = [u[8], u[9], u[10], u[11]]
+        users_list.append({
+            "userID": u[0], "fullName": ' '.join(part for part in name_parts if part), "userRole": u[2],
+            "phoneNumber": u[7], "id": u[0], "role": u[2], "phone": u[7], "firstName": u[8], "middleName": u[9],
+            "lastName": u[10], "suffix": u[11], "username": u[6], "email": u[1],
+            "createdAt": u[4].isoformat() if u[4] else None, "system": u[5], "isDisabled": bool(u[3]),
+        })
+    content = jsonable_encoder(users_list)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+def timed(encode, repeat: int) -> tuple[list[float], int]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = encode()
+        samples.append(time.perf_counter() - start)
+    return sorted(samples), len(body)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000, help="users per page")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    users = make_users(args.rows, random.Random(args.seed))
+    old_columns = ("UserID", "Email", "UserRole", "isDisabled", "CreatedAt", "System", "Username", "PhoneNumber",
+                   "FirstName", "MiddleName", "LastName", "Suffix")
+    legacy_rows = [tuple(u[c] for c in old_columns) for u in users]
+    cases = [("legacy", lambda: legacy(legacy_rows), len(old_columns))]
+    for name, fields, compact in (("full", None, False), ("compact", None, True), ("fields=userID,fullName", "userID,fullName", False)):
+        projection = USER_LIST_VIEW.project(fields, compact)
+        rows = [tuple(u[c] for c in projection.columns) for u in users]
+        cases.append((name, lambda rows=rows, projection=projection: serialization.dumps(projection.rows(rows)), len(projection.columns)))
+
+    print(f"{'encoding':<26}{'p50':>10}{'p95':>10}{'bytes':>10}{'columns':>9}")
+    for name, encode, columns in cases:
+        samples, size = timed(encode, args.repeat)
+        print(f"{name:<26}{statistics.median(samples) * 1e3:>8.2f}ms{samples[int(len(samples) * 0.95)] * 1e3:>8.2f}ms{size:>10}{columns:>9}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# compares /uploads serving: the plain StaticFiles mount vs static.UploadFiles
+# run from AuthServices/: python -m benchmarks.bench_uploads_static --requests 2000
+import argparse
+import asyncio
+import hashlib
+import io
+import os
+import tempfile
+import time
+import httpx
+from PIL import Image
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.staticfiles import StaticFiles
+import media
+from static import UploadFiles
+
+def build_uploads(root):
+    directory = os.path.join(root, "profile_pictures")
+    os.makedirs(directory)
+    buf = io.BytesIO()
+    Image.effect_noise((1200, 900), 64).convert("RGB").save(buf, "JPEG", quality=90)
+    data = buf.getvalue()
+    name = f"{hashlib.sha256(data).hexdigest()}.jpg"
+    with open(os.path.join(directory, name), "wb") as f:
+        f.write(data)
+    media._render_variants(directory, name, media.PROFILE_VARIANT_SIZES, media.VARIANT_FORMATS)
+    return name
+
+def make_app(static_cls, root):
+    return Starlette(routes=[Mount("/uploads", static_cls(directory=root))])
+
+async def run(app, url, headers, total, concurrency):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        first = await client.get(url, headers=headers)
+        queue = iter(range(total))
+        body_bytes = 0
+
+        async def worker():
+            nonlocal body_bytes
+            for _ in queue:
+                r = await client.get(url, headers=headers)
+                body_bytes += len(r.content)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return first, total / elapsed, body_bytes / total
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        name = build_uploads(root)
+        plain = make_app(StaticFiles, root)
+        tuned = make_app(UploadFiles, root)
+        avatar = f"/uploads/profile_pictures/{media.variant_name(name, 128, 'jpg')}"
+        original = f"/uploads/profile_pictures/{name}"
+
+        plain_etag = (await run(plain, avatar, {}, 1, 1))[0].headers["etag"]
+        tuned_etag = (await run(tuned, avatar, {}, 1, 1))[0].headers["etag"]
+        browser_accept = "image/avif,image/webp,image/apng,image/*,*/*;q=0.8"
+        scenarios = [
+            ("avatar 200", avatar, {"accept": browser_accept}, {"accept": browser_accept}),
+            ("avatar 304", avatar, {"if-none-match": plain_etag}, {"if-none-match": tuned_etag}),
+            ("original 200", original, {}, {}),
+            ("original range 64k", original, {"range": "bytes=0-65535"}, {"range": "bytes=0-65535"}),
+        ]
+
+        print(f"{args.requests} requests, concurrency {args.concurrency}, in-process ASGI")
+        print(f"{'scenario':<20} {'mount':<12} {'status':>6} {'req/s':>9} {'bytes/req':>10}  cache-control")
+        for label, url, plain_headers, tuned_headers in scenarios:
+            for mount, app, headers in (("StaticFiles", plain, plain_headers), ("UploadFiles", tuned, tuned_headers)):
+                first, rps, per_request = await run(app, url, headers, args.requests, args.concurrency)
+                print(f"{label:<20} {mount:<12} {first.status_code:>6} {rps:>9.0f} {per_request:>10.0f}  {first.headers.get('cache-control', '-')}")
+        print("with immutable caching a repeat page view sends no request at all for UploadFiles")
+
+if __name__ == "__main__":
+    asyncio.run(main())
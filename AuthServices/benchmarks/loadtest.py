@@ -0,0 +1,313 @@
+# replays a mix of logins, /auth/users/me, /users/verify-pin, roster polls and signups against the service
+# and reports p50/p95/p99 latency and requests per second per endpoint, saved as json for comparing versions.
+# by default it seeds a fresh sqlite stand-in (DB_BACKEND=sqlite) and starts uvicorn on it, --url targets a running service.
+# run from AuthServices/: python -m benchmarks.loadtest --concurrency 50 --duration 30 --out results/head.json
+#                         python -m benchmarks.loadtest --compare results/base.json results/head.json
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import secrets
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+import bcrypt
+import httpx
+# synthetic pins, a throwaway key per run unless one is set (loadtest's server inherits it)
+os.environ.setdefault("PIN_LOOKUP_KEY", secrets.token_hex(32))
+import hashing
+import sqlite_backend
+
+DEFAULT_MIX = "login=5,me=30,verify_pin=5,roster=55,signup=5"
+PASSWORD = "loadtest-password"
+ADMIN = ("superadmin", "superadmin123")
+
+def parse_mix(text: str) -> dict[str, int]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in OPERATIONS:
+            raise SystemExit(f"unknown operation {name!r}, expected one of {', '.join(OPERATIONS)}")
+        mix[name.strip()] = int(weight or 1)
+    return mix
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+# users for every operation in the mix, every password shares one hash so seeding stays fast at real cost
+def seed(path: str, users: int, managers: int, rng: random.Random, rounds: int) -> list[str]:
+    sqlite_backend.create_schema(path)
+    password_hash = bcrypt.hashpw(PASSWORD.encode("utf-8"), bcrypt.gensalt(rounds)).decode("utf-8")
+    now = datetime.utcnow()
+    rows = []
+    pins = [f"{pin:04d}" for pin in rng.sample(range(10000), managers)]
+    for i, pin in enumerate(pins):
+        pin_hash = bcrypt.hashpw(pin.encode("utf-8"), bcrypt.gensalt(rounds)).decode("utf-8")
+        rows.append((password_hash, f"manager{i}@example.com", "manager", now, "POS", f"manager{i}", "", "Load", "Manager", pin_hash, hashing.pin_lookup(pin)))
+    for i in range(users):
+        role, system = rng.choice((("rider", "OOS"), ("cashier", "POS"), ("staff", "IMS"), ("user", "OOS")))
+        rows.append((password_hash, f"user{i}@example.com", role, now, system, f"user{i}", f"0917{i:07d}", "Load", f"User{i}", None, None))
+    with sqlite_backend.sqlite3.connect(path) as db:
+        db.executemany(
+            "INSERT INTO Users (UserPassword, Email, UserRole, CreatedAt, System, Username, PhoneNumber, FirstName, LastName, Pin, PinLookup) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+    return pins
+
+class Recorder:
+    def __init__(self):
+        self.samples: dict[str, list[float]] = {}
+        self.statuses: dict[str, dict[int, int]] = {}
+        self.errors: dict[str, int] = {}
+        self.recording = False
+
+    def record(self, name: str, seconds: float, code: int | None):
+        if not self.recording:
+            return
+        self.samples.setdefault(name, []).append(seconds)
+        counts = self.statuses.setdefault(name, {})
+        counts[code] = counts.get(code, 0) + 1
+        if code is None or code >= 500:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+def percentile(ordered: list[float], pct: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(int(round(pct / 100 * len(ordered))) - 1, 0))]
+
+def summarize(samples: list[float], statuses: dict, errors: int, elapsed: float) -> dict:
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "errors": errors,
+        "rps": round(len(ordered) / elapsed, 2),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3) if ordered else 0.0,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3) if ordered else 0.0,
+        "status": {str(code): count for code, count in sorted(statuses.items(), key=lambda item: str(item[0]))},
+    }
+
+# one virtual client: a session token, its own roster etags and a private rng
+class Client:
+    def __init__(self, http: httpx.AsyncClient, recorder: Recorder, rng: random.Random, pins: list[str], users: int, index: int):
+        self.http = http
+        self.recorder = recorder
+        self.rng = rng
+        self.pins = pins
+        self.users = users
+        self.index = index
+        self.headers = {}
+        self.etags = {}
+        self.signups = 0
+
+    async def call(self, name: str, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await self.http.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.recorder.record(name, time.perf_counter() - start, None)
+            return None
+        self.recorder.record(name, time.perf_counter() - start, response.status_code)
+        return response
+
+    async def login(self):
+        username = f"user{self.rng.randrange(self.users)}" if self.users else ADMIN[0]
+        password = PASSWORD if self.users else ADMIN[1]
+        response = await self.call("login", "POST", "/auth/token", data={"username": username, "password": password})
+        if response is not None and response.status_code == 200:
+            self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def me(self):
+        if not self.headers:
+            await self.login()
+        await self.call("me", "GET", "/auth/users/me", headers=self.headers)
+
+    async def verify_pin(self):
+        if not self.headers:
+            await self.login()
+        # roughly one cashier in ten mistypes the pin
+        pin = self.rng.choice(self.pins) if self.pins and self.rng.random() > 0.1 else f"{self.rng.randrange(10000):04d}"
+        await self.call("verify_pin", "POST", "/users/verify-pin", json={"pin": pin}, headers=self.headers)
+
+    async def roster(self):
+        path = self.rng.choice(("/users/riders", "/users/cashiers"))
+        headers = {"If-None-Match": self.etags[path]} if path in self.etags else {}
+        response = await self.call("roster", "GET", path, headers=headers)
+        if response is not None and "etag" in response.headers:
+            self.etags[path] = response.headers["etag"]
+
+    async def signup(self):
+        self.signups += 1
+        name = f"lt{self.index}x{self.signups}x{self.rng.randrange(1 << 30):x}"
+        await self.call("signup", "POST", "/users/signup-oos", data={
+            "firstName": "Load", "lastName": "Signup", "username": name, "password": PASSWORD,
+            "email": f"{name}@example.com", "phoneNumber": "09170000000",
+        })
+
+OPERATIONS = {
+    "login": Client.login,
+    "me": Client.me,
+    "verify_pin": Client.verify_pin,
+    "roster": Client.roster,
+    "signup": Client.signup,
+}
+
+async def drive(url: str, args, pins: list[str], users: int):
+    mix = parse_mix(args.mix)
+    names, weights = list(mix), list(mix.values())
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=args.timeout) as http:
+        clients = [Client(http, recorder, random.Random(args.seed * 1000 + i), pins, users, i) for i in range(args.concurrency)]
+        # every client logs in once up front so the measured mix is not skewed towards bcrypt
+        await asyncio.gather(*(client.login() for client in clients))
+        stop_at = time.perf_counter() + args.warmup + args.duration
+
+        async def run(client: Client):
+            while time.perf_counter() < stop_at:
+                await OPERATIONS[client.rng.choices(names, weights)[0]](client)
+
+        tasks = [asyncio.create_task(run(client)) for client in clients]
+        await asyncio.sleep(args.warmup)
+        recorder.recording = True
+        start = time.perf_counter()
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+    endpoints = {
+        name: summarize(recorder.samples.get(name, []), recorder.statuses.get(name, {}), recorder.errors.get(name, 0), elapsed)
+        for name in names
+    }
+    overall = summarize(
+        [s for samples in recorder.samples.values() for s in samples],
+        {},
+        sum(recorder.errors.values()),
+        elapsed,
+    )
+    overall.pop("status")
+    return {"elapsed_s": round(elapsed, 3), "overall": overall, "endpoints": endpoints}
+
+async def wait_ready(url: str, process: subprocess.Popen | None, timeout: float = 60):
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient(base_url=url) as http:
+        while time.perf_counter() < deadline:
+            if process is not None and process.poll() is not None:
+                raise SystemExit(f"service exited with {process.returncode} before becoming ready")
+            try:
+                response = await http.get("/readyz")
+                # the superadmin is created right after readiness, logins need it when no users are seeded
+                if response.status_code == 200 and response.json()["steps_s"].get("admin_bootstrap") is not None:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise SystemExit(f"service at {url} not ready after {timeout}s")
+
+def print_report(result: dict):
+    print(f"{'endpoint':<12}{'count':>8}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, row in list(result["endpoints"].items()) + [("overall", result["overall"])]:
+        print(f"{name:<12}{row['count']:>8}{row['errors']:>8}{row['rps']:>10}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}")
+
+def compare(base_path: str, head_path: str):
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(head_path) as f:
+        head = json.load(f)
+    print(f"{base_path} ({base['meta'].get('revision')}) -> {head_path} ({head['meta'].get('revision')})")
+    print(f"{'endpoint':<12}" + "".join(f"{title:>30}" for title in ("rps", "p50 ms", "p95 ms", "p99 ms")))
+    rows = [(name, base["endpoints"].get(name), row) for name, row in head["endpoints"].items()]
+    rows.append(("overall", base["overall"], head["overall"]))
+    for name, old, new in rows:
+        if old is None:
+            continue
+        cells = []
+        for key in ("rps", "p50_ms", "p95_ms", "p99_ms"):
+            change = (new[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+            cells.append(f"{old[key]:>10} -> {new[key]:<10} {change:+5.0f}%")
+        print(f"{name:<12}" + "".join(cells))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", help="benchmark an already running service instead of starting one on sqlite")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=20, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=3, help="seconds run before measuring")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"operation weights, default {DEFAULT_MIX}")
+    parser.add_argument("--users", type=int, default=2000, help="seeded users (sqlite only)")
+    parser.add_argument("--managers", type=int, default=20, help="seeded POS managers with pins (sqlite only)")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12, help="cost of the seeded hashes (sqlite only)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--out", help="write the results here as json")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "HEAD"), help="print the difference between two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    rng = random.Random(args.seed)
+    process = None
+    workdir = tempfile.TemporaryDirectory(prefix="authsvc-loadtest-")
+    try:
+        if args.url:
+            url, pins, users = args.url.rstrip("/"), [], 0
+        else:
+            path = os.path.join(workdir.name, "loadtest.sqlite3")
+            print(f"seeding {args.users} users and {args.managers} managers at bcrypt cost {args.bcrypt_rounds}")
+            pins = seed(path, args.users, args.managers, rng, args.bcrypt_rounds)
+            users = args.users
+            port = free_port()
+            url = f"http://127.0.0.1:{port}"
+            env = dict(os.environ, DB_BACKEND="sqlite", SQLITE_PATH=path, JWT_KEYS_DIR=os.path.join(workdir.name, "keys"))
+            process = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+                env=env,
+            )
+        asyncio.run(wait_ready(url, process))
+        print(f"driving {url} with {args.concurrency} clients for {args.duration}s (+{args.warmup}s warmup), mix {args.mix}")
+        result = asyncio.run(drive(url, args, pins, users))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+        workdir.cleanup()
+
+    result["meta"] = {
+        "revision": git_revision(),
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "backend": "external" if args.url else "sqlite",
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "concurrency": args.concurrency,
+        "duration_s": args.duration,
+        "warmup_s": args.warmup,
+        "mix": parse_mix(args.mix),
+        "users": args.users if not args.url else None,
+        "bcrypt_rounds": args.bcrypt_rounds if not args.url else None,
+        "seed": args.seed,
+    }
+    print_report(result)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"saved {args.out}")
+
+if __name__ == "__main__":
+    main()
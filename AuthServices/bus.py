@@ -0,0 +1,180 @@
+import asyncio
+import json
+import logging
+import os
+import uuid
+import stats
+
+logger = logging.getLogger(__name__)
+
+# invalidation bus config, serve.py sets BUS_SOCKET for its workers, unset means a single process and local-only delivery
+BUS_SOCKET = os.getenv("BUS_SOCKET", "")
+BUS_RECONNECT_MAX = float(os.getenv("BUS_RECONNECT_MAX", 5))          # longest wait between reconnect attempts
+BUS_CLIENT_BUFFER = int(os.getenv("BUS_CLIENT_BUFFER", 1 << 20))      # bytes queued for a worker before the hub drops it
+
+# tie-breaker for versions stamped by this process
+WORKER_ID = uuid.uuid4().hex[:8]
+
+_handlers: dict[str, list] = {}
+_reconnect_handlers: list = []
+_writer = None
+_task = None
+_connected_once = False
+
+# messages are one json object per line: {"t": topic, "d": data, "o": origin, "r": retain key, "v": version}
+def _encode(message: dict) -> bytes:
+    return json.dumps(message, separators=(",", ":")).encode("utf-8") + b"\n"
+
+# run handler(data) for every message on this topic published by another worker
+def subscribe(topic: str, handler):
+    _handlers.setdefault(topic, []).append(handler)
+
+# run callback() after the link to the hub came back, whatever was published meanwhile is lost
+def on_reconnect(callback):
+    _reconnect_handlers.append(callback)
+
+# send to every other worker, retained messages are replayed to workers that join later, highest version per key wins
+def publish(topic: str, data, retain: str | None = None, version=None):
+    if _writer is None or _writer.is_closing():
+        if BUS_SOCKET:
+            stats.incr("bus.dropped")
+        return
+    message = {"t": topic, "d": data, "o": WORKER_ID}
+    if retain is not None:
+        message.update(r=retain, v=version)
+    _writer.write(_encode(message))
+    stats.incr("bus.published")
+
+def _dispatch(message: dict):
+    if message.get("o") == WORKER_ID:
+        return
+    for handler in _handlers.get(message.get("t"), ()):
+        try:
+            handler(message.get("d"))
+        except Exception as e:
+            logger.error(f"Bus handler for {message.get('t')} failed: {e}", exc_info=True)
+    stats.incr("bus.received")
+
+async def _run():
+    global _writer, _connected_once
+    delay = 0.1
+    while True:
+        try:
+            reader, writer = await asyncio.open_unix_connection(BUS_SOCKET)
+        except OSError as e:
+            logger.warning(f"Invalidation bus unreachable at {BUS_SOCKET}, retrying in {delay:.1f}s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, BUS_RECONNECT_MAX)
+            continue
+        delay = 0.1
+        _writer = writer
+        if _connected_once:
+            for callback in _reconnect_handlers:
+                try:
+                    callback()
+                except Exception as e:
+                    logger.error(f"Bus reconnect callback failed: {e}", exc_info=True)
+        _connected_once = True
+        try:
+            while line := await reader.readline():
+                _dispatch(json.loads(line))
+        except (ConnectionError, ValueError) as e:
+            logger.warning(f"Invalidation bus connection lost: {e}")
+        finally:
+            _writer = None
+            writer.close()
+        await asyncio.sleep(delay)
+
+# called from the lifespan, connects in the background
+def start():
+    global _task
+    if BUS_SOCKET and _task is None:
+        _task = asyncio.create_task(_run())
+
+async def stop():
+    global _task, _writer
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+    if _writer is not None:
+        _writer.close()
+        _writer = None
+
+def connected() -> bool:
+    return _writer is not None and not _writer.is_closing()
+
+async def wait_connected():
+    while not connected():
+        await asyncio.sleep(0.05)
+
+def bus_stats():
+    info = {"socket": BUS_SOCKET or None, "worker_id": WORKER_ID, "connected": connected()}
+    info.update({name: count for name, count in stats.counters().items() if name.startswith("bus.")})
+    return info
+
+# hub side, runs in the serve.py master: fans every line out to the other workers and keeps retained messages
+class Hub:
+    def __init__(self, path: str, on_message=None):
+        self.path = path
+        self.on_message = on_message
+        self._clients: set[asyncio.StreamWriter] = set()
+        self._retained: dict[str, dict] = {}
+        self._server = None
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._serve, path=self.path)
+        os.chmod(self.path, 0o600)
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._clients):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def _send(self, writer: asyncio.StreamWriter, data: bytes):
+        # a worker that stopped reading is cut off, it reconnects and gets the retained state again
+        if writer.transport.get_write_buffer_size() > BUS_CLIENT_BUFFER:
+            logger.warning("Dropping a bus client that is not keeping up")
+            writer.close()
+            self._clients.discard(writer)
+            return
+        writer.write(data)
+
+    def _retain(self, message: dict):
+        current = self._retained.get(message["r"])
+        if current is not None and message.get("v") is not None and current.get("v") is not None and message["v"] <= current["v"]:
+            return
+        self._retained[message["r"]] = message
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        for message in list(self._retained.values()):
+            self._send(writer, _encode(message))
+        self._clients.add(writer)
+        try:
+            while line := await reader.readline():
+                message = json.loads(line)
+                if message.get("r") is not None:
+                    self._retain(message)
+                if self.on_message is not None:
+                    self.on_message(message)
+                for client in list(self._clients):
+                    if client is not writer:
+                        self._send(client, line)
+        except (ConnectionError, ValueError) as e:
+            logger.warning(f"Bus client dropped: {e}")
+        finally:
+            self._clients.discard(writer)
+            writer.close()
+
+    def stats(self):
+        return {"clients": len(self._clients), "retained": len(self._retained)}
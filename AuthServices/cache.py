@@ -0,0 +1,59 @@
+import time
+from collections import OrderedDict
+import bus
+
+# size-bounded LRU cache whose entries also expire after ttl seconds
+# with shared_as set, invalidations reach the same cache in every other worker over the bus
+class TTLCache:
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0, shared_as: str | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._topic = f"cache.{shared_as}" if shared_as else None
+        if self._topic:
+            bus.subscribe(self._topic, self._drop)
+            # invalidations sent while the link was down are lost, start over
+            bus.on_reconnect(self.clear)
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is not None:
+            expires, value = entry
+            if time.monotonic() < expires:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+        self.misses += 1
+        return None
+
+    def set(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def _drop(self, keys):
+        for key in keys:
+            self._data.pop(key, None)
+
+    def invalidate(self, *keys):
+        self._drop(keys)
+        if self._topic:
+            bus.publish(self._topic, [key for key in keys if key is not None])
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
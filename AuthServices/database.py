@@ -1,4 +1,15 @@
-import aioodbc
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+import stats
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
 
 # database config
 server = 'DESKTOP-TVGCI2U\\SQLEXPRESS'
@@ -7,14 +18,214 @@ username = 'Ranjel'
 password = 'rnjl27'
 driver = 'ODBC Driver 17 for SQL Server'
 
-# async function to get db connection
-async def get_db_connection():
-    dsn = (
+# backend, "sqlite" swaps sql server for the local stand-in in sqlite_backend.py (benchmarks, local runs)
+DB_BACKEND = os.getenv("DB_BACKEND", "mssql").lower()
+
+# pool config
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 2))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 20))
+POOL_ACQUIRE_TIMEOUT = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", 10))
+POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", 1800))   # seconds a connection may live
+POOL_MAX_IDLE = int(os.getenv("DB_POOL_MAX_IDLE", 300))              # idle connections are recycled after this
+POOL_HEALTHCHECK_IDLE = float(os.getenv("DB_POOL_HEALTHCHECK_IDLE", 30))  # ping connections idle longer than this
+STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 64))    # prepared cursors kept per pooled connection
+
+_pool = None
+
+def _dsn():
+    return (
         f"DRIVER={{{driver}}};"
         f"SERVER={server};"
         f"DATABASE={database};"
         f"UID={username};"
         f"PWD={password};"
     )
-    conn = await aioodbc.connect(dsn=dsn, autocommit=True)
-    return conn
\ No newline at end of file
+
+# create the pool, called from the app lifespan
+async def init_pool():
+    global _pool
+    if _pool is not None:
+        return _pool
+    start = time.perf_counter()
+    with stats.timed("db.connect"):
+        if DB_BACKEND == "sqlite":
+            import sqlite_backend
+            _pool = await sqlite_backend.create_pool(minsize=POOL_MIN_SIZE, maxsize=POOL_MAX_SIZE)
+        else:
+            # imported here so the sqlite backend runs on machines without unixodbc
+            import aioodbc
+            _pool = await aioodbc.create_pool(
+                dsn=_dsn(),
+                minsize=POOL_MIN_SIZE,
+                maxsize=POOL_MAX_SIZE,
+                pool_recycle=POOL_MAX_IDLE,
+                autocommit=True,
+            )
+    logger.info(f"DB pool ready ({POOL_MIN_SIZE}-{POOL_MAX_SIZE}) in {time.perf_counter() - start:.3f}s")
+    return _pool
+
+# close the pool, called from the app lifespan
+async def close_pool():
+    global _pool
+    if _pool is None:
+        return
+    pool, _pool = _pool, None
+    pool.close()
+    await pool.wait_closed()
+
+# cursor wrapper timing every statement into db.query, everything else goes to the aioodbc cursor
+class _TimedCursor:
+    __slots__ = ("_cursor",)
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    async def execute(self, sql, *params):
+        with stats.timed("db.query"):
+            return await self._cursor.execute(sql, *params)
+
+    # fast sends the whole parameter array in one round trip. the flag lives on the pyodbc cursor, which aioodbc
+    # keeps in _impl with no public accessor, so this is the only place that reaches for it
+    async def executemany(self, sql, rows, fast: bool = False):
+        raw = getattr(self._cursor, "_impl", None)
+        if raw is not None:
+            raw.fast_executemany = fast
+        with stats.timed("db.query"):
+            return await self._cursor.executemany(sql, rows)
+
+class _TimedCursorContext:
+    __slots__ = ("_ctx",)
+
+    def __init__(self, ctx):
+        self._ctx = ctx
+
+    async def _open(self):
+        return _TimedCursor(await self._ctx)
+
+    def __await__(self):
+        return self._open().__await__()
+
+    async def __aenter__(self):
+        return _TimedCursor(await self._ctx.__aenter__())
+
+    async def __aexit__(self, *exc):
+        return await self._ctx.__aexit__(*exc)
+
+# what db_connection hands out: the pooled connection with timed cursors
+class _TimedConnection:
+    __slots__ = ("_conn",)
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self):
+        return _TimedCursorContext(self._conn.cursor())
+
+    # a cursor kept open on this connection for one statement text, pyodbc skips SQLPrepare when a cursor
+    # runs the same sql string again, the least recently used one is closed past STATEMENT_CACHE_SIZE
+    async def prepared(self, sql: str):
+        cache = getattr(self._conn, "_prepared", None)
+        if cache is None:
+            cache = self._conn._prepared = OrderedDict()
+        cursor = cache.get(sql)
+        if cursor is None:
+            cursor = cache[sql] = await self._conn.cursor()
+            stats.incr("db.statement.prepared")
+            if len(cache) > STATEMENT_CACHE_SIZE:
+                _, evicted = cache.popitem(last=False)
+                await evicted.close()
+        else:
+            cache.move_to_end(sql)
+            stats.incr("db.statement.reused")
+        return _TimedCursor(cursor)
+
+    # pooled connections autocommit, statements that must land together run inside this. an exception rolls
+    # every one of them back
+    @asynccontextmanager
+    async def transaction(self):
+        await self._run("BEGIN TRANSACTION")
+        try:
+            yield self
+        except BaseException:
+            await self._run("ROLLBACK")
+            raise
+        await self._run("COMMIT")
+
+    async def _run(self, sql: str):
+        await (await self.prepared(sql)).execute(sql)
+
+async def _discard(pool, conn):
+    try:
+        await conn.close()
+    except Exception as e:
+        logger.warning(f"Error closing pooled connection: {e}")
+    await pool.release(conn)
+
+# true if the connection should be replaced before use
+async def _is_stale(conn):
+    # kept on the connection like its prepared cursors, so it goes away with it
+    now = time.monotonic()
+    born = getattr(conn, "_born", None)
+    if born is None:
+        born = conn._born = now
+    if now - born > POOL_MAX_LIFETIME:
+        return True
+    if conn.loop.time() - conn.last_usage > POOL_HEALTHCHECK_IDLE:
+        try:
+            async with conn.cursor() as cursor:
+                await cursor.execute("SELECT 1")
+                await cursor.fetchone()
+        except Exception as e:
+            logger.warning(f"Pooled connection failed health check: {e}")
+            return True
+    return False
+
+async def _acquire():
+    if _pool is None:
+        await init_pool()
+    pool = _pool
+    start = time.perf_counter()
+    while True:
+        try:
+            conn = await asyncio.wait_for(pool.acquire(), timeout=POOL_ACQUIRE_TIMEOUT)
+        except asyncio.TimeoutError:
+            stats.timing("db.pool.timeout").observe(time.perf_counter() - start)
+            raise
+        if await _is_stale(conn):
+            await _discard(pool, conn)
+            continue
+        stats.timing("db.pool.wait").observe(time.perf_counter() - start)
+        return pool, conn
+
+# async context manager handing out a pooled connection
+@asynccontextmanager
+async def db_connection():
+    pool, conn = await _acquire()
+    checked_out = time.perf_counter()
+    try:
+        yield _TimedConnection(conn)
+    finally:
+        stats.timing("db.pool.checkout").observe(time.perf_counter() - checked_out)
+        await pool.release(conn)
+
+# fastapi dependency version of db_connection
+async def get_db():
+    async with db_connection() as conn:
+        yield conn
+
+# pool sizing info
+def pool_stats():
+    info = {
+        "min_size": POOL_MIN_SIZE,
+        "max_size": POOL_MAX_SIZE,
+        "size": _pool.size if _pool else 0,
+        "free": _pool.freesize if _pool else 0,
+    }
+    info.update(stats.snapshot("db.pool."))
+    return info
@@ -0,0 +1,236 @@
+import asyncio
+import hashlib
+import hmac
+import logging
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import NamedTuple
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+import stats
+
+logger = logging.getLogger(__name__)
+
+# hashing pool config
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", os.cpu_count() or 2))
+HASH_MAX_QUEUE = int(os.getenv("HASH_MAX_QUEUE", 64))  # pending hash/verify jobs before we shed load
+PIN_LOOKUP_KEY = os.getenv("PIN_LOOKUP_KEY", "")  # required secret, hmac key of Users.PinLookup
+PIN_LOOKUP_KEY_MIN_LENGTH = 32
+
+# hashing policy config
+HASH_SCHEME = os.getenv("HASH_SCHEME", "bcrypt")                          # scheme for new hashes: bcrypt or argon2 (needs argon2-cffi)
+HASH_TARGET_MS = float(os.getenv("HASH_TARGET_MS", 250))                   # calibration picks the highest cost that hashes within this
+HASH_CALIBRATE = os.getenv("HASH_CALIBRATE", "true").lower() == "true"     # false keeps the configured costs as they are
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))                        # used until calibration finishes
+BCRYPT_MIN_ROUNDS = int(os.getenv("BCRYPT_MIN_ROUNDS", 10))                # calibration never goes outside these
+BCRYPT_MAX_ROUNDS = int(os.getenv("BCRYPT_MAX_ROUNDS", 15))
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", 3))                   # passes, calibrated like bcrypt rounds
+ARGON2_MAX_TIME_COST = int(os.getenv("ARGON2_MAX_TIME_COST", 10))
+ARGON2_MEMORY_KB = int(os.getenv("ARGON2_MEMORY_KB", 65536))               # fixed, pick it for the memory each worker may use
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", 1))              # lanes per hash, the pool already runs one hash per core
+
+# parameters for new hashes, sent along with every job so spawned workers need no shared state
+class HashPolicy(NamedTuple):
+    scheme: str
+    bcrypt_rounds: int
+    argon2_time_cost: int
+    argon2_memory_kb: int
+    argon2_parallelism: int
+
+if HASH_SCHEME not in ("bcrypt", "argon2"):
+    raise ValueError(f"HASH_SCHEME must be bcrypt or argon2, not {HASH_SCHEME!r}")
+
+_policy = HashPolicy(HASH_SCHEME, BCRYPT_ROUNDS, ARGON2_TIME_COST, ARGON2_MEMORY_KB, ARGON2_PARALLELISM)
+_calibration: dict = {}
+
+# both schemes stay verifiable, hashes of the other scheme, below the policy's cost or above the ceiling report needs_update
+@lru_cache(maxsize=8)
+def _context(policy: HashPolicy) -> CryptContext:
+    return CryptContext(
+        schemes=["bcrypt", "argon2"],
+        default=policy.scheme,
+        deprecated="auto",
+        bcrypt__rounds=policy.bcrypt_rounds,
+        bcrypt__min_rounds=policy.bcrypt_rounds,
+        bcrypt__max_rounds=max(BCRYPT_MAX_ROUNDS, policy.bcrypt_rounds),
+        argon2__rounds=policy.argon2_time_cost,
+        argon2__min_rounds=policy.argon2_time_cost,
+        argon2__max_rounds=max(ARGON2_MAX_TIME_COST, policy.argon2_time_cost),
+        argon2__memory_cost=policy.argon2_memory_kb,
+        argon2__parallelism=policy.argon2_parallelism,
+    )
+
+# cheap cost-4 hash used to load the bcrypt backend in each worker at boot
+_WARM_HASH = "$2b$04$cKsI9gKUeX6sjwM32Z7.VOz7lhRdSvNBZ6Vu8Fvs7/0Q9bm5LkfPC"
+
+_executor = None
+_pending = 0
+_dummy_hash = None
+
+# raised when too many hash jobs are already waiting
+class HashQueueFull(HTTPException):
+    def __init__(self):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, please try again shortly.",
+            headers={"Retry-After": "1"}
+        )
+
+# worker side, runs in the process pool
+def _hash(secret: str, policy: HashPolicy):
+    return _context(policy).hash(secret)
+
+def _verify(secret: str, hashed: str, policy: HashPolicy):
+    return _context(policy).verify(secret, hashed)
+
+def _time_hash(policy: HashPolicy) -> float:
+    start = time.perf_counter()
+    _context(policy).hash(os.urandom(16).hex())
+    return time.perf_counter() - start
+
+def start():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+# spawn every worker and load its bcrypt backend so the first logins do not pay for it
+async def warm():
+    loop = asyncio.get_running_loop()
+    executor = start()
+    await asyncio.gather(*(loop.run_in_executor(executor, _verify, "warmup", _WARM_HASH, _policy) for _ in range(HASH_WORKERS)))
+
+# fastest of a few hashes on a worker, in seconds
+async def _measure(policy: HashPolicy, samples: int = 3) -> float:
+    loop = asyncio.get_running_loop()
+    return min([await loop.run_in_executor(start(), _time_hash, policy) for _ in range(samples)])
+
+# pick the highest cost whose hash fits in HASH_TARGET_MS on this machine, one cost step doubles bcrypt and adds a pass to argon2
+async def calibrate() -> HashPolicy:
+    global _policy, _dummy_hash
+    if not HASH_CALIBRATE:
+        return _policy
+    target = HASH_TARGET_MS / 1000
+    started = time.perf_counter()
+    if _policy.scheme == "argon2":
+        probe = _policy._replace(argon2_time_cost=1)
+        per_pass = await _measure(probe)
+        cost = max(1, min(int(target / per_pass), ARGON2_MAX_TIME_COST))
+        policy = _policy._replace(argon2_time_cost=cost)
+    else:
+        probe = _policy._replace(bcrypt_rounds=BCRYPT_MIN_ROUNDS)
+        elapsed = await _measure(probe)
+        cost = BCRYPT_MIN_ROUNDS + max(int(math.floor(math.log2(target / elapsed))), 0)
+        cost = min(max(cost, BCRYPT_MIN_ROUNDS), BCRYPT_MAX_ROUNDS)
+        policy = _policy._replace(bcrypt_rounds=cost)
+    # confirm the extrapolation, one step down if it overshot
+    measured = await _measure(policy, samples=2)
+    if measured > target:
+        if policy.scheme == "argon2" and policy.argon2_time_cost > 1:
+            policy = policy._replace(argon2_time_cost=policy.argon2_time_cost - 1)
+            measured = await _measure(policy, samples=2)
+        elif policy.scheme != "argon2" and policy.bcrypt_rounds > BCRYPT_MIN_ROUNDS:
+            policy = policy._replace(bcrypt_rounds=policy.bcrypt_rounds - 1)
+            measured = await _measure(policy, samples=2)
+    if policy != _policy:
+        _policy = policy
+        _dummy_hash = None
+    _calibration.update({
+        "target_ms": HASH_TARGET_MS,
+        "measured_ms": round(measured * 1000, 1),
+        "took_s": round(time.perf_counter() - started, 3),
+    })
+    logger.info(f"Hash policy calibrated: {describe_policy(policy)} (~{_calibration['measured_ms']}ms per hash, target {HASH_TARGET_MS}ms)")
+    return policy
+
+def policy() -> HashPolicy:
+    return _policy
+
+def describe_policy(policy: HashPolicy) -> str:
+    if policy.scheme == "argon2":
+        return f"argon2 t={policy.argon2_time_cost} m={policy.argon2_memory_kb} p={policy.argon2_parallelism}"
+    return f"bcrypt rounds={policy.bcrypt_rounds}"
+
+# true when a hash is of another scheme or cheaper than the current policy, checked in-process without hashing
+def needs_update(hashed: str) -> bool:
+    try:
+        return _context(_policy).needs_update(hashed)
+    except ValueError:
+        return False
+
+# (algorithm, cost) read from a hash string, stored per user as PasswordAlgorithm / PasswordCost
+def describe(hashed: str) -> tuple[str | None, str | None]:
+    if hashed.startswith("$argon2"):
+        parts = hashed.split("$")
+        return parts[1], parts[3] if len(parts) > 3 else None
+    if hashed.startswith("$2") and len(hashed) > 6:
+        return "bcrypt", f"rounds={int(hashed[4:6])}"
+    return None, None
+
+async def _run(op: str, func, *args):
+    global _pending
+    if _pending >= HASH_MAX_QUEUE:
+        stats.timing(f"hash.{op}.rejected").observe(0.0)
+        raise HashQueueFull()
+    _pending += 1
+    try:
+        with stats.timed(f"hash.{op}"):
+            return await asyncio.get_running_loop().run_in_executor(start(), func, *args)
+    finally:
+        _pending -= 1
+
+# hash a password or pin off the event loop
+async def hash_password(secret: str) -> str:
+    return await _run("hash", _hash, secret, _policy)
+
+# verify a password or pin off the event loop, raises ValueError on a malformed hash
+async def verify_password(secret: str, hashed: str) -> bool:
+    return await _run("verify", _verify, secret, hashed, _policy)
+
+# hash many secrets in parallel, keeping at most HASH_WORKERS jobs in flight so other requests still get queue room
+async def hash_many(secrets: list[str]) -> list[str]:
+    sem = asyncio.Semaphore(HASH_WORKERS)
+
+    async def one(secret):
+        async with sem:
+            return await hash_password(secret)
+
+    return await asyncio.gather(*(one(secret) for secret in secrets))
+
+# burn one verify against a throwaway hash so failed checks cost the same as a hit
+async def dummy_verify(secret: str):
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = await hash_password(os.urandom(16).hex())
+    await verify_password(secret, _dummy_hash)
+
+# a pin has 10,000 values, anyone holding the key reverses every PinLookup by trying them all.
+# there is no default key, the service refuses to start without one
+def check_pin_lookup_key():
+    if len(PIN_LOOKUP_KEY) < PIN_LOOKUP_KEY_MIN_LENGTH:
+        raise RuntimeError(
+            f"PIN_LOOKUP_KEY must be set to a secret of at least {PIN_LOOKUP_KEY_MIN_LENGTH} characters, "
+            "e.g. python -c \"import secrets; print(secrets.token_hex(32))\""
+        )
+
+# keyed, indexable digest of a pin so the owning manager can be found without scanning hashes
+def pin_lookup(pin: str) -> str:
+    check_pin_lookup_key()
+    return hmac.new(PIN_LOOKUP_KEY.encode('utf-8'), pin.encode('utf-8'), hashlib.sha256).hexdigest()
+
+def hash_stats():
+    info = {"workers": HASH_WORKERS, "max_queue": HASH_MAX_QUEUE, "pending": _pending, "policy": describe_policy(_policy)}
+    if _calibration:
+        info["calibration"] = dict(_calibration)
+    info.update(stats.snapshot("hash."))
+    return info
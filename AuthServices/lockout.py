@@ -0,0 +1,212 @@
+import asyncio
+import logging
+import os
+from collections import deque
+from datetime import datetime, timedelta
+from database import db_connection
+from repositories import LockoutRepository
+import bus
+import stats
+
+logger = logging.getLogger(__name__)
+
+# lockout config
+LOCKOUT_THRESHOLD = int(os.getenv("LOCKOUT_THRESHOLD", 5))                 # failures before an account locks
+LOCKOUT_MINUTES = int(os.getenv("LOCKOUT_MINUTES", 15))
+LOCKOUT_WINDOW_SECONDS = int(os.getenv("LOCKOUT_WINDOW_SECONDS", 900))     # failures older than this stop counting
+IP_MAX_FAILURES = int(os.getenv("LOGIN_IP_MAX_FAILURES", 30))             # failures per client ip before throttling
+IP_WINDOW_SECONDS = int(os.getenv("LOGIN_IP_WINDOW_SECONDS", 300))
+FLUSH_INTERVAL = float(os.getenv("LOCKOUT_FLUSH_INTERVAL", 2))            # seconds between FailedLogins write-behind batches
+
+class _UserState:
+    __slots__ = ("failures", "locked_until", "last_attempt")
+
+    def __init__(self):
+        self.failures = deque()
+        self.locked_until = None
+        self.last_attempt = None
+
+# sliding-window failure counters per username and per client ip, persisted to FailedLogins in batches
+class LockoutEngine:
+    def __init__(self):
+        self._users: dict[str, _UserState] = {}
+        self._ips: dict[str, deque] = {}
+        self._dirty: set[str] = set()
+        self._task = None
+        self.lockouts = 0
+        self.throttled = 0
+        # every worker counts every failure, only the worker that saw it writes it to FailedLogins
+        bus.subscribe("lockout.failure", lambda data: self._failure(data[0], data[1], datetime.fromisoformat(data[2])))
+        bus.subscribe("lockout.success", lambda username: self._success(username))
+
+    def _trim(self, failures: deque, now: datetime, window: int):
+        cutoff = now - timedelta(seconds=window)
+        while failures and failures[0] < cutoff:
+            failures.popleft()
+
+    def _state(self, username: str) -> _UserState:
+        state = self._users.get(username)
+        if state is None:
+            state = self._users[username] = _UserState()
+        return state
+
+    # rebuild state from FailedLogins on startup
+    async def load(self):
+        async with db_connection() as conn:
+            rows = await LockoutRepository(conn).load()
+        now = datetime.utcnow()
+        for username, attempts, last_attempt, is_locked, lockout_until in rows:
+            state = self._state(username)
+            state.last_attempt = last_attempt
+            state.failures = deque([last_attempt or now] * (attempts or 0))
+            if is_locked and lockout_until:
+                state.locked_until = lockout_until
+        logger.info(f"Lockout state loaded for {len(rows)} usernames")
+
+    # same contract as the old check_lockout: (is_locked, attempts, remaining_seconds)
+    def check(self, username: str):
+        state = self._users.get(username)
+        if state is None:
+            return False, 0, None
+        now = datetime.utcnow()
+        if state.locked_until:
+            if now < state.locked_until:
+                return True, len(state.failures), (state.locked_until - now).total_seconds()
+            # unlock after lockout period
+            state.locked_until = None
+            stats.incr("lockout.expired")
+            state.failures.clear()
+            self._dirty.add(username)
+            return False, 0, None
+        self._trim(state.failures, now, LOCKOUT_WINDOW_SECONDS)
+        return False, len(state.failures), None
+
+    def status(self, username: str):
+        state = self._users.get(username)
+        if state is None:
+            return {"failed_attempts": 0, "is_locked": False, "remaining_seconds": 0}
+        now = datetime.utcnow()
+        remaining = int((state.locked_until - now).total_seconds()) if state.locked_until else 0
+        return {"failed_attempts": len(state.failures), "is_locked": state.locked_until is not None, "remaining_seconds": max(remaining, 0)}
+
+    # seconds until this ip may try again, 0 when it is not throttled
+    def ip_retry_after(self, ip: str):
+        failures = self._ips.get(ip)
+        if not failures:
+            return 0
+        now = datetime.utcnow()
+        self._trim(failures, now, IP_WINDOW_SECONDS)
+        if len(failures) < IP_MAX_FAILURES:
+            return 0
+        self.throttled += 1
+        stats.incr("lockout.throttled")
+        return max(int((failures[0] + timedelta(seconds=IP_WINDOW_SECONDS) - now).total_seconds()), 1)
+
+    # returns True when this failure locked the account
+    def _failure(self, username: str, ip: str | None, now: datetime):
+        if ip:
+            self._ips.setdefault(ip, deque()).append(now)
+        state = self._state(username)
+        self._trim(state.failures, now, LOCKOUT_WINDOW_SECONDS)
+        state.failures.append(now)
+        state.last_attempt = now
+        if len(state.failures) >= LOCKOUT_THRESHOLD and not state.locked_until:
+            state.locked_until = now + timedelta(minutes=LOCKOUT_MINUTES)
+            return True
+        return False
+
+    # returns True when there was anything to reset
+    def _success(self, username: str):
+        state = self._users.get(username)
+        if state is not None and (state.failures or state.locked_until):
+            state.failures.clear()
+            state.locked_until = None
+            return True
+        return False
+
+    # returns True when this failure locked the account
+    def record_failure(self, username: str, ip: str | None = None):
+        now = datetime.utcnow()
+        locked = self._failure(username, ip, now)
+        self._dirty.add(username)
+        stats.incr("lockout.failures")
+        bus.publish("lockout.failure", [username, ip, now.isoformat()])
+        if locked:
+            self.lockouts += 1
+            stats.incr("lockout.lockouts")
+        return locked
+
+    def record_success(self, username: str):
+        if self._success(username):
+            self._dirty.add(username)
+            stats.incr("lockout.resets")
+            bus.publish("lockout.success", username)
+
+    # write every changed username to FailedLogins in one batched statement
+    async def flush(self):
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, set()
+        rows = []
+        for username in dirty:
+            state = self._users.get(username)
+            if state is None:
+                continue
+            rows.append((username, len(state.failures), state.last_attempt, 1 if state.locked_until else 0, state.locked_until))
+        try:
+            with stats.timed("lockout.flush"):
+                async with db_connection() as conn:
+                    if rows:
+                        # an upsert, another worker may already have written the row
+                        await LockoutRepository(conn).upsert_many(rows)
+                    await conn.commit()
+        except Exception as e:
+            logger.error(f"Failed to flush lockout state: {e}", exc_info=True)
+            self._dirty |= dirty
+            return
+        self._prune()
+
+    # drop clean, unlocked entries with nothing left in their window, FailedLogins still has their last row
+    def _prune(self):
+        now = datetime.utcnow()
+        for username in [u for u, s in self._users.items() if u not in self._dirty and not s.locked_until]:
+            state = self._users[username]
+            self._trim(state.failures, now, LOCKOUT_WINDOW_SECONDS)
+            if not state.failures:
+                del self._users[username]
+        for ip in list(self._ips):
+            self._trim(self._ips[ip], now, IP_WINDOW_SECONDS)
+            if not self._ips[ip]:
+                del self._ips[ip]
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self):
+        info = {
+            "tracked_usernames": len(self._users),
+            "tracked_ips": len(self._ips),
+            "pending_writes": len(self._dirty),
+            "lockouts": self.lockouts,
+            "throttled": self.throttled,
+        }
+        info.update(stats.snapshot("lockout."))
+        return info
+
+engine = LockoutEngine()
@@ -0,0 +1,200 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from email.message import EmailMessage
+import aiosmtplib
+from dotenv import load_dotenv
+import stats
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# mail dispatch config
+MAIL_POOL_SIZE = int(os.getenv("MAIL_POOL_SIZE", 2))                  # persistent smtp connections / sender tasks
+MAIL_QUEUE_SIZE = int(os.getenv("MAIL_QUEUE_SIZE", 1000))             # queued messages before new ones are dropped
+MAIL_MAX_ATTEMPTS = int(os.getenv("MAIL_MAX_ATTEMPTS", 5))
+MAIL_RETRY_BASE = float(os.getenv("MAIL_RETRY_BASE", 1))              # seconds, doubled per attempt with jitter
+MAIL_RETRY_MAX = float(os.getenv("MAIL_RETRY_MAX", 60))
+MAIL_IDLE_SECONDS = float(os.getenv("MAIL_IDLE_SECONDS", 60))         # idle connections are closed after this
+MAIL_DRAIN_SECONDS = float(os.getenv("MAIL_DRAIN_SECONDS", 5))        # time given to the queue on shutdown
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", 10))
+
+class _Job:
+    __slots__ = ("message", "attempts", "queued_at")
+
+    def __init__(self, message: EmailMessage):
+        self.message = message
+        self.attempts = 0
+        self.queued_at = time.perf_counter()
+
+# 5xx replies and refused recipients will fail the same way again
+def _permanent(error: Exception) -> bool:
+    if isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+        return True
+    code = getattr(error, "code", None)
+    return isinstance(code, int) and 500 <= code < 600
+
+# bounded queue drained by a few sender tasks, each holding one persistent smtp connection
+class MailDispatcher:
+    def __init__(self, hostname=None, port=None, username=None, password=None, start_tls=None,
+                 pool_size=MAIL_POOL_SIZE, queue_size=MAIL_QUEUE_SIZE):
+        self.hostname = hostname or os.getenv("SMTP_SERVER")
+        self.port = port or int(os.getenv("SMTP_PORT", 587))
+        self.username = username if username is not None else os.getenv("SMTP_USERNAME")
+        self.password = password if password is not None else os.getenv("SMTP_PASSWORD")
+        self.start_tls = start_tls if start_tls is not None else os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+        self.pool_size = pool_size
+        self._queue: asyncio.Queue | None = None
+        self._queue_size = queue_size
+        self._workers: list[asyncio.Task] = []
+        self._retries: set[asyncio.TimerHandle] = set()
+        self._connections = 0
+        self._in_flight = 0
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.dropped = 0
+
+    def start(self):
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(maxsize=self._queue_size)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.pool_size)]
+
+    # wait up to `drain` seconds for queued mail, then stop the senders
+    async def stop(self, drain: float = MAIL_DRAIN_SECONDS):
+        if not self._workers:
+            return
+        if self._queue.qsize() or self._in_flight:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=drain)
+            except asyncio.TimeoutError:
+                logger.warning(f"Mail queue not drained on shutdown, {self._queue.qsize()} messages dropped")
+        for handle in self._retries:
+            handle.cancel()
+        self._retries.clear()
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    # queue a message without waiting, returns False when the queue is full
+    def enqueue(self, message: EmailMessage) -> bool:
+        if self._queue is None:
+            self.start()
+        return self._put(_Job(message))
+
+    def _put(self, job: _Job) -> bool:
+        try:
+            self._queue.put_nowait(job)
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.error(f"Mail queue full, dropping message to {job.message['To']}")
+            return False
+
+    def _retry_later(self, job: _Job):
+        delay = min(MAIL_RETRY_BASE * 2 ** (job.attempts - 1), MAIL_RETRY_MAX) * random.uniform(0.5, 1.0)
+        self.retried += 1
+
+        def requeue():
+            self._retries.discard(handle)
+            self._put(job)
+
+        handle = asyncio.get_running_loop().call_later(delay, requeue)
+        self._retries.add(handle)
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        smtp = aiosmtplib.SMTP(hostname=self.hostname, port=self.port, timeout=SMTP_TIMEOUT, start_tls=self.start_tls)
+        try:
+            with stats.timed("mail.connect"):
+                await smtp.connect()
+                if self.username:
+                    await smtp.login(self.username, self.password)
+        except BaseException:
+            smtp.close()
+            raise
+        self._connections += 1
+        return smtp
+
+    async def _close(self, smtp: aiosmtplib.SMTP | None):
+        if smtp is None:
+            return
+        self._connections -= 1
+        try:
+            if smtp.is_connected:
+                await smtp.quit()
+        except Exception:
+            pass
+        finally:
+            smtp.close()
+
+    async def _worker(self):
+        smtp = None
+        try:
+            while True:
+                # not wait_for: on 3.11 a cancel racing its timeout can be lost and stop() never returns
+                try:
+                    async with asyncio.timeout(MAIL_IDLE_SECONDS):
+                        job = await self._queue.get()
+                except TimeoutError:
+                    await self._close(smtp)
+                    smtp = None
+                    continue
+                self._in_flight += 1
+                stats.timing("mail.queue_wait").observe(time.perf_counter() - job.queued_at)
+                try:
+                    job.attempts += 1
+                    # a connection the server dropped while idle gets one immediate reconnect
+                    for reconnect in (False, True):
+                        if smtp is None:
+                            smtp = await self._connect()
+                        try:
+                            with stats.timed("mail.send"):
+                                await smtp.send_message(job.message)
+                            break
+                        except aiosmtplib.SMTPServerDisconnected:
+                            await self._close(smtp)
+                            smtp = None
+                            if reconnect:
+                                raise
+                    self.sent += 1
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    # an smtp reply leaves the session usable (aiosmtplib resets the envelope), anything else gets a fresh one
+                    if not isinstance(e, (aiosmtplib.SMTPResponseException, aiosmtplib.SMTPRecipientsRefused)):
+                        await self._close(smtp)
+                        smtp = None
+                    if _permanent(e) or job.attempts >= MAIL_MAX_ATTEMPTS:
+                        self.failed += 1
+                        logger.error(f"Giving up on mail to {job.message['To']} after {job.attempts} attempts: {e}")
+                    else:
+                        logger.warning(f"Mail to {job.message['To']} failed (attempt {job.attempts}), retrying: {e}")
+                        self._retry_later(job)
+                finally:
+                    self._in_flight -= 1
+                    self._queue.task_done()
+        finally:
+            await self._close(smtp)
+
+    def stats(self):
+        info = {
+            "pool_size": self.pool_size,
+            "connections": self._connections,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "queue_max": self._queue_size,
+            "in_flight": self._in_flight,
+            "pending_retries": len(self._retries),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "dropped": self.dropped,
+        }
+        info.update(stats.snapshot("mail."))
+        return info
+
+dispatcher = MailDispatcher()
@@ -1,21 +1,56 @@
+import startup
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import HTMLResponse, ORJSONResponse
+from contextlib import asynccontextmanager
 import os
+import bus
+import database
+import hashing
+import lockout
+import mailer
+import media
+import metrics
+import reset_tokens
+import signing
+from static import UploadFiles
+from revocation import revocations
 
 # routers
 from routers import users
 from routers import auth
 
-app = FastAPI(title="Retail Auth Microservice")
+# startup and shutdown, the pool, hashing warm-up and state loading run in startup.py's background boot
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    hashing.check_pin_lookup_key()
+    signing.start()
+    bus.start()
+    startup.begin()
+    try:
+        yield
+    finally:
+        await startup.stop()
+        await reset_tokens.store.stop()
+        await mailer.dispatcher.stop()
+        await revocations.stop()
+        await lockout.engine.stop()
+        await media.shutdown()
+        hashing.shutdown()
+        await database.close_pool()
+        await bus.stop()
+
+# orjson for every json response, the hot listings also skip jsonable_encoder by returning their response directly
+app = FastAPI(title="Retail Auth Microservice", lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # include routers
+app.include_router(startup.router, tags=['health'])
+app.include_router(metrics.router, tags=['health'])
 app.include_router(auth.router, prefix='/auth', tags=['auth'])
 app.include_router(users.router, prefix='/users', tags=['users'])
 
 # Mount static files for uploads
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+app.mount("/uploads", UploadFiles(directory="uploads"), name="uploads")
 
 # CORS setup to allow frontend and backend 
 app.add_middleware(
@@ -71,9 +106,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count", "ETag"],
 )
 
-# run app
+# outermost, so latency includes cors and error handling
+app.add_middleware(metrics.MetricsMiddleware)
+
+# dev server, production runs serve.py (one worker per core, rolling restarts)
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", port=4000, host="127.0.0.1", reload=True)
\ No newline at end of file
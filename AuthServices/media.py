@@ -0,0 +1,348 @@
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import HTTPException, Request, status
+import stats
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ModuleNotFoundError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+logger = logging.getLogger(__name__)
+
+# upload config
+UPLOAD_ROOT = "uploads"
+PROFILE_PHOTO_DIR = os.path.join(UPLOAD_ROOT, "profile_pictures")
+PROFILE_PHOTO_MAX_BYTES = int(os.getenv("PROFILE_PHOTO_MAX_BYTES", 5 * 1024 * 1024))
+MULTIPART_OVERHEAD = 16 * 1024  # boundaries and part headers on top of the file itself
+UPLOADS_PUBLIC_BASE = os.getenv("UPLOADS_PUBLIC_BASE", "http://localhost:4000/uploads")
+
+# derivative config
+PROFILE_VARIANT_SIZES = tuple(int(v) for v in os.getenv("PROFILE_VARIANT_SIZES", "48,128,512").split(","))  # longest edge in px
+VARIANT_FORMATS = (("jpg", "JPEG", {"quality": 85, "optimize": True, "progressive": True}), ("webp", "WEBP", {"quality": 80, "method": 4}))
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", 1))
+MEDIA_MAX_IMAGE_PIXELS = int(os.getenv("MEDIA_MAX_IMAGE_PIXELS", 50_000_000))  # larger originals get no variants, a decoded pixel costs 3-4 bytes
+
+# leading bytes of the image types we accept, the stored extension comes from here and not the client filename
+_SIGNATURES = (
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+)
+_SNIFF_BYTES = 16
+
+def _sniff(head: bytes) -> str | None:
+    for signature, ext in _SIGNATURES:
+        if head.startswith(signature):
+            return ext
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+def _too_large(max_bytes: int):
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"File too large, the limit is {max_bytes // 1024} KB."
+    )
+
+def _unsupported():
+    return HTTPException(
+        status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+        detail="Only JPEG, PNG, GIF and WebP images are accepted."
+    )
+
+def _finish(tmp_path: str, final_path: str) -> bool:
+    if os.path.exists(final_path):
+        os.remove(tmp_path)
+        return False
+    os.replace(tmp_path, final_path)
+    return True
+
+# writes one streamed image to a temp file while hashing it, then moves it to <sha256><ext>
+class _ImageSink:
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._digest = hashlib.sha256()
+        self._head = b""
+        self._ext = None
+        self._tmp_path = os.path.join(directory, f".upload-{os.urandom(8).hex()}.tmp")
+        self._out = None
+
+    async def open(self):
+        await asyncio.to_thread(os.makedirs, self.directory, exist_ok=True)
+        self._out = await asyncio.to_thread(open, self._tmp_path, "wb")
+
+    async def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise _too_large(self.max_bytes)
+        if self._ext is None:
+            # part data can arrive in slivers, hold on to the start until the type is known
+            self._head += chunk
+            if len(self._head) < _SNIFF_BYTES:
+                return
+            self._ext = _sniff(self._head)
+            if self._ext is None:
+                raise _unsupported()
+            chunk, self._head = self._head, b""
+        self._digest.update(chunk)
+        await asyncio.to_thread(self._out.write, chunk)
+
+    async def finish(self):
+        if self._ext is None:
+            if not self._head:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Empty file.")
+            self._ext = _sniff(self._head)
+            if self._ext is None:
+                raise _unsupported()
+            self._digest.update(self._head)
+            await asyncio.to_thread(self._out.write, self._head)
+        await asyncio.to_thread(self._out.close)
+        name = f"{self._digest.hexdigest()}{self._ext}"
+        created = await asyncio.to_thread(_finish, self._tmp_path, os.path.join(self.directory, name))
+        return name, created
+
+    async def discard(self):
+        if self._out is not None:
+            self._out.close()
+        try:
+            await asyncio.to_thread(os.remove, self._tmp_path)
+        except FileNotFoundError:
+            pass
+
+# feed the multipart body through the parser as it arrives, sending the first `field` part to the sink
+async def _stream_multipart(request: Request, boundary: bytes, field: str, sink: _ImageSink):
+    events = []
+    headers = {}
+    header_field = bytearray()
+    header_value = bytearray()
+
+    def on_part_begin():
+        headers.clear()
+
+    def on_header_field(data, start, end):
+        header_field.extend(data[start:end])
+
+    def on_header_value(data, start, end):
+        header_value.extend(data[start:end])
+
+    def on_header_end():
+        headers[bytes(header_field).lower()] = bytes(header_value)
+        header_field.clear()
+        header_value.clear()
+
+    def on_headers_finished():
+        _, options = parse_options_header(headers.get(b"content-disposition", b""))
+        events.append(("begin", options.get(b"name")))
+
+    def on_part_data(data, start, end):
+        events.append(("data", bytes(data[start:end])))
+
+    def on_part_end():
+        events.append(("end", None))
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+    wanted = field.encode("utf-8")
+    current = found = False
+    async for chunk in request.stream():
+        try:
+            parser.write(chunk)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Malformed multipart body.")
+        for kind, value in events:
+            if kind == "begin":
+                current = value == wanted and not found
+            elif kind == "data" and current:
+                await sink.write(value)
+            elif kind == "end" and current:
+                current, found = False, True
+        events.clear()
+    parser.finalize()
+    if not found:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"No '{field}' file in the upload.")
+
+# stream an image from a multipart form field (or a raw image/* body) to disk without spooling the request first.
+# the file is stored under its sha256 so identical images are kept once.
+# returns (stored file name, size in bytes, True if this is a new file)
+async def receive_image(request: Request, field: str = "file", directory: str = PROFILE_PHOTO_DIR, max_bytes: int = PROFILE_PHOTO_MAX_BYTES):
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > max_bytes + MULTIPART_OVERHEAD:
+        raise _too_large(max_bytes)
+
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    sink = _ImageSink(directory, max_bytes)
+    with stats.timed("upload.store"):
+        await sink.open()
+        try:
+            if content_type == b"multipart/form-data":
+                boundary = params.get(b"boundary")
+                if not boundary:
+                    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Missing multipart boundary.")
+                await _stream_multipart(request, boundary, field, sink)
+            elif content_type.startswith(b"image/"):
+                async for chunk in request.stream():
+                    await sink.write(chunk)
+            else:
+                raise _unsupported()
+            name, created = await sink.finish()
+        except BaseException:
+            await sink.discard()
+            raise
+    return name, sink.size, created
+
+# derivatives live next to the original as <stem>.<size>.<jpg|webp>
+def variant_name(name: str, size: int, ext: str) -> str:
+    return f"{os.path.splitext(name)[0]}.{size}.{ext}"
+
+def _variant_names(name: str):
+    return [variant_name(name, size, ext) for size in PROFILE_VARIANT_SIZES for ext, _, _ in VARIANT_FORMATS]
+
+# worker side, runs in the process pool: decode the original once and write every missing variant
+def _render_variants(directory: str, name: str, sizes: tuple, formats: tuple, max_pixels: int) -> list[str]:
+    from PIL import Image, ImageOps
+
+    # a few kilobytes of png or gif can declare a huge canvas, draft below only shrinks jpeg
+    Image.MAX_IMAGE_PIXELS = max_pixels
+
+    todo = [(size, ext, fmt, opts) for size in sizes for ext, fmt, opts in formats
+            if not os.path.exists(os.path.join(directory, variant_name(name, size, ext)))]
+    if not todo:
+        return []
+    with Image.open(os.path.join(directory, name)) as img:
+        # pillow only refuses at twice MAX_IMAGE_PIXELS, check the header size before anything is decoded
+        if img.width * img.height > max_pixels:
+            raise ValueError(f"{name} is {img.width}x{img.height}, over the {max_pixels} pixel limit")
+        # let the jpeg decoder scale down while decoding, it only needs enough pixels for the largest variant
+        largest = max(size for size, _, _, _ in todo)
+        img.draft("RGB", (largest, largest))
+        img = ImageOps.exif_transpose(img)
+        img.load()
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "transparency" in img.info or img.mode in ("LA", "PA") else "RGB")
+
+    written = []
+    for size in sorted({size for size, _, _, _ in todo}, reverse=True):
+        resized = img.copy()
+        resized.thumbnail((size, size), Image.LANCZOS)
+        for s, ext, fmt, opts in todo:
+            if s != size:
+                continue
+            out = resized
+            if fmt == "JPEG" and out.mode == "RGBA":
+                out = Image.new("RGB", out.size, (255, 255, 255))
+                out.paste(resized, mask=resized.getchannel("A"))
+            target = os.path.join(directory, variant_name(name, size, ext))
+            tmp = f"{target}.{os.getpid()}.tmp"
+            out.save(tmp, fmt, **opts)
+            os.replace(tmp, target)
+            written.append(os.path.basename(target))
+    return written
+
+_executor = None
+_inflight: dict[str, asyncio.Task] = {}
+_ready: set[str] = set()
+_failed: set[str] = set()   # originals that are missing or could not be decoded, not retried until re-uploaded or rebuilt
+_background: set[asyncio.Task] = set()
+
+def start():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=MEDIA_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+async def shutdown():
+    global _executor
+    for task in list(_inflight.values()):
+        task.cancel()
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+def variants_ready(name: str, directory: str = PROFILE_PHOTO_DIR) -> bool:
+    if name in _ready:
+        return True
+    if all(os.path.exists(os.path.join(directory, v)) for v in _variant_names(name)):
+        _ready.add(name)
+        return True
+    return False
+
+# build the variants for one stored image, concurrent calls for the same image share one job
+async def build_variants(name: str, directory: str = PROFILE_PHOTO_DIR):
+    if variants_ready(name, directory):
+        return []
+    task = _inflight.get(name)
+    if task is None:
+        task = _inflight[name] = asyncio.create_task(_build(name, directory))
+    return await asyncio.shield(task)
+
+async def _build(name: str, directory: str):
+    try:
+        with stats.timed("media.variants"):
+            written = await asyncio.get_running_loop().run_in_executor(
+                start(), _render_variants, directory, name, PROFILE_VARIANT_SIZES, VARIANT_FORMATS, MEDIA_MAX_IMAGE_PIXELS
+            )
+        _ready.add(name)
+        _failed.discard(name)
+        return written
+    except Exception:
+        _failed.add(name)
+        raise
+    finally:
+        _inflight.pop(name, None)
+
+# fire and forget from request handlers. a failed build is logged once and not scheduled again until
+# retry is passed (a fresh upload of the same file), an explicit build_variants call retries as well
+def schedule_variants(name: str, directory: str = PROFILE_PHOTO_DIR, retry: bool = False):
+    if retry:
+        _failed.discard(name)
+    if name in _ready or name in _inflight or name in _failed:
+        return
+
+    async def run():
+        try:
+            await build_variants(name, directory)
+        except Exception as e:
+            logger.error(f"Failed to build variants for {name}: {e}", exc_info=True)
+            stats.timing("media.variants.failed").observe(0.0)
+
+    task = asyncio.get_running_loop().create_task(run())
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+# public urls for an uploaded profile image, variants only once they exist. images whose build failed keep
+# the original url
+def profile_image_urls(name: str | None):
+    if not name:
+        return None, None
+    base = f"{UPLOADS_PUBLIC_BASE}/profile_pictures"
+    if name in _failed:
+        return f"{base}/{name}", None
+    if not variants_ready(name):
+        schedule_variants(name)
+        return f"{base}/{name}", None
+    variants = {
+        str(size): {ext: f"{base}/{variant_name(name, size, ext)}" for ext, _, _ in VARIANT_FORMATS}
+        for size in PROFILE_VARIANT_SIZES
+    }
+    return f"{base}/{name}", variants
+
+def media_stats():
+    info = {"workers": MEDIA_WORKERS, "inflight": len(_inflight), "ready_cached": len(_ready), "failed_cached": len(_failed)}
+    info.update(stats.snapshot("media."))
+    info.update(stats.snapshot("upload."))
+    return info
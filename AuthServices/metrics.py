@@ -0,0 +1,143 @@
+import hmac
+import os
+import time
+from fastapi import APIRouter, HTTPException, Request, status
+from fastapi.responses import PlainTextResponse
+import stats
+
+# metrics config
+METRICS_PREFIX = os.getenv("METRICS_PREFIX", "authsvc")
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")   # bearer token required by /metrics, without one it answers 404
+METRICS_PUBLIC = os.getenv("METRICS_PUBLIC", "false").lower() == "true"   # serve without a token, only where the port is internal
+
+router = APIRouter()
+
+_in_flight = 0
+_routes: dict[tuple[str, str], stats.Timing] = {}
+_responses: dict[tuple[str, str, int], int] = {}
+
+# route template of a handled request, never the raw path so the label set stays bounded
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    # mounted apps (/uploads) only leave their prefix behind
+    mounted = scope.get("root_path", "")[len(scope.get("app_root_path", "")):]
+    return mounted or "<unmatched>"
+
+# pure asgi middleware: one perf_counter pair and two dict updates per request
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        global _in_flight
+        code = 500
+
+        async def send_with_status(message):
+            nonlocal code
+            if message["type"] == "http.response.start":
+                code = message["status"]
+            await send(message)
+
+        _in_flight += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            _in_flight -= 1
+            key = (scope["method"], _route_label(scope))
+            timing = _routes.get(key)
+            if timing is None:
+                timing = _routes[key] = stats.Timing()
+            timing.observe(elapsed)
+            key = key + (code,)
+            _responses[key] = _responses.get(key, 0) + 1
+
+def _name(name: str) -> str:
+    return f"{METRICS_PREFIX}_" + name.replace(".", "_").replace("-", "_")
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(labels: dict) -> str:
+    return ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+
+def _histogram(lines: list, name: str, timing: stats.Timing, labels: dict | None = None):
+    base = _labels(labels or {})
+    sep = "," if base else ""
+    cumulative = 0
+    for bound, count in zip(stats.BUCKETS, timing.buckets):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{base}{sep}le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{{base}{sep}le="+Inf"}} {timing.count}')
+    suffix = f"{{{base}}}" if base else ""
+    lines.append(f"{name}_sum{suffix} {timing.total}")
+    lines.append(f"{name}_count{suffix} {timing.count}")
+
+# point-in-time values read from the modules that own them
+def _gauges():
+    import database
+    import hashing
+    import lockout
+    import mailer
+    import search
+    from revocation import revocations
+    pool = database.pool_stats()
+    mail = mailer.dispatcher.stats()
+    locks = lockout.engine.stats()
+    return {
+        "http_requests_in_flight": _in_flight,
+        "db_pool_size": pool["size"],
+        "db_pool_free": pool["free"],
+        "db_pool_in_use": pool["size"] - pool["free"],
+        "hash_jobs_pending": hashing.hash_stats()["pending"],
+        "mail_queue_depth": mail["queue_depth"],
+        "mail_in_flight": mail["in_flight"],
+        "lockout_tracked_usernames": locks["tracked_usernames"],
+        "lockout_tracked_ips": locks["tracked_ips"],
+        "lockout_pending_writes": locks["pending_writes"],
+        "revoked_token_ids": revocations.stats()["revoked_ids"],
+        "search_indexed_users": search.index.stats()["users"],
+    }
+
+# prometheus text exposition format 0.0.4
+def render() -> str:
+    lines = []
+    name = _name("http_request_duration_seconds")
+    lines.append(f"# HELP {name} Request latency by route template.")
+    lines.append(f"# TYPE {name} histogram")
+    for (method, route), timing in list(_routes.items()):
+        _histogram(lines, name, timing, {"method": method, "route": route})
+    name = _name("http_responses_total")
+    lines.append(f"# TYPE {name} counter")
+    for (method, route, code), count in list(_responses.items()):
+        lines.append(f"{name}{{{_labels({'method': method, 'route': route, 'status': code})}}} {count}")
+    for key, timing in sorted(stats.timings().items()):
+        name = _name(key + "_seconds")
+        lines.append(f"# TYPE {name} histogram")
+        _histogram(lines, name, timing)
+    for key, count in sorted(stats.counters().items()):
+        name = _name(key + "_total")
+        lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name} {count}")
+    for key, value in _gauges().items():
+        name = _name(key)
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics(request: Request):
+    # route names, user counts and queue depths are not for the public port
+    if not METRICS_TOKEN and not METRICS_PUBLIC:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if METRICS_TOKEN:
+        supplied = request.headers.get("authorization", "").removeprefix("Bearer ")
+        if not hmac.compare_digest(supplied.encode("utf-8"), METRICS_TOKEN.encode("utf-8")):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token")
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4; charset=utf-8")
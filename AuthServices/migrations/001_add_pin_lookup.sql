@@ -0,0 +1,19 @@
+-- keyed lookup for manager pins so /users/verify-pin does one bcrypt check instead of one per manager
+-- PinLookup = HMAC-SHA256(PIN_LOOKUP_KEY, pin), written by /users/create and /users/update.
+--
+-- existing rows cannot be backfilled here since only the bcrypt hash of the pin is stored.
+-- while PIN_LEGACY_FALLBACK=true, verify-pin still checks managers with a NULL PinLookup one by one
+-- and fills in PinLookup the first time each manager's pin is used. once the query below returns 0,
+-- set PIN_LEGACY_FALLBACK=false (or re-set the remaining pins through /users/update).
+--
+--   SELECT COUNT(*) FROM Users
+--   WHERE UserRole = 'manager' AND System = 'POS' AND isDisabled = 0
+--     AND Pin IS NOT NULL AND Pin != '' AND PinLookup IS NULL;
+
+ALTER TABLE Users ADD PinLookup CHAR(64) NULL;
+GO
+
+CREATE NONCLUSTERED INDEX IX_Users_PinLookup
+    ON Users (PinLookup)
+    INCLUDE (Username, Pin, UserRole, System, isDisabled);
+GO
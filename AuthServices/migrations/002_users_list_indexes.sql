@@ -0,0 +1,8 @@
+-- supports the keyset-paginated /users/list-users filters (UserID is the clustered key)
+CREATE NONCLUSTERED INDEX IX_Users_Role_System_Disabled
+    ON Users (UserRole, System, isDisabled, UserID);
+GO
+
+CREATE NONCLUSTERED INDEX IX_Users_CreatedAt
+    ON Users (CreatedAt, UserID);
+GO
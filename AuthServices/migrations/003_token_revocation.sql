@@ -0,0 +1,23 @@
+-- revoked access tokens, loaded into memory on startup so get_current_user never queries them.
+-- rows are purged by the service once ExpiresAt has passed.
+CREATE TABLE RevokedTokens (
+    Jti CHAR(32) NOT NULL PRIMARY KEY,
+    Username NVARCHAR(50) NULL,
+    ExpiresAt DATETIME2 NOT NULL,
+    RevokedAt DATETIME2 NOT NULL DEFAULT SYSUTCDATETIME()
+);
+GO
+
+CREATE NONCLUSTERED INDEX IX_RevokedTokens_RevokedAt ON RevokedTokens (RevokedAt) INCLUDE (Jti);
+GO
+
+CREATE NONCLUSTERED INDEX IX_RevokedTokens_ExpiresAt ON RevokedTokens (ExpiresAt);
+GO
+
+-- per-user "revoke everything issued at or before RevokedBefore", written by /users/disable and /auth/revoke
+CREATE TABLE TokenRevocationCutoffs (
+    Username NVARCHAR(50) NOT NULL PRIMARY KEY,
+    RevokedBefore DATETIME2 NOT NULL,
+    UpdatedAt DATETIME2 NOT NULL DEFAULT SYSUTCDATETIME()
+);
+GO
@@ -0,0 +1,21 @@
+-- replaces tokensReset: the token is stored as its sha256 (hex) and looked up by primary key,
+-- expiry is a native DATETIME2, UsedAt makes tokens single use and the service deletes expired rows in batches.
+-- links issued before the switch stop working, they expire after RESET_TOKEN_EXP_MINUTES anyway.
+CREATE TABLE PasswordResetTokens (
+    TokenHash CHAR(64) NOT NULL PRIMARY KEY,
+    Email NVARCHAR(255) NOT NULL,
+    CreatedAt DATETIME2 NOT NULL,
+    ExpiresAt DATETIME2 NOT NULL,
+    UsedAt DATETIME2 NULL
+);
+GO
+
+-- bulk purge by expiry
+CREATE NONCLUSTERED INDEX IX_PasswordResetTokens_ExpiresAt ON PasswordResetTokens (ExpiresAt);
+GO
+
+-- invalidating the other open links of an address after a reset
+CREATE NONCLUSTERED INDEX IX_PasswordResetTokens_Email ON PasswordResetTokens (Email) WHERE UsedAt IS NULL;
+GO
+
+-- tokensReset is dropped by 008_drop_tokens_reset.sql once the new code is deployed everywhere
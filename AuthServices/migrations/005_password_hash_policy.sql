@@ -0,0 +1,13 @@
+-- algorithm and cost of each user's password hash, written with every new hash and on the rehash after login.
+-- lets the hashing policy rollout be tracked with a GROUP BY instead of parsing UserPassword:
+--
+--   SELECT PasswordAlgorithm, PasswordCost, COUNT(*) FROM Users WHERE isDisabled = 0 GROUP BY PasswordAlgorithm, PasswordCost;
+ALTER TABLE Users ADD PasswordAlgorithm VARCHAR(16) NULL, PasswordCost VARCHAR(32) NULL;
+GO
+
+-- existing hashes are all bcrypt, the cost is the two digits after "$2b$"
+UPDATE Users
+SET PasswordAlgorithm = 'bcrypt',
+    PasswordCost = 'rounds=' + CAST(CAST(SUBSTRING(UserPassword, 5, 2) AS INT) AS VARCHAR(2))
+WHERE UserPassword LIKE '$2_$[0-9][0-9]$%' AND PasswordAlgorithm IS NULL;
+GO
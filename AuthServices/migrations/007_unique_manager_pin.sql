@@ -0,0 +1,13 @@
+-- no two active POS managers may share a pin: verify-pin finds the manager by PinLookup alone.
+-- create, update and bulk-create reject a pin already in use, this index also catches two writes racing
+-- each other. rows written before those checks may already share a PinLookup, list them with the query
+-- below and re-set their pins through /users/update before creating the index.
+--
+--   SELECT PinLookup, COUNT(*) FROM Users
+--   WHERE UserRole = 'manager' AND System = 'POS' AND isDisabled = 0 AND PinLookup IS NOT NULL
+--   GROUP BY PinLookup HAVING COUNT(*) > 1;
+
+CREATE UNIQUE NONCLUSTERED INDEX UX_Users_ManagerPinLookup
+    ON Users (PinLookup)
+    WHERE UserRole = 'manager' AND System = 'POS' AND isDisabled = 0 AND PinLookup IS NOT NULL;
+GO
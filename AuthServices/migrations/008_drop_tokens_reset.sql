@@ -0,0 +1,5 @@
+-- tokensReset was replaced by PasswordResetTokens in 004_password_reset_tokens.sql and nothing reads it.
+-- run once every instance runs code that uses PasswordResetTokens, links stored here expired long ago.
+IF OBJECT_ID('dbo.tokensReset', 'U') IS NOT NULL
+    DROP TABLE dbo.tokensReset;
+GO
@@ -0,0 +1,455 @@
+import json
+from functools import lru_cache
+from typing import Any, Sequence
+from database import DB_BACKEND
+
+# pyodbc.Row or the sqlite stand-in's row, both index and attribute access
+Row = Sequence[Any]
+
+# column order of a row passed to UserRepository.insert / insert_many
+USER_INSERT_COLUMNS = (
+    "UserPassword", "PasswordAlgorithm", "PasswordCost", "Email", "UserRole", "isDisabled", "CreatedAt", "System",
+    "Username", "PhoneNumber", "FirstName", "MiddleName", "LastName", "Suffix", "Pin", "PinLookup",
+)
+
+# columns UserRepository.update may set, anything else is a programming error
+USER_UPDATE_COLUMNS = frozenset((
+    "Username", "Email", "PhoneNumber", "UserPassword", "PasswordAlgorithm", "PasswordCost", "FirstName", "MiddleName",
+    "LastName", "Suffix", "UserRole", "System", "Pin", "PinLookup", "City", "Province", "Landmark", "Block", "Street",
+    "Subdivision", "Birthday",
+))
+
+# list-users filters, name -> condition
+USER_LIST_FILTERS = {
+    "role": "UserRole = ?",
+    "system": "System = ?",
+    "is_disabled": "isDisabled = ?",
+    "created_from": "CreatedAt >= ?",
+    "created_to": "CreatedAt < ?",
+}
+
+# columns list-users and the profile may select, a ?fields= projection selects a subset in this order
+USER_LIST_COLUMNS = (
+    "UserID", "Email", "UserRole", "isDisabled", "CreatedAt", "System", "Username", "PhoneNumber", "FirstName",
+    "MiddleName", "LastName", "Suffix",
+)
+USER_PROFILE_COLUMNS = (
+    "UserID", "Username", "FirstName", "MiddleName", "LastName", "Email", "PhoneNumber", "Block", "Street",
+    "Subdivision", "City", "Province", "Landmark", "Birthday", "ProfileImage",
+)
+
+_RIDER_COLUMNS = "UserID, FirstName, LastName, Username, PhoneNumber"
+# what search.SearchIndex keeps per user, in this order
+_SEARCH_COLUMNS = "UserID, Username, Email, PhoneNumber, FirstName, MiddleName, LastName, Suffix, UserRole, System, isDisabled"
+_PIN_MANAGERS = "UserRole = 'manager' AND System = 'POS' AND isDisabled = 0 AND Pin IS NOT NULL AND Pin != ''"
+
+# every fixed statement, one text per name: sql server reuses the cached plan of an identical text and
+# a pooled connection keeps a prepared cursor per text (database.prepared)
+_STATEMENTS = {
+    # Users
+    "users.auth": "SELECT Username, UserPassword, UserRole, isDisabled, System FROM Users WHERE Username = ? AND isDisabled = 0",
+    "users.insert": f"INSERT INTO Users ({', '.join(USER_INSERT_COLUMNS)}) VALUES ({', '.join('?' * len(USER_INSERT_COLUMNS))})",
+    "users.email_taken": "SELECT 1 FROM Users WHERE Email = ? AND isDisabled = 0",
+    "users.email_taken_in_system": "SELECT 1 FROM Users WHERE Email = ? AND System = ? AND isDisabled = 0",
+    "users.email_taken_by_other": "SELECT 1 FROM Users WHERE Email = ? AND UserID != ? AND isDisabled = 0",
+    "users.username_taken": "SELECT 1 FROM Users WHERE Username = ? AND isDisabled = 0",
+    "users.username_taken_in_system": "SELECT 1 FROM Users WHERE Username = ? AND System = ? AND isDisabled = 0",
+    "users.username_taken_by_other": "SELECT 1 FROM Users WHERE Username = ? AND UserID != ? AND isDisabled = 0",
+    "users.taken": (
+        "SELECT Username, Email FROM Users WHERE isDisabled = 0 "
+        "AND (Username IN (SELECT value FROM OPENJSON(?)) OR Email IN (SELECT value FROM OPENJSON(?)))"
+    ),
+    "users.identity": "SELECT UserRole, System, Username FROM Users WHERE UserID = ?",
+    "users.active_identity": "SELECT Username, System, UserRole FROM Users WHERE UserID = ? AND isDisabled = 0",
+    "users.id_by_username": "SELECT UserID FROM Users WHERE Username = ?",
+    "users.names": "SELECT UserID, FirstName, MiddleName, LastName, Suffix, PhoneNumber FROM Users WHERE Username = ?",
+    "users.profile": f"SELECT {', '.join(USER_PROFILE_COLUMNS)} FROM Users WHERE Username = ?",
+    "users.profile_images": "SELECT DISTINCT ProfileImage FROM Users WHERE ProfileImage IS NOT NULL AND ProfileImage != ''",
+    "users.set_profile_image": "UPDATE Users SET ProfileImage = ? WHERE Username = ?",
+    "users.disable": "UPDATE Users SET isDisabled = 1 WHERE UserID = ?",
+    "users.disable_by_username": "UPDATE Users SET isDisabled = 1 WHERE Username = ?",
+    "users.rehash": (
+        "UPDATE Users SET UserPassword = ?, PasswordAlgorithm = ?, PasswordCost = ? WHERE Username = ? AND UserPassword = ?"
+    ),
+    "users.oos_by_email": "SELECT Username FROM Users WHERE Email = ? AND UserRole = 'user' AND System = 'OOS' AND isDisabled = 0",
+    "users.reset_password": (
+        "UPDATE Users SET UserPassword = ?, PasswordAlgorithm = ?, PasswordCost = ? "
+        "WHERE Email = ? AND UserRole = 'user' AND System = 'OOS' AND isDisabled = 0"
+    ),
+    "users.riders": f"SELECT {_RIDER_COLUMNS} FROM Users WHERE UserRole = 'rider' AND isDisabled = 0",
+    "users.riders_by_ids": (
+        f"SELECT {_RIDER_COLUMNS} FROM Users WHERE UserRole = 'rider' AND isDisabled = 0 "
+        "AND UserID IN (SELECT CAST(value AS INT) FROM OPENJSON(?))"
+    ),
+    "users.rider": f"SELECT {_RIDER_COLUMNS} FROM Users WHERE UserRole = 'rider' AND isDisabled = 0 AND UserID = ?",
+    "users.cashiers": (
+        f"SELECT {_RIDER_COLUMNS} FROM Users WHERE UserRole = 'cashier' AND System = 'POS' AND isDisabled = 0 "
+        "ORDER BY FirstName, LastName"
+    ),
+    "users.search_rows": f"SELECT {_SEARCH_COLUMNS} FROM Users ORDER BY UserID",
+    "users.search_rows_by_ids": (
+        f"SELECT {_SEARCH_COLUMNS} FROM Users WHERE UserID IN (SELECT CAST(value AS INT) FROM OPENJSON(?))"
+    ),
+    "users.search_rows_by_usernames": (
+        f"SELECT {_SEARCH_COLUMNS} FROM Users WHERE Username IN (SELECT value FROM OPENJSON(?))"
+    ),
+    "users.pin_candidates": (
+        f"SELECT UserID, Username, Pin, PinLookup FROM Users WHERE {_PIN_MANAGERS} "
+        "AND (PinLookup = ? OR PinLookup IS NULL) ORDER BY UserID"
+    ),
+    "users.set_pin_lookup": "UPDATE Users SET PinLookup = ? WHERE UserID = ?",
+    "users.legacy_pin_managers": f"SELECT UserID, Username, Pin, PinLookup FROM Users WHERE {_PIN_MANAGERS} AND PinLookup IS NULL ORDER BY UserID",
+    "users.pin_taken": f"SELECT 1 FROM Users WHERE PinLookup = ? AND {_PIN_MANAGERS}",
+    "users.pin_taken_by_other": f"SELECT 1 FROM Users WHERE PinLookup = ? AND UserID != ? AND {_PIN_MANAGERS}",
+    "users.pins_taken": f"SELECT PinLookup FROM Users WHERE PinLookup IN (SELECT value FROM OPENJSON(?)) AND {_PIN_MANAGERS}",
+    "users.count_pin_managers": f"SELECT COUNT(*) FROM Users WHERE {_PIN_MANAGERS}",
+    # FailedLogins
+    "lockout.load": "SELECT Username, Attempts, LastAttempt, IsLockedOut, LockoutUntil FROM FailedLogins",
+    "lockout.upsert": (
+        "MERGE FailedLogins WITH (HOLDLOCK) AS t "
+        "USING (SELECT ? AS Username, ? AS Attempts, ? AS LastAttempt, ? AS IsLockedOut, ? AS LockoutUntil) AS s "
+        "ON t.Username = s.Username "
+        "WHEN MATCHED THEN UPDATE SET Attempts = s.Attempts, LastAttempt = s.LastAttempt, IsLockedOut = s.IsLockedOut, LockoutUntil = s.LockoutUntil "
+        "WHEN NOT MATCHED THEN INSERT (Username, Attempts, LastAttempt, IsLockedOut, LockoutUntil) "
+        "VALUES (s.Username, s.Attempts, s.LastAttempt, s.IsLockedOut, s.LockoutUntil);"
+    ),
+    # RevokedTokens, TokenRevocationCutoffs
+    "revocation.ids": "SELECT Jti FROM RevokedTokens",
+    "revocation.live_ids": "SELECT Jti FROM RevokedTokens WHERE ExpiresAt > ?",
+    "revocation.ids_since": "SELECT Jti FROM RevokedTokens WHERE RevokedAt >= ?",
+    "revocation.insert": (
+        "INSERT INTO RevokedTokens (Jti, Username, ExpiresAt, RevokedAt) "
+        "SELECT ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM RevokedTokens WHERE Jti = ?)"
+    ),
+    "revocation.purge": "DELETE FROM RevokedTokens WHERE ExpiresAt <= ?",
+    "revocation.cutoffs": "SELECT Username, RevokedBefore FROM TokenRevocationCutoffs",
+    "revocation.cutoffs_since": "SELECT Username, RevokedBefore FROM TokenRevocationCutoffs WHERE UpdatedAt >= ?",
+    # a cutoff only moves forward
+    "revocation.raise_cutoff": (
+        "MERGE TokenRevocationCutoffs WITH (HOLDLOCK) AS t "
+        "USING (SELECT ? AS Username, ? AS RevokedBefore, ? AS UpdatedAt) AS s "
+        "ON t.Username = s.Username "
+        "WHEN MATCHED THEN UPDATE SET RevokedBefore = CASE WHEN t.RevokedBefore < s.RevokedBefore "
+        "THEN s.RevokedBefore ELSE t.RevokedBefore END, UpdatedAt = s.UpdatedAt "
+        "WHEN NOT MATCHED THEN INSERT (Username, RevokedBefore, UpdatedAt) VALUES (s.Username, s.RevokedBefore, s.UpdatedAt);"
+    ),
+    # PasswordResetTokens
+    "reset_tokens.insert": "INSERT INTO PasswordResetTokens (TokenHash, Email, CreatedAt, ExpiresAt) VALUES (?, ?, ?, ?)",
+    "reset_tokens.live": (
+        "SELECT 1 FROM PasswordResetTokens WHERE TokenHash = ? AND Email = ? AND UsedAt IS NULL AND ExpiresAt > ?"
+    ),
+    "reset_tokens.consume": (
+        "UPDATE PasswordResetTokens SET UsedAt = ? WHERE TokenHash = ? AND Email = ? AND UsedAt IS NULL AND ExpiresAt > ?"
+    ),
+    "reset_tokens.expire_others": "UPDATE PasswordResetTokens SET UsedAt = ? WHERE Email = ? AND UsedAt IS NULL",
+    "reset_tokens.purge": "DELETE TOP (?) FROM PasswordResetTokens WHERE ExpiresAt < ?",
+}
+
+# sqlite spellings of the t-sql above, parameters stay in the same order
+_SQLITE_STATEMENTS = {
+    "users.taken": (
+        "SELECT Username, Email FROM Users WHERE isDisabled = 0 "
+        "AND (Username IN (SELECT value FROM json_each(?)) OR Email IN (SELECT value FROM json_each(?)))"
+    ),
+    "users.riders_by_ids": (
+        f"SELECT {_RIDER_COLUMNS} FROM Users WHERE UserRole = 'rider' AND isDisabled = 0 "
+        "AND UserID IN (SELECT CAST(value AS INTEGER) FROM json_each(?))"
+    ),
+    "users.search_rows_by_ids": (
+        f"SELECT {_SEARCH_COLUMNS} FROM Users WHERE UserID IN (SELECT CAST(value AS INTEGER) FROM json_each(?))"
+    ),
+    "users.search_rows_by_usernames": (
+        f"SELECT {_SEARCH_COLUMNS} FROM Users WHERE Username IN (SELECT value FROM json_each(?))"
+    ),
+    "users.pins_taken": f"SELECT PinLookup FROM Users WHERE PinLookup IN (SELECT value FROM json_each(?)) AND {_PIN_MANAGERS}",
+    "lockout.upsert": (
+        "INSERT INTO FailedLogins (Username, Attempts, LastAttempt, IsLockedOut, LockoutUntil) VALUES (?, ?, ?, ?, ?) "
+        "ON CONFLICT (Username) DO UPDATE SET Attempts = excluded.Attempts, LastAttempt = excluded.LastAttempt, "
+        "IsLockedOut = excluded.IsLockedOut, LockoutUntil = excluded.LockoutUntil"
+    ),
+    "revocation.raise_cutoff": (
+        "INSERT INTO TokenRevocationCutoffs (Username, RevokedBefore, UpdatedAt) VALUES (?, ?, ?) "
+        "ON CONFLICT (Username) DO UPDATE SET RevokedBefore = CASE WHEN RevokedBefore < excluded.RevokedBefore "
+        "THEN excluded.RevokedBefore ELSE RevokedBefore END, UpdatedAt = excluded.UpdatedAt"
+    ),
+    "reset_tokens.purge": (
+        "DELETE FROM PasswordResetTokens WHERE rowid IN "
+        "(SELECT rowid FROM PasswordResetTokens WHERE ExpiresAt < ?2 LIMIT ?1)"
+    ),
+}
+
+STATEMENTS = {**_STATEMENTS, **(_SQLITE_STATEMENTS if DB_BACKEND == "sqlite" else {})}
+
+# generated statements are cached so a given shape is always the same string object, which is what
+# pyodbc compares to skip re-preparing
+@lru_cache(maxsize=256)
+def _update_sql(columns: tuple[str, ...]) -> str:
+    unknown = set(columns) - USER_UPDATE_COLUMNS
+    if unknown:
+        raise ValueError(f"Not updatable: {', '.join(sorted(unknown))}")
+    return f"UPDATE Users SET {', '.join(f'{column} = ?' for column in columns)} WHERE UserID = ?"
+
+def _check_columns(columns: tuple[str, ...], allowed: tuple[str, ...]):
+    unknown = set(columns) - set(allowed)
+    if unknown or not columns:
+        raise ValueError(f"Not selectable: {', '.join(sorted(unknown)) or 'no columns'}")
+
+@lru_cache(maxsize=256)
+def _page_sql(filters: tuple[str, ...], after: bool, columns: tuple[str, ...]) -> str:
+    _check_columns(columns, USER_LIST_COLUMNS)
+    conditions = [USER_LIST_FILTERS[name] for name in filters] + (["UserID > ?"] if after else [])
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    columns = ", ".join(columns)
+    if DB_BACKEND == "sqlite":
+        return f"SELECT {columns} FROM Users{where} ORDER BY UserID LIMIT ?"
+    return f"SELECT TOP (?) {columns} FROM Users{where} ORDER BY UserID"
+
+@lru_cache(maxsize=64)
+def _profile_sql(columns: tuple[str, ...]) -> str:
+    if columns == USER_PROFILE_COLUMNS:
+        return STATEMENTS["users.profile"]
+    _check_columns(columns, USER_PROFILE_COLUMNS)
+    return f"SELECT {', '.join(columns)} FROM Users WHERE Username = ?"
+
+@lru_cache(maxsize=64)
+def _by_ids_sql(columns: tuple[str, ...]) -> str:
+    _check_columns(columns, USER_LIST_COLUMNS)
+    if DB_BACKEND == "sqlite":
+        return f"SELECT {', '.join(columns)} FROM Users WHERE UserID IN (SELECT CAST(value AS INTEGER) FROM json_each(?))"
+    return f"SELECT {', '.join(columns)} FROM Users WHERE UserID IN (SELECT CAST(value AS INT) FROM OPENJSON(?))"
+
+@lru_cache(maxsize=64)
+def _count_sql(filters: tuple[str, ...]) -> str:
+    where = f" WHERE {' AND '.join(USER_LIST_FILTERS[name] for name in filters)}" if filters else ""
+    return f"SELECT COUNT(*) FROM Users{where}"
+
+# statements run on prepared cursors of one pooled connection, results are always read in full so the
+# connection is free for the next statement (sql server without MARS allows one open result per connection)
+class _Repository:
+    __slots__ = ("conn",)
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    async def _rows(self, sql: str, params: Sequence = ()) -> list[Row]:
+        cursor = await self.conn.prepared(sql)
+        await cursor.execute(sql, params)
+        return await cursor.fetchall()
+
+    async def _row(self, sql: str, params: Sequence = ()) -> Row | None:
+        rows = await self._rows(sql, params)
+        return rows[0] if rows else None
+
+    async def _exists(self, sql: str, params: Sequence) -> bool:
+        return bool(await self._rows(sql, params))
+
+    # returns the affected row count
+    async def _write(self, sql: str, params: Sequence) -> int:
+        cursor = await self.conn.prepared(sql)
+        await cursor.execute(sql, params)
+        return cursor.rowcount
+
+    # fast sends the whole parameter array in one round trip
+    async def _write_many(self, sql: str, rows: list[Sequence], fast: bool = False):
+        cursor = await self.conn.prepared(sql)
+        await cursor.executemany(sql, rows, fast=fast)
+
+class UserRepository(_Repository):
+    __slots__ = ()
+
+    async def auth_rows(self, username: str) -> list[Row]:
+        return await self._rows(STATEMENTS["users.auth"], (username,))
+
+    # row values in USER_INSERT_COLUMNS order
+    async def insert(self, row: Sequence):
+        await self._write(STATEMENTS["users.insert"], row)
+
+    async def insert_many(self, rows: list[Sequence]):
+        await self._write_many(STATEMENTS["users.insert"], rows, fast=True)
+
+    async def email_taken(self, email: str, system: str | None = None, exclude_id: int | None = None) -> bool:
+        if exclude_id is not None:
+            return await self._exists(STATEMENTS["users.email_taken_by_other"], (email, exclude_id))
+        if system is not None:
+            return await self._exists(STATEMENTS["users.email_taken_in_system"], (email, system))
+        return await self._exists(STATEMENTS["users.email_taken"], (email,))
+
+    async def username_taken(self, username: str, system: str | None = None, exclude_id: int | None = None) -> bool:
+        if exclude_id is not None:
+            return await self._exists(STATEMENTS["users.username_taken_by_other"], (username, exclude_id))
+        if system is not None:
+            return await self._exists(STATEMENTS["users.username_taken_in_system"], (username, system))
+        return await self._exists(STATEMENTS["users.username_taken"], (username,))
+
+    # (Username, Email) of active users holding any of these usernames or emails
+    async def taken(self, usernames: list[str], emails: list[str]) -> list[Row]:
+        return await self._rows(STATEMENTS["users.taken"], (json.dumps(usernames), json.dumps(emails)))
+
+    # (UserRole, System, Username)
+    async def identity(self, user_id: int) -> Row | None:
+        return await self._row(STATEMENTS["users.identity"], (user_id,))
+
+    # (Username, System, UserRole) of an enabled user
+    async def active_identity(self, user_id: int) -> Row | None:
+        return await self._row(STATEMENTS["users.active_identity"], (user_id,))
+
+    async def id_by_username(self, username: str) -> int | None:
+        row = await self._row(STATEMENTS["users.id_by_username"], (username,))
+        return row[0] if row else None
+
+    async def names(self, username: str) -> Row | None:
+        return await self._row(STATEMENTS["users.names"], (username,))
+
+    # columns is a subset of USER_PROFILE_COLUMNS, in that order
+    async def profile(self, username: str, columns: tuple[str, ...] = USER_PROFILE_COLUMNS) -> Row | None:
+        return await self._row(_profile_sql(columns), (username,))
+
+    async def profile_images(self) -> list[str]:
+        return [row[0] for row in await self._rows(STATEMENTS["users.profile_images"])]
+
+    async def set_profile_image(self, username: str, filename: str) -> int:
+        return await self._write(STATEMENTS["users.set_profile_image"], (filename, username))
+
+    # fields maps USER_UPDATE_COLUMNS to values, callers build it in a fixed order so each shape is one statement
+    async def update(self, user_id: int, fields: dict[str, Any]) -> int:
+        return await self._write(_update_sql(tuple(fields)), (*fields.values(), user_id))
+
+    async def disable(self, user_id: int) -> int:
+        return await self._write(STATEMENTS["users.disable"], (user_id,))
+
+    async def disable_by_username(self, username: str) -> int:
+        return await self._write(STATEMENTS["users.disable_by_username"], (username,))
+
+    # swap the hash only if it is still the one that was verified
+    async def replace_password_hash(self, username: str, old_hash: str, new_hash: str, algorithm: str | None, cost: str | None) -> int:
+        return await self._write(STATEMENTS["users.rehash"], (new_hash, algorithm, cost, username, old_hash))
+
+    async def oos_username_by_email(self, email: str) -> str | None:
+        row = await self._row(STATEMENTS["users.oos_by_email"], (email,))
+        return row[0] if row else None
+
+    async def reset_oos_password(self, email: str, new_hash: str, algorithm: str | None, cost: str | None) -> int:
+        return await self._write(STATEMENTS["users.reset_password"], (new_hash, algorithm, cost, email))
+
+    async def riders(self) -> list[Row]:
+        return await self._rows(STATEMENTS["users.riders"])
+
+    async def riders_by_ids(self, ids: list[int]) -> list[Row]:
+        return await self._rows(STATEMENTS["users.riders_by_ids"], (json.dumps(ids),))
+
+    async def rider(self, rider_id: int) -> Row | None:
+        return await self._row(STATEMENTS["users.rider"], (rider_id,))
+
+    async def cashiers(self) -> list[Row]:
+        return await self._rows(STATEMENTS["users.cashiers"])
+
+    # POS managers whose PinLookup matches, plus any not yet migrated to PinLookup
+    async def pin_candidates(self, lookup: str) -> list[Row]:
+        return await self._rows(STATEMENTS["users.pin_candidates"], (lookup,))
+
+    # POS managers not yet migrated to PinLookup, only their bcrypt hash can tell whose pin is whose
+    async def legacy_pin_managers(self) -> list[Row]:
+        return await self._rows(STATEMENTS["users.legacy_pin_managers"])
+
+    async def set_pin_lookup(self, user_id: int, lookup: str) -> int:
+        return await self._write(STATEMENTS["users.set_pin_lookup"], (lookup, user_id))
+
+    # true if an active POS manager already has this pin, verify-pin could not tell the two apart
+    async def pin_taken(self, lookup: str, exclude_id: int | None = None) -> bool:
+        if exclude_id is not None:
+            return await self._exists(STATEMENTS["users.pin_taken_by_other"], (lookup, exclude_id))
+        return await self._exists(STATEMENTS["users.pin_taken"], (lookup,))
+
+    # the given lookups that an active POS manager already has
+    async def pins_taken(self, lookups: list[str]) -> set[str]:
+        return {row[0] for row in await self._rows(STATEMENTS["users.pins_taken"], (json.dumps(lookups),))}
+
+    async def count_pin_managers(self) -> int:
+        return (await self._row(STATEMENTS["users.count_pin_managers"]))[0]
+
+    # one keyset page ordered by UserID, filters maps USER_LIST_FILTERS names to values,
+    # columns is a subset of USER_LIST_COLUMNS
+    async def page(
+        self, filters: dict[str, Any], after: int | None, limit: int, columns: tuple[str, ...] = USER_LIST_COLUMNS
+    ) -> list[Row]:
+        sql = _page_sql(tuple(filters), after is not None, columns)
+        values = (*filters.values(), *((after,) if after is not None else ()))
+        if DB_BACKEND == "sqlite":
+            return await self._rows(sql, (*values, limit))
+        return await self._rows(sql, (limit, *values))
+
+    # list-users columns of the given users, in no particular order
+    async def by_ids(self, ids: list[int], columns: tuple[str, ...] = USER_LIST_COLUMNS) -> list[Row]:
+        return await self._rows(_by_ids_sql(columns), (json.dumps(ids),))
+
+    # rows in search.SearchIndex order: every user, or the given ids / usernames
+    async def search_rows(self, ids: list[int] | None = None, usernames: list[str] | None = None) -> list[Row]:
+        if ids is not None:
+            return await self._rows(STATEMENTS["users.search_rows_by_ids"], (json.dumps(ids),))
+        if usernames is not None:
+            return await self._rows(STATEMENTS["users.search_rows_by_usernames"], (json.dumps(usernames),))
+        return await self._rows(STATEMENTS["users.search_rows"])
+
+    async def count(self, filters: dict[str, Any]) -> int:
+        return (await self._row(_count_sql(tuple(filters)), tuple(filters.values())))[0]
+
+class LockoutRepository(_Repository):
+    __slots__ = ()
+
+    # (Username, Attempts, LastAttempt, IsLockedOut, LockoutUntil)
+    async def load(self) -> list[Row]:
+        return await self._rows(STATEMENTS["lockout.load"])
+
+    # rows of (Username, Attempts, LastAttempt, IsLockedOut, LockoutUntil), inserted or overwritten
+    async def upsert_many(self, rows: list[Sequence]):
+        await self._write_many(STATEMENTS["lockout.upsert"], rows)
+
+class RevocationRepository(_Repository):
+    __slots__ = ()
+
+    # jtis of every revoked token, or of those not yet expired at `now`
+    async def ids(self, now=None) -> list[Row]:
+        if now is None:
+            return await self._rows(STATEMENTS["revocation.ids"])
+        return await self._rows(STATEMENTS["revocation.live_ids"], (now,))
+
+    async def ids_since(self, since) -> list[Row]:
+        return await self._rows(STATEMENTS["revocation.ids_since"], (since,))
+
+    # a jti already in the table is left as it is
+    async def insert(self, jti: str, username: str | None, expires_at, revoked_at):
+        await self._write(STATEMENTS["revocation.insert"], (jti, username, expires_at, revoked_at, jti))
+
+    async def purge(self, now) -> int:
+        return await self._write(STATEMENTS["revocation.purge"], (now,))
+
+    # (Username, RevokedBefore)
+    async def cutoffs(self) -> list[Row]:
+        return await self._rows(STATEMENTS["revocation.cutoffs"])
+
+    async def cutoffs_since(self, since) -> list[Row]:
+        return await self._rows(STATEMENTS["revocation.cutoffs_since"], (since,))
+
+    # inserts the cutoff or moves an existing one forward, never back
+    async def raise_cutoff(self, username: str, before, now):
+        await self._write(STATEMENTS["revocation.raise_cutoff"], (username, before, now))
+
+class ResetTokenRepository(_Repository):
+    __slots__ = ()
+
+    async def insert(self, token_hash: str, email: str, created_at, expires_at):
+        await self._write(STATEMENTS["reset_tokens.insert"], (token_hash, email, created_at, expires_at))
+
+    async def live(self, token_hash: str, email: str, now) -> bool:
+        return await self._exists(STATEMENTS["reset_tokens.live"], (token_hash, email, now))
+
+    # 1 for the single caller that marks a live token used, 0 otherwise
+    async def consume(self, token_hash: str, email: str, now) -> int:
+        return await self._write(STATEMENTS["reset_tokens.consume"], (now, token_hash, email, now))
+
+    async def expire_others(self, email: str, now) -> int:
+        return await self._write(STATEMENTS["reset_tokens.expire_others"], (now, email))
+
+    # deletes at most `batch` expired rows, returns how many went
+    async def purge(self, before, batch: int) -> int:
+        return await self._write(STATEMENTS["reset_tokens.purge"], (batch, before))
@@ -0,0 +1,108 @@
+import asyncio
+import hashlib
+import logging
+import os
+import secrets
+from datetime import datetime, timedelta
+from database import db_connection
+from repositories import ResetTokenRepository
+import stats
+
+logger = logging.getLogger(__name__)
+
+# reset token config
+RESET_TOKEN_EXP_MINUTES = int(os.getenv("RESET_TOKEN_EXP_MINUTES", 15))
+RESET_TOKEN_PURGE_SECONDS = float(os.getenv("RESET_TOKEN_PURGE_SECONDS", 300))   # seconds between bulk deletes of dead tokens
+RESET_TOKEN_PURGE_BATCH = int(os.getenv("RESET_TOKEN_PURGE_BATCH", 5000))         # rows per delete statement, keeps lock time short
+
+# only the sha256 of a token is stored, the raw value exists in the emailed link alone
+def _digest(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+# single-use password reset tokens in PasswordResetTokens, looked up by the primary key on TokenHash
+class ResetTokenStore:
+    def __init__(self):
+        self._task = None
+        self.issued = 0
+        self.consumed = 0
+        self.rejected = 0
+        self.purged = 0
+
+    async def issue(self, email: str) -> str:
+        token = secrets.token_urlsafe(32)
+        now = datetime.utcnow()
+        async with db_connection() as conn:
+            await ResetTokenRepository(conn).insert(_digest(token), email, now, now + timedelta(minutes=RESET_TOKEN_EXP_MINUTES))
+            await conn.commit()
+        self.issued += 1
+        return token
+
+    # true while the token is unused and unexpired, changes nothing
+    async def check(self, email: str, token: str) -> bool:
+        async with db_connection() as conn:
+            return await ResetTokenRepository(conn).live(_digest(token), email, datetime.utcnow())
+
+    # mark the token used in one statement, True only for the single caller that wins the race. `then(conn)` runs
+    # in the same transaction, if it raises nothing is committed and the token stays usable
+    async def consume(self, email: str, token: str, then=None) -> bool:
+        now = datetime.utcnow()
+        with stats.timed("reset_token.consume"):
+            async with db_connection() as conn, conn.transaction():
+                repo = ResetTokenRepository(conn)
+                ok = await repo.consume(_digest(token), email, now) == 1
+                if ok:
+                    # any other link sent to this address is dead now too
+                    await repo.expire_others(email, now)
+                    if then is not None:
+                        await then(conn)
+        if ok:
+            self.consumed += 1
+        else:
+            self.rejected += 1
+        return ok
+
+    # delete expired rows in batches until none are left
+    async def purge(self) -> int:
+        total = 0
+        now = datetime.utcnow()
+        with stats.timed("reset_token.purge"):
+            async with db_connection() as conn:
+                repo = ResetTokenRepository(conn)
+                while True:
+                    deleted = await repo.purge(now, RESET_TOKEN_PURGE_BATCH)
+                    await conn.commit()
+                    total += max(deleted, 0)
+                    if deleted < RESET_TOKEN_PURGE_BATCH:
+                        break
+        self.purged += total
+        return total
+
+    async def _run(self):
+        while True:
+            try:
+                deleted = await self.purge()
+                if deleted:
+                    logger.info(f"Purged {deleted} expired password reset tokens")
+            except Exception as e:
+                logger.error(f"Failed to purge password reset tokens: {e}", exc_info=True)
+            await asyncio.sleep(RESET_TOKEN_PURGE_SECONDS)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self):
+        info = {"issued": self.issued, "consumed": self.consumed, "rejected": self.rejected, "purged": self.purged}
+        info.update(stats.snapshot("reset_token."))
+        return info
+
+store = ResetTokenStore()
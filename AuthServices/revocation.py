@@ -0,0 +1,206 @@
+import asyncio
+import calendar
+import hashlib
+import logging
+import math
+import os
+from datetime import datetime, timedelta
+from database import db_connection
+from repositories import RevocationRepository
+import bus
+import stats
+
+logger = logging.getLogger(__name__)
+
+# revocation config
+REVOCATION_BLOOM_CAPACITY = int(os.getenv("REVOCATION_BLOOM_CAPACITY", 1_000_000))  # revoked ids before the filter is resized
+REVOCATION_BLOOM_FP_RATE = float(os.getenv("REVOCATION_BLOOM_FP_RATE", 0.001))
+REVOCATION_REFRESH_SECONDS = float(os.getenv("REVOCATION_REFRESH_SECONDS", 30))     # how often revocations made by other workers are picked up
+REVOCATION_PURGE_SECONDS = float(os.getenv("REVOCATION_PURGE_SECONDS", 3600))       # how often ids of expired tokens are dropped
+
+# fixed-size bit array answering "definitely not revoked" without touching the exact set
+class BloomFilter:
+    def __init__(self, capacity: int, fp_rate: float):
+        self.capacity = max(capacity, 1)
+        self.size = max(int(-self.capacity * math.log(fp_rate) / (math.log(2) ** 2)), 8)
+        self.hashes = max(int(round(self.size / self.capacity * math.log(2))), 1)
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: bytes):
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key: bytes):
+        for pos in self._positions(key):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: bytes):
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    @property
+    def nbytes(self):
+        return len(self._bits)
+
+def _key(jti: str) -> bytes:
+    # jtis are uuid4 hex, keep them as 16 raw bytes so the exact set stays small
+    try:
+        return bytes.fromhex(jti)
+    except ValueError:
+        return jti.encode("utf-8")
+
+def _epoch(value: datetime) -> int:
+    return calendar.timegm(value.utctimetuple())
+
+# revoked token ids and per-user "revoke before" cutoffs, persisted to RevokedTokens / TokenRevocationCutoffs
+class RevocationList:
+    def __init__(self):
+        self._revoked: set[bytes] = set()
+        self._bloom = BloomFilter(REVOCATION_BLOOM_CAPACITY, REVOCATION_BLOOM_FP_RATE)
+        self._cutoffs: dict[str, int] = {}
+        self._watermark = None
+        self._task = None
+        self.loaded = False
+        self.rejected = 0
+        self.bloom_false_positives = 0
+        # revocations made by other workers apply at once, refresh() stays as the catch-up path
+        bus.subscribe("revocation.jti", lambda jti: self._add(_key(jti)))
+        bus.subscribe("revocation.cutoff", lambda data: self._raise_cutoff(*data))
+
+    def _raise_cutoff(self, username: str, cutoff: int):
+        self._cutoffs[username] = max(self._cutoffs.get(username, 0), cutoff)
+
+    def _add(self, key: bytes):
+        if key in self._revoked:
+            return
+        self._revoked.add(key)
+        self._bloom.add(key)
+        if self._bloom.count > self._bloom.capacity:
+            self._rebuild(self._bloom.capacity * 2)
+
+    def _rebuild(self, capacity: int | None = None):
+        bloom = BloomFilter(max(capacity or self._bloom.capacity, len(self._revoked)), REVOCATION_BLOOM_FP_RATE)
+        for key in self._revoked:
+            bloom.add(key)
+        self._bloom = bloom
+
+    async def load(self):
+        now = datetime.utcnow()
+        async with db_connection() as conn:
+            repo = RevocationRepository(conn)
+            rows = await repo.ids(now)
+            cutoffs = await repo.cutoffs()
+        self._revoked = {_key(row[0]) for row in rows}
+        self._rebuild(max(REVOCATION_BLOOM_CAPACITY, len(self._revoked) * 2))
+        self._cutoffs = {row[0]: _epoch(row[1]) for row in cutoffs}
+        self._watermark = now
+        self.loaded = True
+        logger.info(f"Revocation list loaded: {len(self._revoked)} token ids, {len(self._cutoffs)} user cutoffs")
+
+    # pick up revocations written by other workers since the last refresh
+    async def refresh(self):
+        since = (self._watermark or datetime.utcnow()) - timedelta(seconds=REVOCATION_REFRESH_SECONDS)
+        now = datetime.utcnow()
+        with stats.timed("revocation.refresh"):
+            async with db_connection() as conn:
+                repo = RevocationRepository(conn)
+                rows = await repo.ids_since(since)
+                cutoffs = await repo.cutoffs_since(since)
+        for row in rows:
+            self._add(_key(row[0]))
+        for username, revoked_before in cutoffs:
+            self._raise_cutoff(username, _epoch(revoked_before))
+        self._watermark = now
+
+    # drop ids of tokens that have expired anyway, in the db and in memory
+    async def purge(self):
+        now = datetime.utcnow()
+        with stats.timed("revocation.purge"):
+            async with db_connection() as conn:
+                repo = RevocationRepository(conn)
+                await repo.purge(now)
+                await conn.commit()
+                rows = await repo.ids()
+        self._revoked = {_key(row[0]) for row in rows}
+        self._rebuild(max(REVOCATION_BLOOM_CAPACITY, len(self._revoked) * 2))
+
+    # O(1), no db: claims are the decoded token payload
+    def is_revoked(self, claims: dict) -> bool:
+        jti = claims.get("jti")
+        if jti is not None:
+            key = _key(jti)
+            if key in self._bloom:
+                if key in self._revoked:
+                    self.rejected += 1
+                    return True
+                self.bloom_false_positives += 1
+        cutoff = self._cutoffs.get(claims.get("sub"))
+        if cutoff is not None:
+            # legacy tokens have no iat and are treated as issued before any cutoff
+            iat = claims.get("iat")
+            if iat is None or int(iat) <= cutoff:
+                self.rejected += 1
+                return True
+        return False
+
+    # revoke a single token, expires_at lets the row be purged once the token is dead anyway
+    async def revoke(self, jti: str, username: str | None, expires_at: datetime):
+        async with db_connection() as conn:
+            await RevocationRepository(conn).insert(jti, username, expires_at, datetime.utcnow())
+            await conn.commit()
+        self._add(_key(jti))
+        bus.publish("revocation.jti", jti)
+
+    # revoke every token of a user issued at or before `before` (default now). a cutoff only ever moves
+    # forward, in the db and here, the same as the other workers apply it
+    async def revoke_user(self, username: str, before: datetime | None = None):
+        now = datetime.utcnow()
+        before = before or now
+        async with db_connection() as conn:
+            await RevocationRepository(conn).raise_cutoff(username, before, now)
+            await conn.commit()
+        self._raise_cutoff(username, _epoch(before))
+        bus.publish("revocation.cutoff", [username, self._cutoffs[username]])
+
+    async def _run(self):
+        since_purge = 0.0
+        while True:
+            await asyncio.sleep(REVOCATION_REFRESH_SECONDS)
+            since_purge += REVOCATION_REFRESH_SECONDS
+            try:
+                if since_purge >= REVOCATION_PURGE_SECONDS:
+                    since_purge = 0.0
+                    await self.purge()
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Failed to refresh revocation list: {e}", exc_info=True)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self):
+        info = {
+            "revoked_ids": len(self._revoked),
+            "user_cutoffs": len(self._cutoffs),
+            "bloom_bytes": self._bloom.nbytes,
+            "bloom_hashes": self._bloom.hashes,
+            "rejected": self.rejected,
+            "bloom_false_positives": self.bloom_false_positives,
+        }
+        info.update(stats.snapshot("revocation."))
+        return info
+
+revocations = RevocationList()
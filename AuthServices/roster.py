@@ -0,0 +1,79 @@
+import os
+import uuid
+from fastapi import Request, Response
+import bus
+import serialization
+
+# etag prefix so etags from before a restart never match, serve.py gives all its workers the same one
+_BOOT_ID = os.getenv("AUTHSVC_LAUNCH_ID") or uuid.uuid4().hex[:12]
+
+# roster versions keyed by (system, role), None acts as a wildcard. versions are (lamport clock, worker id)
+# stamps merged by max, so every worker that has seen the same bumps serves the same etag
+_ZERO = (0, "")
+_clock = 0
+_versions: dict[tuple, tuple[int, str]] = {}
+_epoch = _ZERO
+_bodies = {}
+
+def _stamp() -> tuple[int, str]:
+    global _clock
+    _clock += 1
+    return (_clock, bus.WORKER_ID)
+
+def _apply(system: str | None, role: str | None, stamp: tuple[int, str]):
+    global _clock
+    _clock = max(_clock, stamp[0])
+    for key in {(None, None), (None, role), (system, None), (system, role)}:
+        if stamp > _versions.get(key, _ZERO):
+            _versions[key] = stamp
+
+def _apply_all(stamp: tuple[int, str]):
+    global _clock, _epoch
+    _clock = max(_clock, stamp[0])
+    _epoch = max(_epoch, stamp)
+
+# call whenever a user with this system/role is created, changed or disabled
+def bump(system: str | None, role: str | None):
+    stamp = _stamp()
+    _apply(system, role, stamp)
+    bus.publish("roster.bump", [system, role, stamp], retain=f"roster:{system}:{role}", version=stamp)
+
+# call when the affected system/role is unknown
+def bump_all():
+    stamp = _stamp()
+    _apply_all(stamp)
+    bus.publish("roster.bump_all", stamp, retain="roster:*", version=stamp)
+
+bus.subscribe("roster.bump", lambda data: _apply(data[0], data[1], tuple(data[2])))
+bus.subscribe("roster.bump_all", lambda data: _apply_all(tuple(data)))
+
+def version(system: str | None = None, role: str | None = None) -> str:
+    clock, worker = max(_epoch, _versions.get((system, role), _ZERO))
+    return f"{clock}.{worker}" if worker else "0"
+
+def make_etag(scope: str, ver: str) -> str:
+    return f'"{_BOOT_ID}-{scope}-{ver}"'
+
+def not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in header.split(",")]
+    return "*" in tags or etag in tags
+
+# serve a roster from the versioned cache, loading it only when the version moved
+async def respond(request: Request, system: str | None, role: str | None, load) -> Response:
+    ver = version(system, role)
+    scope = f"{system or '*'}.{role or '*'}"
+    etag = make_etag(scope, ver)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    cached = _bodies.get(scope)
+    if cached is not None and cached[0] == ver:
+        body = cached[1]
+    else:
+        body = serialization.dumps(await load())
+        _bodies[scope] = (ver, body)
+    return Response(content=body, media_type="application/json", headers=headers)
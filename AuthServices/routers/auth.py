@@ -1,25 +1,43 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel
-from datetime import datetime, timedelta
-from jose import JWTError, jwt
-from passlib.context import CryptContext
-import aioodbc
-from database import get_db_connection  
+from datetime import datetime, timedelta, timezone
+from jose import JWTError
+from database import db_connection, pool_stats
+from repositories import UserRepository
+import hashing
+import stats
+import lockout
+import roster
+import search
+import signing
+import media
+import mailer
+import reset_tokens
+import startup
+import bus
+from revocation import revocations
+from cache import TTLCache
 import os
 import uuid
-from fastapi import BackgroundTasks
 from email.message import EmailMessage
 from dotenv import load_dotenv
 from pydantic import EmailStr
 from typing import List
+import asyncio
+import logging
 
 load_dotenv()
 
-# jwt config
-SECRET_KEY = "15882913506880857248f72d1dbc38dd7d2f8f352786563ef5f23dc60987c632"
-ALGORITHM = "HS256"
+logger = logging.getLogger(__name__)
+
+# jwt config, signing keys live in signing.py
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+CASHIER_TOKEN_EXPIRE = timedelta(days=365 * 10)
+
+# principal cache config
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", 10000))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", 60))
 
 router = APIRouter()
 
@@ -31,6 +49,11 @@ class Token(BaseModel):
 class TokenData(BaseModel):
     username: str | None = None
 
+class RevokeRequest(BaseModel):
+    jti: str | None = None
+    username: str | None = None
+    before: datetime | None = None
+
 class User(BaseModel):
     userId: int | None = None
     username: str
@@ -42,43 +65,24 @@ class UserInDB(User):
     hashed_password: str
     system: str
 
-# hash password
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
-# email helper for forgor pass
-def send_reset_email(email_to: str, reset_link: str):
-    SMTP_SERVER = os.getenv("SMTP_SERVER")
-    SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
-    SMTP_USERNAME = os.getenv("SMTP_USERNAME")
-    SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
-    EMAIL_FROM = os.getenv("EMAIL_FROM")
+# resolved users keyed by username, invalidated whenever a user row changes
+principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL, shared_as="principal")
 
+# email helper for forgor pass, queued on the pooled smtp dispatcher
+def send_reset_email(email_to: str, reset_link: str):
     msg = EmailMessage()
     msg['Subject'] = "Password Reset Request"
-    msg['From'] = EMAIL_FROM
+    msg['From'] = os.getenv("EMAIL_FROM")
     msg['To'] = email_to
     msg.set_content(f"Please click the following link to reset your password:\n\n{reset_link}\n\nIf you did not request this, please ignore this email.")
-
-    try:
-        import smtplib
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(SMTP_USERNAME, SMTP_PASSWORD)
-            server.send_message(msg)
-    except Exception as e:
-        print(f"Error sending email: {e}")
+    return mailer.dispatcher.enqueue(msg)
 
 # helper to get user from db
 async def get_users_from_db(username: str):
-    conn = await get_db_connection()
-    cursor = await conn.cursor()
-    await cursor.execute(
-        '''SELECT Username, UserPassword, UserRole, isDisabled, System FROM Users WHERE Username = ? AND isDisabled = 0''',
-        (username,)
-    )
-    user_rows = await cursor.fetchall()
-    await conn.close()
+    async with db_connection() as conn:
+        user_rows = await UserRepository(conn).auth_rows(username)
 
     users = []
     for row in user_rows:
@@ -92,78 +96,76 @@ async def get_users_from_db(username: str):
             ))
     return users
 
-# helper to check lockout status
+# helper to check lockout status, answered from the in-memory lockout engine
 async def check_lockout(username: str):
-    conn = await get_db_connection()
-    cursor = await conn.cursor()
-    await cursor.execute('SELECT Attempts, IsLockedOut, LockoutUntil FROM FailedLogins WHERE Username = ?', (username,))
-    row = await cursor.fetchone()
-    await cursor.close()
-    await conn.close()
-    if not row:
-        return False, 0, None
-    attempts, is_locked, lockout_until = row
-    if is_locked and lockout_until and datetime.utcnow() < lockout_until:
-        return True, attempts, (lockout_until - datetime.utcnow()).total_seconds()
-    elif is_locked:
-        # unlock after lockout period
-        conn = await get_db_connection()
-        cursor = await conn.cursor()
-        await cursor.execute('UPDATE FailedLogins SET IsLockedOut=0, Attempts=0, LockoutUntil=NULL WHERE Username=?', (username,))
-        await conn.commit()
-        await cursor.close()
-        await conn.close()
-        return False, 0, None
-    return False, attempts, None
+    return lockout.engine.check(username)
 
 # hash pass
-def get_password_hash(password: str):
-    return pwd_context.hash(password)
+async def get_password_hash(password: str):
+    return await hashing.hash_password(password)
 
 # ensure admin exists on startup
 async def create_admin_user():
     admin_user = await get_users_from_db('superadmin')
     if not admin_user:
-        hashed_password = get_password_hash('superadmin123')
-        conn = await get_db_connection()
-        cursor = await conn.cursor()
-        try:
-            await cursor.execute(
-                '''INSERT INTO Users (UserPassword, Email, UserRole, isDisabled, System, Username, PhoneNumber, FirstName, MiddleName, LastName, Suffix) 
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                (hashed_password, 'superadmin@example.com', 'superadmin' ,  0,  'AUTH', 'superadmin', '', 'Super', '', 'Admin', '',)
+        hashed_password = await get_password_hash('superadmin123')
+        algorithm, cost = hashing.describe(hashed_password)
+        async with db_connection() as conn:
+            await UserRepository(conn).insert(
+                (hashed_password, algorithm, cost, 'superadmin@example.com', 'superadmin', 0, datetime.utcnow(), 'AUTH', 'superadmin', '', 'Super', '', 'Admin', '', None, None)
             )
             await conn.commit()
-            print("Super Admin created.")
-        finally:
-            await cursor.close()
-            await conn.close()
+        # same follow-up as /users/create, the search index may already be loaded and the roster cached
+        principal_cache.invalidate('superadmin')
+        roster.bump('AUTH', 'superadmin')
+        await search.index.refresh(usernames=['superadmin'])
+        print("Super Admin created.")
     else:
         print("Super Admin already exists.")
 
-# run on startup
-@router.on_event("startup")
-async def on_startup():
-    await create_admin_user()
-
 # verify password
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password, hashed_password):
+    return await hashing.verify_password(plain_password, hashed_password)
+
+_rehash_tasks: set[asyncio.Task] = set()
+
+# store the password under the current hashing policy, skipped if the hash changed since it was read
+async def rehash_password(username: str, password: str, old_hash: str):
+    try:
+        new_hash = await hashing.hash_password(password)
+        algorithm, cost = hashing.describe(new_hash)
+        async with db_connection() as conn:
+            updated = await UserRepository(conn).replace_password_hash(username, old_hash, new_hash, algorithm, cost)
+            await conn.commit()
+        principal_cache.invalidate(username)
+        stats.incr("hash.rehashed", max(updated, 0))
+    except hashing.HashQueueFull:
+        # busy, the next login tries again
+        stats.incr("hash.rehash_skipped")
+    except Exception as e:
+        logger.error(f"Failed to rehash password for {username}: {e}", exc_info=True)
 
-# authenticate user
-async def authenticate_user(username: str, password: str):
-    users = await get_users_from_db(username)
+# authenticate user, optionally against already fetched user rows
+async def authenticate_user(username: str, password: str, users: List[UserInDB] | None = None):
+    if users is None:
+        users = await get_users_from_db(username)
     for user in users:
-        if verify_password(password, user.hashed_password):
+        if await verify_password(password, user.hashed_password):
+            # upgrade outdated hashes after the response instead of making this login pay for a second hash
+            if hashing.needs_update(user.hashed_password):
+                task = asyncio.create_task(rehash_password(user.username, password, user.hashed_password))
+                _rehash_tasks.add(task)
+                task.add_done_callback(_rehash_tasks.discard)
             return user
     return None
 
 # create jwt token
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
-    expire = datetime.utcnow() + (expires_delta if expires_delta else timedelta(minutes=15))
-    to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    now = datetime.utcnow()
+    expire = now + (expires_delta if expires_delta else timedelta(minutes=15))
+    to_encode.update({"exp": expire, "iat": now, "jti": uuid.uuid4().hex})
+    return signing.sign(to_encode)
 
 # get current user from token
 async def get_current_user(token: str = Depends(oauth2_scheme)):
@@ -172,20 +174,27 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"}
     )
+    # until the revocation list is in memory a revoked token would look valid
+    if not revocations.loaded:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Service is starting, please retry.", headers={"Retry-After": "1"})
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = signing.verify(token)
         username: str = payload.get("sub")
-        if username is None:
+        if username is None or revocations.is_revoked(payload):
             raise credential_exception
         token_data = TokenData(username=username)
     except JWTError:
         raise credential_exception
 
-    users = await get_users_from_db(token_data.username)
-    if not users:
-        raise credential_exception
+    user = principal_cache.get(token_data.username)
+    if user is None:
+        users = await get_users_from_db(token_data.username)
+        if not users:
+            raise credential_exception
+        user = users[0]
+        principal_cache.set(token_data.username, user)
 
-    return users[0]
+    return user
 
 # validate active user
 async def get_current_active_user(current_user: UserInDB = Depends(get_current_user)):
@@ -204,16 +213,8 @@ def role_required(required_roles: List[str]):
 # get current user info
 @router.get("/users/me")
 async def get_current_user_info(current_user: UserInDB = Depends(get_current_active_user)):
-    conn = await get_db_connection()
-    cursor = await conn.cursor()
-    await cursor.execute("""
-        SELECT UserID, FirstName, MiddleName, LastName, Suffix, PhoneNumber
-        FROM Users
-        WHERE Username = ?
-    """, (current_user.username,))
-    row = await cursor.fetchone()
-    await cursor.close()
-    await conn.close()
+    async with db_connection() as conn:
+        row = await UserRepository(conn).names(current_user.username)
 
     if row:
         user_id, first, middle, last, suffix, phone = row
@@ -235,59 +236,58 @@ async def get_current_user_info(current_user: UserInDB = Depends(get_current_act
 
 # login endpoint — returns jwt token
 @router.post("/token", response_model=Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
+async def login_for_access_token(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
     print("Attempting to authenticate user:", form_data.username)
+    username = form_data.username
+    client_ip = request.client.host if request.client else None
+
+    with stats.timed("login.total"):
+        # phase 1: throttling and lockout, answered from memory
+        retry_after = lockout.engine.ip_retry_after(client_ip) if client_ip else 0
+        if retry_after:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=f"Too many failed login attempts. Try again in {retry_after} seconds.",
+                headers={"Retry-After": str(retry_after)}
+            )
+        is_locked, attempts, remaining = await check_lockout(username)
+        if is_locked:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=f"Account locked. Try again in {int(remaining)} seconds.",
+                headers={"WWW-Authenticate": "Bearer"}
+            )
+
+        # phase 2: user rows and password check
+        with stats.timed("login.fetch"):
+            users = await get_users_from_db(username)
+        with stats.timed("login.verify"):
+            user = await authenticate_user(username, form_data.password, users)
+
+        # phase 3: counters live in memory and reach FailedLogins in the next write-behind batch
+        with stats.timed("login.record"):
+            if not user:
+                if lockout.engine.record_failure(username, client_ip):
+                    async with db_connection() as conn:
+                        await UserRepository(conn).disable_by_username(username)
+                        await conn.commit()
+                    principal_cache.invalidate(username)
+                    roster.bump_all()
+                    await search.index.refresh(usernames=[username])
+            else:
+                lockout.engine.record_success(username)
 
-    # check lockout status
-    is_locked, attempts, remaining = await check_lockout(form_data.username)
-    if is_locked:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"Account locked. Try again in {int(remaining)} seconds.",
-            headers={"WWW-Authenticate": "Bearer"}
-        )
-    
-    user = await authenticate_user(form_data.username, form_data.password)
     if not user:
-        print("Authentication failed for user:", form_data.username)
-        # log failed attempt
-        conn = await get_db_connection()
-        cursor = await conn.cursor()
-        await cursor.execute('SELECT Attempts FROM FailedLogins WHERE Username = ?', (form_data.username,))
-        row = await cursor.fetchone()
-        if not row:
-            await cursor.execute('INSERT INTO FailedLogins (Username, Attempts, LastAttempt) VALUES (?, ?, ?)',
-                                 (form_data.username, 1, datetime.utcnow()))
-        elif row[0] >= 4:
-            lockout_until = datetime.utcnow() + timedelta(minutes=15)
-            await cursor.execute('UPDATE FailedLogins SET Attempts=?, IsLockedOut=?, LockoutUntil=? WHERE Username=?',
-                                 (5, 1, lockout_until, form_data.username))
-            await cursor.execute('UPDATE Users SET isDisabled = 1 WHERE Username = ?', (form_data.username,))
-        else:
-            await cursor.execute('UPDATE FailedLogins SET Attempts=Attempts+1, LastAttempt=? WHERE Username=?',
-                                 (datetime.utcnow(), form_data.username))
-        await conn.commit()
-        await cursor.close()
-        await conn.close()
-    
+        print("Authentication failed for user:", username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"}
         )
-    
-    # successful login resets failed attempts
-    conn = await get_db_connection()
-    cursor = await conn.cursor()
-    await cursor.execute('UPDATE FailedLogins SET Attempts=0, IsLockedOut=0, LockoutUntil=NULL WHERE Username=?', (form_data.username,))
-    await cursor.execute('UPDATE Users SET isDisabled = 0 WHERE Username = ?', (form_data.username,))
-    await conn.commit()
-    await cursor.close()
-    await conn.close()
 
     # long expiration for cashiers
     if user.userRole == "cashier":
-        access_token_expires = timedelta(days=365 * 10) 
+        access_token_expires = CASHIER_TOKEN_EXPIRE
     else:
         access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
 
@@ -299,6 +299,45 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     print("Authentication successful for:", user.username)
     return {"access_token": access_token, "token_type": "bearer"}
 
+# public signing keys so other services can verify tokens without calling us
+@router.get("/.well-known/jwks.json")
+async def jwks(request: Request):
+    body, etag = signing.jwks()
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={signing.JWKS_MAX_AGE}"}
+    if roster.not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# publish a new signing key now, it starts signing once the publish-ahead window has passed
+@router.post("/keys/rotate", dependencies=[Depends(role_required(["superadmin"]))])
+async def rotate_signing_key():
+    return signing.rotate()
+
+# revoke the token used for this request
+@router.post("/logout")
+async def logout(token: str = Depends(oauth2_scheme), current_user: UserInDB = Depends(get_current_user)):
+    payload = signing.verify(token)
+    if payload.get("jti"):
+        await revocations.revoke(payload["jti"], current_user.username, datetime.utcfromtimestamp(payload["exp"]))
+    else:
+        # legacy tokens have no jti, cutting off the whole user is the only option
+        await revocations.revoke_user(current_user.username)
+    return {"message": "Token revoked."}
+
+# revoke one token by jti, or every token of a user issued before a point in time
+@router.post("/revoke", dependencies=[Depends(role_required(["superadmin"]))])
+async def revoke_tokens(request: RevokeRequest):
+    if request.jti:
+        await revocations.revoke(request.jti, request.username, datetime.utcnow() + CASHIER_TOKEN_EXPIRE)
+        return {"message": f"Token {request.jti} revoked."}
+    if request.username:
+        before = request.before
+        if before is not None and before.tzinfo is not None:
+            before = before.astimezone(timezone.utc).replace(tzinfo=None)
+        await revocations.revoke_user(request.username, before)
+        return {"message": f"Tokens of {request.username} revoked."}
+    raise HTTPException(status_code=400, detail="Provide a jti or a username.")
+
 # admin-only test endpoint
 @router.get("/superadmin-only", dependencies=[Depends(role_required(["superadmin"]))])
 async def admin_only_route():
@@ -306,82 +345,58 @@ async def admin_only_route():
 
 # forgor password
 @router.post("/forgot-password")
-async def forgot_password(email: EmailStr, background_tasks: BackgroundTasks):
-    conn = await get_db_connection()
-    cursor = await conn.cursor()
-    await cursor.execute(
-        "SELECT Username FROM Users WHERE Email = ? AND UserRole = 'user' AND System = 'OOS' AND isDisabled = 0",
-        (email,)
-    )
-    user = await cursor.fetchone()
+async def forgot_password(email: EmailStr):
+    async with db_connection() as conn:
+        user = await UserRepository(conn).oos_username_by_email(email)
     if not user:
-        await cursor.close()
-        await conn.close()
         return {"message": "If this email is registered, a reset link has been sent."}
 
-    # generate token and store in DB 
-    reset_token = str(uuid.uuid4())
-    expires_at = datetime.utcnow() + timedelta(minutes=int(os.getenv("RESET_TOKEN_EXP_MINUTES", 15)))
-    await cursor.execute(
-        "INSERT INTO tokensReset (email, token, expires_at) VALUES (?, ?, ?)",
-        (email, reset_token, expires_at.strftime("%Y-%m-%d %H:%M:%S"))
-    )
-    await conn.commit()
-    await cursor.close()
-    await conn.close()
-
+    # only the token hash is stored
+    reset_token = await reset_tokens.store.issue(email)
     reset_link = f"{os.getenv('RESET_LINK_BASE')}?token={reset_token}&email={email}"
-    background_tasks.add_task(send_reset_email, email, reset_link)
+    send_reset_email(email, reset_link)
     return {"message": "If this email is registered, a reset link has been sent."}
 
 # reset password
 @router.post("/reset-password")
 async def reset_password(email: EmailStr, token: str, new_password: str):
-    conn = await get_db_connection()
-    cursor = await conn.cursor()
-    await cursor.execute(
-        "SELECT expires_at FROM tokensReset WHERE email = ? AND token = ?",
-        (email, token)
-    )
-    row = await cursor.fetchone()
-    if not row:
-        await cursor.close()
-        await conn.close()
+    # a bad token costs one indexed lookup, not a hash
+    if not await reset_tokens.store.check(email, token):
         raise HTTPException(status_code=400, detail="Invalid or expired token.")
 
-    expires_at = row[0]
-    if isinstance(expires_at, str):
-        expires_at = datetime.strptime(expires_at, "%Y-%m-%d %H:%M:%S")
-    if datetime.utcnow() > expires_at:
-        await cursor.execute("DELETE FROM tokensReset WHERE email = ? AND token = ?", (email, token))
-        await conn.commit()
-        await cursor.close()
-        await conn.close()
-        raise HTTPException(status_code=400, detail="Token expired.")
-
-    # update pass
-    hashed_password = pwd_context.hash(new_password)
-    await cursor.execute(
-        "UPDATE Users SET UserPassword = ? WHERE Email = ? AND UserRole = 'user' AND System = 'OOS' AND isDisabled = 0",
-        (hashed_password, email)
-    )
-    await cursor.execute("DELETE FROM tokensReset WHERE email = ?", (email,))
-    await conn.commit()
-    await cursor.close()
-    await conn.close()
+    # hashed before the token is spent, a full hash queue (503) leaves the link usable
+    hashed_password = await get_password_hash(new_password)
+    algorithm, cost = hashing.describe(hashed_password)
+
+    async def update_password(conn):
+        await UserRepository(conn).reset_oos_password(email, hashed_password, algorithm, cost)
+
+    # the token is spent in the same transaction as the password update, a failed update leaves it usable
+    if not await reset_tokens.store.consume(email, token, then=update_password):
+        raise HTTPException(status_code=400, detail="Invalid or expired token.")
     return {"message": "Password has been reset successfully."}
 
 # lockout status check
 @router.get("/lockout-status")
 async def lockout_status(username: str):
-    conn = await get_db_connection()
-    cursor = await conn.cursor()
-    await cursor.execute('SELECT Attempts, IsLockedOut, LockoutUntil FROM FailedLogins WHERE Username = ?', (username,))
-    row = await cursor.fetchone()
-    await cursor.close()
-    await conn.close()
-    if not row:
-        return {"failed_attempts": 0, "is_locked": False, "remaining_seconds": 0}
-    attempts, is_locked, lockout_until = row
-    remaining = int((lockout_until - datetime.utcnow()).total_seconds()) if is_locked and lockout_until else 0
-    return {"failed_attempts": attempts, "is_locked": bool(is_locked), "remaining_seconds": max(remaining, 0)}
\ No newline at end of file
+    lockout.engine.check(username)
+    return lockout.engine.status(username)
+
+# service stats for sizing the pool
+@router.get("/stats", dependencies=[Depends(role_required(["superadmin"]))])
+async def service_stats():
+    return {
+        "startup": startup.startup_stats(),
+        "db_pool": pool_stats(),
+        "hashing": hashing.hash_stats(),
+        "principal_cache": principal_cache.stats(),
+        "login": stats.snapshot("login."),
+        "lockout": lockout.engine.stats(),
+        "signing": signing.signing_stats(),
+        "revocation": revocations.stats(),
+        "media": media.media_stats(),
+        "mail": mailer.dispatcher.stats(),
+        "reset_tokens": reset_tokens.store.stats(),
+        "bus": bus.bus_stats(),
+        "search": search.index.stats(),
+    }
@@ -1,20 +1,52 @@
-from fastapi import APIRouter, HTTPException, Depends, status, Form, UploadFile, File
-import shutil, os
+from fastapi import APIRouter, HTTPException, Depends, status, Form, Query, Request, Response
+from fastapi.responses import ORJSONResponse
+import os
+import hashlib
+import csv, io, time
 from routers.auth import oauth2_scheme
 from datetime import datetime
-from database import get_db_connection 
-from routers.auth import get_current_active_user, role_required 
-import bcrypt
+from database import db_connection
+from repositories import UserRepository
+from serialization import Field, View
+from routers.auth import get_current_active_user, role_required, principal_cache
+import hashing
+import media
+import roster
+import search
+from revocation import revocations
 from typing import Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 import logging
 
+# set to false once every manager pin has a PinLookup value
+PIN_LEGACY_FALLBACK = os.getenv("PIN_LEGACY_FALLBACK", "true").lower() == "true"
+
+# list-users page size
+LIST_USERS_DEFAULT_LIMIT = int(os.getenv("LIST_USERS_DEFAULT_LIMIT", 100))
+LIST_USERS_MAX_LIMIT = int(os.getenv("LIST_USERS_MAX_LIMIT", 1000))
+
+# user search page size and longest accepted query
+USER_SEARCH_DEFAULT_LIMIT = int(os.getenv("USER_SEARCH_DEFAULT_LIMIT", 20))
+USER_SEARCH_MAX_LIMIT = int(os.getenv("USER_SEARCH_MAX_LIMIT", 200))
+USER_SEARCH_MAX_QUERY = int(os.getenv("USER_SEARCH_MAX_QUERY", 100))
+
+# bulk-create limits
+BULK_CREATE_MAX_ROWS = int(os.getenv("BULK_CREATE_MAX_ROWS", 5000))
+BULK_INSERT_BATCH_SIZE = int(os.getenv("BULK_INSERT_BATCH_SIZE", 500))
+
+# batch rider lookup limit
+RIDER_BATCH_MAX_IDS = int(os.getenv("RIDER_BATCH_MAX_IDS", 1000))
+
 # config logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# every active POS manager needs a pin of their own, verify-pin names the manager by pin alone
+PIN_TAKEN = "PIN is already used by another manager."
+PIN_SHARED = "This PIN belongs to more than one manager. Ask a superadmin to reset it."
+
 # models
 class PinVerificationRequest(BaseModel):
     pin: str
@@ -22,39 +54,132 @@ class PinVerificationRequest(BaseModel):
 class ManagerPinVerifyResponse(BaseModel):
     managerUsername: str
 
-# upload photo oos
-@router.post("/profile/upload-photo")
-async def upload_profile_photo(file: UploadFile = File(...), current_user=Depends(get_current_active_user)):
-    upload_dir = "uploads/profile_pictures"
-    os.makedirs(upload_dir, exist_ok=True)
-    file_location = os.path.join(upload_dir, file.filename)
+class RiderBatchRequest(BaseModel):
+    ids: list[int]
+
+# views, ?fields= picks keys out of these and only their columns are selected
+def _full_name(*parts):
+    return ' '.join(part for part in parts if part)
+
+USER_LIST_VIEW = View({
+    "userID": Field(("UserID",)),
+    "fullName": Field(("FirstName", "MiddleName", "LastName", "Suffix"), _full_name),
+    "userRole": Field(("UserRole",)),
+    "phoneNumber": Field(("PhoneNumber",)),
+    "id": Field(("UserID",), legacy=True),
+    "role": Field(("UserRole",), legacy=True),
+    "phone": Field(("PhoneNumber",), legacy=True),
+    "firstName": Field(("FirstName",)),
+    "middleName": Field(("MiddleName",)),
+    "lastName": Field(("LastName",)),
+    "suffix": Field(("Suffix",)),
+    "username": Field(("Username",)),
+    "email": Field(("Email",)),
+    "createdAt": Field(("CreatedAt",)),
+    "system": Field(("System",)),
+    "isDisabled": Field(("isDisabled",), bool),
+}, key_columns=("UserID",))
+
+PROFILE_VIEW = View({
+    "userID": Field(("UserID",)),
+    "username": Field(("Username",)),
+    "firstName": Field(("FirstName",)),
+    "middleName": Field(("MiddleName",)),
+    "lastName": Field(("LastName",)),
+    "email": Field(("Email",)),
+    "phoneNumber": Field(("PhoneNumber",)),
+    "block": Field(("Block",)),
+    "street": Field(("Street",)),
+    "subdivision": Field(("Subdivision",)),
+    "city": Field(("City",)),
+    "province": Field(("Province",)),
+    "landmark": Field(("Landmark",)),
+    "birthday": Field(("Birthday",)),
+    "profileImage": Field(("ProfileImage",), lambda name: media.profile_image_urls(name)[0]),
+    "profileImageVariants": Field(("ProfileImage",), lambda name: media.profile_image_urls(name)[1]),
+})
+
+FIELDS_QUERY = "Comma-separated keys to return, only their columns are read"
+COMPACT_QUERY = "Leave out the legacy duplicate keys (id, role, phone)"
+
+class BulkUserRow(BaseModel):
+    firstName: str
+    middleName: Optional[str] = None
+    lastName: str
+    suffix: Optional[str] = None
+    username: str
+    password: str
+    email: str
+    phoneNumber: Optional[str] = None
+    userRole: str
+    system: str
+    pin: Optional[str] = None
+
+# upload photo oos, streamed to disk under its content hash
+@router.post(
+    "/profile/upload-photo",
+    openapi_extra={"requestBody": {"content": {"multipart/form-data": {"schema": {
+        "type": "object", "required": ["file"], "properties": {"file": {"type": "string", "format": "binary"}}
+    }}}}}
+)
+async def upload_profile_photo(request: Request, current_user=Depends(get_current_active_user)):
     try:
-        with open(file_location, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        filename, size, created = await media.receive_image(request)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Failed to upload file: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to upload file")
     # Update user's profileImage in database
-    conn = None
-    cursor = None
     try:
-        conn = await get_db_connection()
-        cursor = await conn.cursor()
-        # Use current_user.username to get UserID from DB
-        await cursor.execute("SELECT UserID FROM Users WHERE Username = ?", (current_user.username,))
-        row = await cursor.fetchone()
-        if not row:
-            raise HTTPException(status_code=404, detail="User not found")
-        user_id = row[0]
-        await cursor.execute("UPDATE Users SET profileImage = ? WHERE UserID = ?", (file.filename, user_id))
-        await conn.commit()
+        async with db_connection() as conn:
+            if await UserRepository(conn).set_profile_image(current_user.username, filename) == 0:
+                raise HTTPException(status_code=404, detail="User not found")
+            await conn.commit()
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Failed to update profile image in DB: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to update profile image")
-    finally:
-        if cursor: await cursor.close()
-        if conn: await conn.close()
-    return {"url": f"/uploads/profile_pictures/{file.filename}", "message": "File uploaded successfully"}
+    # the name is the content hash, a failed build of the same bytes is not worth repeating
+    media.schedule_variants(filename, retry=created)
+    return {"url": f"/uploads/profile_pictures/{filename}", "size": size, "deduplicated": not created, "message": "File uploaded successfully"}
+
+# role, system, password and pin rules shared by create and bulk-create
+def validate_new_user(userRole: str, system: str, username: str, password: str, pin: Optional[str]):
+    if userRole not in ['admin', 'manager', 'staff', 'cashier', 'rider', 'super admin', 'user']:
+        raise HTTPException(status_code=400, detail="Invalid role")
+    if system not in ['IMS', 'POS', 'OOS', 'AUTH']:
+        raise HTTPException(status_code=400, detail="Invalid system")
+    
+    if not password.strip() or len(password.strip()) < 12: 
+        raise HTTPException(status_code=400, detail="Password is required and must be at least 12 characters")
+    if not username.strip():
+        raise HTTPException(status_code=400, detail="Username is required")
+
+    if userRole == 'manager' and system == 'POS':
+        if not pin or not pin.strip() or not pin.isdigit() or len(pin) != 4:
+            raise HTTPException(status_code=400, detail="A 4-digit PIN is required for POS Managers.")
+
+# the managers among these whose bcrypt pin matches, for rows that have no PinLookup to find them by
+async def matching_pin_managers(pin: str, managers) -> list:
+    matches = []
+    for manager in managers:
+        try:
+            if await hashing.verify_password(pin, manager.Pin):
+                matches.append(manager)
+        except ValueError:
+            logger.warning(f"Skipping PIN check for manager '{manager.Username}' due to an invalid hash format in the database.")
+    return matches
+
+# pin_taken, plus a bcrypt check over the managers not yet migrated to PinLookup while PIN_LEGACY_FALLBACK is on
+async def pin_in_use(users: UserRepository, pin: str, lookup: str, exclude_id: int | None = None) -> bool:
+    if await users.pin_taken(lookup, exclude_id=exclude_id):
+        return True
+    if not PIN_LEGACY_FALLBACK:
+        return False
+    legacy = [m for m in await users.legacy_pin_managers() if m.UserID != exclude_id]
+    return bool(await matching_pin_managers(pin, legacy))
 
 # create users
 @router.post('/create', dependencies=[Depends(role_required(["superadmin"]))])
@@ -71,151 +196,356 @@ async def create_user(
     system: str = Form(...),
     pin: Optional[str] = Form(None),
 ):
-    if userRole not in ['admin', 'manager', 'staff', 'cashier', 'rider', 'super admin', 'user']:
-        raise HTTPException(status_code=400, detail="Invalid role")
-    if system not in ['IMS', 'POS', 'OOS', 'AUTH']:
-        raise HTTPException(status_code=400, detail="Invalid system")
-    
-    if not password.strip() or len(password.strip()) < 12: 
-        raise HTTPException(status_code=400, detail="Password is required and must be at least 12 characters")
-    if not username.strip():
-        raise HTTPException(status_code=400, detail="Username is required")
+    validate_new_user(userRole, system, username, password, pin)
 
     hashed_pin = None
+    pin_lookup = None
     if userRole == 'manager' and system == 'POS':
-        if not pin or not pin.strip() or not pin.isdigit() or len(pin) != 4:
-            raise HTTPException(status_code=400, detail="A 4-digit PIN is required for POS Managers.")
-        hashed_pin = bcrypt.hashpw(pin.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        hashed_pin = await hashing.hash_password(pin)
+        pin_lookup = hashing.pin_lookup(pin)
 
-    conn = None 
-    cursor = None
     try:
-        conn = await get_db_connection()
-        cursor = await conn.cursor()
+        async with db_connection() as conn:
+            users = UserRepository(conn)
+
+            if await users.email_taken(email):
+                raise HTTPException(status_code=400, detail="Email is already used")
+
+            if await users.username_taken(username):
+                raise HTTPException(status_code=400, detail=f"Username '{username}' is already taken.")
 
-        await cursor.execute("SELECT 1 FROM Users WHERE Email = ? AND isDisabled = 0", (email,))
-        if await cursor.fetchone():
-            raise HTTPException(status_code=400, detail="Email is already used")
+            if pin_lookup and await pin_in_use(users, pin, pin_lookup):
+                raise HTTPException(status_code=400, detail=PIN_TAKEN)
 
-        await cursor.execute("SELECT 1 FROM Users WHERE Username = ? AND isDisabled = 0", (username,))
-        if await cursor.fetchone():
-            raise HTTPException(status_code=400, detail=f"Username '{username}' is already taken.")
+            hashed_password = await hashing.hash_password(password)
+            algorithm, cost = hashing.describe(hashed_password)
 
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-        
-        await cursor.execute('''
-            INSERT INTO Users (UserPassword, Email, UserRole, isDisabled, CreatedAt, System, Username, PhoneNumber, FirstName, MiddleName, LastName, Suffix, Pin)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (hashed_password, email, userRole, 0, datetime.utcnow(), system, username, phoneNumber, firstName, middleName, lastName, suffix, hashed_pin))
-        await conn.commit()
+            await users.insert((hashed_password, algorithm, cost, email, userRole, 0, datetime.utcnow(), system, username, phoneNumber, firstName, middleName, lastName, suffix, hashed_pin, pin_lookup))
+            await conn.commit()
+            principal_cache.invalidate(username)
+            roster.bump(system, userRole)
 
     except HTTPException: 
         raise
     except Exception as e:
         logger.error(f"Error in create_user: {e}", exc_info=True) 
         raise HTTPException(status_code=500, detail=f"An internal server error occurred during user creation.")
-    finally:
-        if cursor: await cursor.close()
-        if conn: await conn.close()
 
+    await search.index.refresh(usernames=[username])
     return {'message': f'{userRole.capitalize()} created successfully!'}
 
-# get users
+# bulk import, accepts a JSON array or a CSV upload with the same columns as /create
+@router.post('/bulk-create', dependencies=[Depends(role_required(["superadmin"]))])
+async def bulk_create_users(request: Request):
+    started = time.perf_counter()
+    timings = {}
+
+    content_type = request.headers.get("content-type", "")
+    try:
+        if content_type.startswith("multipart/form-data"):
+            form = await request.form()
+            upload = form.get("file")
+            if upload is None or isinstance(upload, str):
+                raise HTTPException(status_code=400, detail="Upload a CSV file in the 'file' field.")
+            raw_rows = list(csv.DictReader(io.StringIO((await upload.read()).decode('utf-8-sig'))))
+        elif content_type.startswith("text/csv"):
+            raw_rows = list(csv.DictReader(io.StringIO((await request.body()).decode('utf-8-sig'))))
+        else:
+            raw_rows = await request.json()
+            if not isinstance(raw_rows, list):
+                raise HTTPException(status_code=400, detail="Expected a JSON array of users.")
+    except HTTPException:
+        raise
+    except Exception:
+        raise HTTPException(status_code=400, detail="Could not parse the uploaded users.")
+
+    if len(raw_rows) > BULK_CREATE_MAX_ROWS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_CREATE_MAX_ROWS} users can be imported at once.")
+
+    # validate every row with the same rules as /create
+    t = time.perf_counter()
+    results = []
+    pending = []
+    seen_usernames = set()
+    seen_emails = set()
+    seen_pins = set()
+    for i, raw in enumerate(raw_rows):
+        result = {"row": i, "username": raw.get("username") if isinstance(raw, dict) else None}
+        results.append(result)
+        try:
+            if not isinstance(raw, dict):
+                raise HTTPException(status_code=400, detail="Each row must be an object.")
+            user = BulkUserRow(**{k: (v if v != '' else None) for k, v in raw.items() if k in BulkUserRow.model_fields})
+            validate_new_user(user.userRole, user.system, user.username, user.password, user.pin)
+            if user.username in seen_usernames:
+                raise HTTPException(status_code=400, detail=f"Username '{user.username}' appears more than once in this import.")
+            if user.email in seen_emails:
+                raise HTTPException(status_code=400, detail="Email appears more than once in this import.")
+            pin_lookup = hashing.pin_lookup(user.pin) if user.userRole == 'manager' and user.system == 'POS' else None
+            if pin_lookup in seen_pins:
+                raise HTTPException(status_code=400, detail="PIN appears more than once in this import.")
+        except HTTPException as e:
+            result.update(status="error", detail=e.detail)
+            continue
+        except ValidationError as e:
+            result.update(status="error", detail=", ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+            continue
+        seen_usernames.add(user.username)
+        seen_emails.add(user.email)
+        if pin_lookup:
+            seen_pins.add(pin_lookup)
+        pending.append((result, user))
+    timings["validate_ms"] = (time.perf_counter() - t) * 1000
+
+    try:
+        # one set-based duplicate check for the whole import
+        t = time.perf_counter()
+        if pending:
+            pin_lookups = {u.username: hashing.pin_lookup(u.pin) for _, u in pending if u.userRole == 'manager' and u.system == 'POS'}
+            async with db_connection() as conn:
+                users = UserRepository(conn)
+                taken = await users.taken([u.username for _, u in pending], [u.email for _, u in pending])
+                taken_pins = await users.pins_taken(list(pin_lookups.values())) if pin_lookups else set()
+                legacy = await users.legacy_pin_managers() if pin_lookups and PIN_LEGACY_FALLBACK else []
+            # pins of managers without a PinLookup are checked by hash, after the connection is back in the pool
+            if legacy:
+                for _, user in pending:
+                    lookup = pin_lookups.get(user.username)
+                    if lookup and lookup not in taken_pins and await matching_pin_managers(user.pin, legacy):
+                        taken_pins.add(lookup)
+            taken_usernames = {r[0] for r in taken}
+            taken_emails = {r[1] for r in taken}
+            still_pending = []
+            for result, user in pending:
+                if user.email in taken_emails:
+                    result.update(status="error", detail="Email is already used")
+                elif user.username in taken_usernames:
+                    result.update(status="error", detail=f"Username '{user.username}' is already taken.")
+                elif pin_lookups.get(user.username) in taken_pins:
+                    result.update(status="error", detail=PIN_TAKEN)
+                else:
+                    still_pending.append((result, user))
+            pending = still_pending
+        timings["duplicate_check_ms"] = (time.perf_counter() - t) * 1000
+
+        # hash passwords and pins across the process pool, without holding a connection
+        t = time.perf_counter()
+        secrets = [u.password for _, u in pending] + [u.pin for _, u in pending if u.userRole == 'manager' and u.system == 'POS']
+        hashes = iter(await hashing.hash_many(secrets))
+        password_hashes = [next(hashes) for _ in pending]
+        rows = []
+        now = datetime.utcnow()
+        for (result, user), hashed_password in zip(pending, password_hashes):
+            hashed_pin, pin_lookup = None, None
+            if user.userRole == 'manager' and user.system == 'POS':
+                hashed_pin, pin_lookup = next(hashes), hashing.pin_lookup(user.pin)
+            rows.append((hashed_password, *hashing.describe(hashed_password), user.email, user.userRole, 0, now, user.system, user.username, user.phoneNumber,
+                         user.firstName, user.middleName, user.lastName, user.suffix, hashed_pin, pin_lookup))
+        timings["hash_ms"] = (time.perf_counter() - t) * 1000
+
+        # batched inserts, fast_executemany sends each batch's parameter array in one round trip
+        t = time.perf_counter()
+        if rows:
+            async with db_connection() as conn:
+                users = UserRepository(conn)
+                for start in range(0, len(rows), BULK_INSERT_BATCH_SIZE):
+                    batch = rows[start:start + BULK_INSERT_BATCH_SIZE]
+                    batch_results = [r for r, _ in pending[start:start + BULK_INSERT_BATCH_SIZE]]
+                    # all or nothing per batch, so the status reported for each row is what happened to it
+                    try:
+                        async with conn.transaction():
+                            await users.insert_many(batch)
+                    except Exception as e:
+                        logger.error(f"Error inserting bulk-create batch at row {start}: {e}", exc_info=True)
+                        for result in batch_results:
+                            result.update(status="error", detail="Insert failed for this batch.")
+                        continue
+                    for result in batch_results:
+                        result["status"] = "created"
+        timings["insert_ms"] = (time.perf_counter() - t) * 1000
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in bulk_create_users: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="An internal server error occurred during bulk user creation.")
+
+    for _, user in pending:
+        principal_cache.invalidate(user.username)
+    for system, role in {(u.system, u.userRole) for _, u in pending}:
+        roster.bump(system, role)
+    created_usernames = [r["username"] for r in results if r.get("status") == "created"]
+    if created_usernames:
+        await search.index.refresh(usernames=created_usernames)
+
+    total = time.perf_counter() - started
+    created = sum(1 for r in results if r.get("status") == "created")
+    timings["total_ms"] = total * 1000
+    return {
+        "created": created,
+        "failed": len(results) - created,
+        "results": results,
+        "timings": {k: round(v, 2) for k, v in timings.items()},
+        "rowsPerSecond": round(created / total, 1) if total else None,
+    }
+
+# get users, keyset-paginated on UserID
 @router.get('/list-users', dependencies=[Depends(role_required(['superadmin']))])
-async def list_users():
-    conn = None
-    cursor = None
+async def list_users(
+    request: Request,
+    after: Optional[int] = Query(None, description="Return users with a UserID greater than this (the X-Next-Cursor of the previous page)"),
+    limit: int = Query(LIST_USERS_DEFAULT_LIMIT, ge=1, le=LIST_USERS_MAX_LIMIT),
+    role: Optional[str] = None,
+    system: Optional[str] = None,
+    is_disabled: Optional[bool] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    include_total: bool = False,
+    fields: Optional[str] = Query(None, description=FIELDS_QUERY),
+    compact: bool = Query(False, description=COMPACT_QUERY),
+):
+    # any user write bumps the roster version, so an unchanged version means an unchanged page
+    etag = roster.make_etag(f"list-{hashlib.sha1(str(request.query_params).encode()).hexdigest()[:12]}", roster.version())
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if roster.not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    projection = USER_LIST_VIEW.project(fields, compact)
+
+    filters = {}
+    if role is not None:
+        filters['role'] = role
+    if system is not None:
+        filters['system'] = system
+    if is_disabled is not None:
+        filters['is_disabled'] = 1 if is_disabled else 0
+    if created_from is not None:
+        filters['created_from'] = created_from
+    if created_to is not None:
+        filters['created_to'] = created_to
+
     try:
-        conn = await get_db_connection()
-        cursor = await conn.cursor()
-        await cursor.execute(''' 
-            SELECT UserID, Email, UserRole, isDisabled, CreatedAt, System, Username, PhoneNumber, FirstName, MiddleName, LastName, Suffix
-            FROM Users
-        ''')
-        users_db = await cursor.fetchall()
+        async with db_connection() as conn:
+            users = UserRepository(conn)
+            # one extra row tells us whether there is a next page
+            users_db = await users.page(filters, after, limit + 1, projection.columns)
+
+            if include_total:
+                headers["X-Total-Count"] = str(await users.count(filters))
     except Exception as e:
         logger.error(f"Error in list_users: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to retrieve user list.")
-    finally:
-        if cursor: await cursor.close()
-        if conn: await conn.close()
-
-    users_list = []
-    for u in users_db:
-        first_name = u[8]
-        middle_name = u[9]
-        last_name = u[10]
-        suffix = u[11]
-        name_parts = [first_name, middle_name, last_name, suffix]
-        full_name = ' '.join(part for part in name_parts if part)
-        
-        users_list.append({
-            "userID": u[0],
-            "fullName": full_name,
-            "userRole": u[2],
-            "phoneNumber": u[7],
-            "id": u[0],
-            "role": u[2],
-            "phone": u[7],
-            "firstName": first_name,
-            "middleName": middle_name,
-            "lastName": last_name,
-            "suffix": suffix,
-            "username": u[6],
-            "email": u[1],
-            "createdAt": u[4].isoformat() if u[4] else None,
-            "system": u[5],
-            "isDisabled": bool(u[3]),
-        })
-    return users_list
+
+    if len(users_db) > limit:
+        users_db = users_db[:limit]
+        # UserID is the view's key column, always selected first
+        headers["X-Next-Cursor"] = str(users_db[-1][0])
+
+    # returned as a response so fastapi's jsonable_encoder pass is skipped, orjson encodes the rows directly
+    return ORJSONResponse(projection.rows(users_db), headers=headers)
+
+# search users by username, email, phone or name, served from the in-memory search index.
+# ranked exact match, field prefix, name-part prefix, then substring, UserID order within each
+@router.get('/search', dependencies=[Depends(role_required(['superadmin']))])
+async def search_users(
+    q: str = Query("", max_length=USER_SEARCH_MAX_QUERY, description="Prefix or substring of a username, email, phone or full name; one or two characters match prefixes only"),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(USER_SEARCH_DEFAULT_LIMIT, ge=1, le=USER_SEARCH_MAX_LIMIT),
+    role: Optional[str] = None,
+    system: Optional[str] = None,
+    is_disabled: Optional[bool] = None,
+    fields: Optional[str] = Query(None, description=FIELDS_QUERY),
+    compact: bool = Query(False, description=COMPACT_QUERY),
+):
+    if not search.index.loaded:
+        raise HTTPException(status_code=503, detail="User search is still loading, try again shortly.", headers={"Retry-After": "1"})
+    projection = USER_LIST_VIEW.project(fields, compact)
+
+    filters = {}
+    if role is not None:
+        filters['role'] = role
+    if system is not None:
+        filters['system'] = system
+    if is_disabled is not None:
+        filters['is_disabled'] = is_disabled
+
+    total, ids = search.index.search(q, filters, offset, limit)
+    headers = {"Cache-Control": "no-cache", "X-Total-Count": str(total)}
+    if offset + len(ids) < total:
+        headers["X-Next-Offset"] = str(offset + len(ids))
+    if not ids:
+        return ORJSONResponse([], headers=headers)
+
+    try:
+        async with db_connection() as conn:
+            users_db = await UserRepository(conn).by_ids(ids, projection.columns)
+    except Exception as e:
+        logger.error(f"Error in search_users: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to search users.")
+
+    # back into rank order, UserID is the view's key column. a user removed since the lookup is left out
+    by_id = {row[0]: row for row in users_db}
+    return ORJSONResponse(projection.rows([by_id[user_id] for user_id in ids if user_id in by_id]), headers=headers)
 
 # get riders
 @router.get("/riders")
-async def get_riders():
-    conn = await get_db_connection()  
-    cursor = await conn.cursor()
-    await cursor.execute("""
-        SELECT UserID, FirstName, LastName, Username, PhoneNumber
-        FROM Users
-        WHERE UserRole = 'rider' AND isDisabled = 0
-    """)
-    rows = await cursor.fetchall()
-    await cursor.close()
-    await conn.close()
-    return [
-        {
-            "UserID": r.UserID,
-            "FullName": f"{r.FirstName} {r.LastName}",
-            "Username": r.Username,
-            "Phone": r.PhoneNumber
-        }
-        for r in rows
-    ]
+async def get_riders(request: Request):
+    async def load():
+        async with db_connection() as conn:
+            rows = await UserRepository(conn).riders()
+        return [
+            {
+                "UserID": r.UserID,
+                "FullName": f"{r.FirstName} {r.LastName}",
+                "Username": r.Username,
+                "Phone": r.PhoneNumber
+            }
+            for r in rows
+        ]
+    return await roster.respond(request, None, 'rider', load)
+
+# batch rider lookup, one query for many ids
+async def _riders_by_ids(ids: list[int]):
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > RIDER_BATCH_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {RIDER_BATCH_MAX_IDS} rider ids can be requested at once.")
+    riders = {}
+    if ids:
+        async with db_connection() as conn:
+            rows = await UserRepository(conn).riders_by_ids(ids)
+        for r in rows:
+            riders[r.UserID] = {
+                "UserID": r.UserID,
+                "FullName": f"{r.FirstName} {r.LastName}",
+                "Username": r.Username,
+                "Phone": r.PhoneNumber
+            }
+    return ORJSONResponse({"riders": riders, "notFound": [i for i in ids if i not in riders]})
+
+@router.get("/riders/batch")
+async def get_riders_batch(ids: str = Query(..., description="Comma-separated rider ids")):
+    try:
+        parsed = [int(i) for i in ids.split(",") if i.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma-separated list of integers.")
+    return await _riders_by_ids(parsed)
+
+@router.post("/riders/batch")
+async def post_riders_batch(request: RiderBatchRequest):
+    return await _riders_by_ids(request.ids)
 
 # get rider by id
 @router.get("/riders/{rider_id}")
 async def get_rider_by_id(rider_id: int):
-    conn = await get_db_connection()  
-    cursor = await conn.cursor()
-    try:
-        await cursor.execute("""
-            SELECT UserID, FirstName, LastName, Username, PhoneNumber
-            FROM Users
-            WHERE UserRole = 'rider' AND isDisabled = 0 AND UserID = ?
-        """, (rider_id,))
-        row = await cursor.fetchone()
-        if not row:
-            raise HTTPException(status_code=404, detail="Rider not found")
-
-        return {
-            "UserID": row.UserID,
-            "FullName": f"{row.FirstName} {row.LastName}",
-            "Username": row.Username,
-            "Phone": row.PhoneNumber
-        }
-    finally:
-        await cursor.close()
-        await conn.close()
+    async with db_connection() as conn:
+        row = await UserRepository(conn).rider(rider_id)
+    if not row:
+        raise HTTPException(status_code=404, detail="Rider not found")
+
+    return {
+        "UserID": row.UserID,
+        "FullName": f"{row.FirstName} {row.LastName}",
+        "Username": row.Username,
+        "Phone": row.PhoneNumber
+    }
 
 # update users
 @router.put("/update/{user_id}", dependencies=[Depends(role_required(['superadmin']))])
@@ -233,138 +563,123 @@ async def update_user(
     system: Optional[str] = Form(None),
     pin: Optional[str] = Form(None),
 ):
-    conn = None
-    cursor = None
     try:
-        conn = await get_db_connection()
-        cursor = await conn.cursor()
-
-        await cursor.execute("SELECT UserRole, System FROM Users WHERE UserID = ?", (user_id,))
-        user_record = await cursor.fetchone()
-        if not user_record:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        original_role, original_system = user_record
-        
-        updates = []
-        values = []
-
-        if username is not None:
-            if not username.strip():
-                 raise HTTPException(status_code=400, detail="Username cannot be empty.")
-            await cursor.execute("SELECT 1 FROM Users WHERE Username = ? AND UserID != ? AND isDisabled = 0", (username, user_id))
-            if await cursor.fetchone():
-                raise HTTPException(status_code=400, detail=f"Username '{username}' is already taken.")
-            updates.append('Username = ?')
-            values.append(username)
-
-        if email is not None:
-            if not email.strip():
-                 raise HTTPException(status_code=400, detail="Email cannot be empty.")
-            await cursor.execute("SELECT 1 FROM Users WHERE Email = ? AND UserID != ? AND isDisabled = 0", (email, user_id))
-            if await cursor.fetchone():
-                raise HTTPException(status_code=400, detail="Email is already used by another user")
-            updates.append('Email = ?')
-            values.append(email)
-        
-        if phoneNumber is not None:
-            updates.append('PhoneNumber = ?')
-            values.append(phoneNumber if phoneNumber.strip() else None)
-
-        if password is not None and password.strip():
-            if len(password.strip()) < 12:
-                raise HTTPException(status_code=400, detail="Password must be at least 12 characters.")
-            hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-            updates.append('UserPassword = ?')
-            values.append(hashed_password)  
-        
-        if firstName is not None:
-            if not firstName.strip():
-                raise HTTPException(status_code=400, detail="First name cannot be empty.")
-            updates.append('FirstName = ?')
-            values.append(firstName)
-
-        if middleName is not None:
-            updates.append('MiddleName = ?')
-            values.append(middleName if middleName.strip() else None)
-
-        if lastName is not None:
-            if not lastName.strip():
-                raise HTTPException(status_code=400, detail="Last name cannot be empty.")
-            updates.append('LastName = ?')
-            values.append(lastName)
-
-        if suffix is not None:
-            updates.append('Suffix = ?')
-            values.append(suffix if suffix.strip() else None)
-        
-        if userRole is not None:
-            updates.append('UserRole = ?')
-            values.append(userRole)
-
-        if system is not None:
-            updates.append('System = ?')
-            values.append(system)
-
-        final_role = userRole if userRole is not None else original_role
-        final_system = system if system is not None else original_system
-        
-        is_now_pos_manager = (final_role == 'manager' and final_system == 'POS')
-        was_originally_pos_manager = (original_role == 'manager' and original_system == 'POS')
-
-        if pin is not None and pin.strip():
-            if is_now_pos_manager:
-                if not pin.isdigit() or len(pin) != 4:
-                    raise HTTPException(status_code=400, detail="A 4-digit PIN is required for POS Managers.")
-                hashed_pin = bcrypt.hashpw(pin.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-                updates.append('Pin = ?')
-                values.append(hashed_pin)
-        
-        if not is_now_pos_manager and was_originally_pos_manager:
-            updates.append('Pin = ?')
-            values.append(None)
-
-        if not updates:
-            return {'message': 'No fields to update'}
-
-        values.append(user_id)
-        
-        update_query = f"UPDATE Users SET {', '.join(updates)} WHERE UserID = ?"
-        await cursor.execute(update_query, tuple(values))
-        await conn.commit()
-                
+        async with db_connection() as conn:
+            users = UserRepository(conn)
+
+            user_record = await users.identity(user_id)
+            if not user_record:
+                raise HTTPException(status_code=404, detail="User not found")
+
+            original_role, original_system, original_username = user_record
+
+            fields = {}
+
+            if username is not None:
+                if not username.strip():
+                     raise HTTPException(status_code=400, detail="Username cannot be empty.")
+                if await users.username_taken(username, exclude_id=user_id):
+                    raise HTTPException(status_code=400, detail=f"Username '{username}' is already taken.")
+                fields['Username'] = username
+
+            if email is not None:
+                if not email.strip():
+                     raise HTTPException(status_code=400, detail="Email cannot be empty.")
+                if await users.email_taken(email, exclude_id=user_id):
+                    raise HTTPException(status_code=400, detail="Email is already used by another user")
+                fields['Email'] = email
+
+            if phoneNumber is not None:
+                fields['PhoneNumber'] = phoneNumber if phoneNumber.strip() else None
+
+            if password is not None and password.strip():
+                if len(password.strip()) < 12:
+                    raise HTTPException(status_code=400, detail="Password must be at least 12 characters.")
+                hashed_password = await hashing.hash_password(password)
+                fields['UserPassword'] = hashed_password
+                fields['PasswordAlgorithm'], fields['PasswordCost'] = hashing.describe(hashed_password)
+
+            if firstName is not None:
+                if not firstName.strip():
+                    raise HTTPException(status_code=400, detail="First name cannot be empty.")
+                fields['FirstName'] = firstName
+
+            if middleName is not None:
+                fields['MiddleName'] = middleName if middleName.strip() else None
+
+            if lastName is not None:
+                if not lastName.strip():
+                    raise HTTPException(status_code=400, detail="Last name cannot be empty.")
+                fields['LastName'] = lastName
+
+            if suffix is not None:
+                fields['Suffix'] = suffix if suffix.strip() else None
+
+            if userRole is not None:
+                fields['UserRole'] = userRole
+
+            if system is not None:
+                fields['System'] = system
+
+            final_role = userRole if userRole is not None else original_role
+            final_system = system if system is not None else original_system
+
+            is_now_pos_manager = (final_role == 'manager' and final_system == 'POS')
+            was_originally_pos_manager = (original_role == 'manager' and original_system == 'POS')
+
+            if pin is not None and pin.strip():
+                if is_now_pos_manager:
+                    if not pin.isdigit() or len(pin) != 4:
+                        raise HTTPException(status_code=400, detail="A 4-digit PIN is required for POS Managers.")
+                    pin_lookup = hashing.pin_lookup(pin)
+                    if await pin_in_use(users, pin, pin_lookup, exclude_id=user_id):
+                        raise HTTPException(status_code=400, detail=PIN_TAKEN)
+                    fields['Pin'] = await hashing.hash_password(pin)
+                    fields['PinLookup'] = pin_lookup
+
+            if not is_now_pos_manager and was_originally_pos_manager:
+                fields['Pin'] = None
+                fields['PinLookup'] = None
+
+            if not fields:
+                return {'message': 'No fields to update'}
+
+            await users.update(user_id, fields)
+            await conn.commit()
+            principal_cache.invalidate(original_username, username)
+            roster.bump(original_system, original_role)
+            roster.bump(final_system, final_role)
+
     except HTTPException: 
         raise
     except Exception as e:
         logger.error(f"Error in update_user: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="An internal server error occurred during user update.")
-    finally:
-        if cursor: await cursor.close()
-        if conn: await conn.close()
 
+    await search.index.refresh(ids=[user_id])
     return {'message': 'User updated successfully'}
 
 # disable user
 @router.put('/disable/{user_id}', dependencies=[Depends(role_required(['superadmin']))])
 async def disable_user(user_id: int):
-    conn = None
-    cursor = None
     try:
-        conn = await get_db_connection()
-        cursor = await conn.cursor()
-        await cursor.execute("SELECT 1 FROM Users WHERE UserID = ? AND isDisabled = 0", (user_id,))
-        if not await cursor.fetchone():
-            raise HTTPException(status_code=404, detail="User not found or already disabled.")
-        await cursor.execute("UPDATE Users SET isDisabled = 1 WHERE UserID = ? ", (user_id,))
-        await conn.commit()
+        async with db_connection() as conn:
+            users = UserRepository(conn)
+            row = await users.active_identity(user_id)
+            if not row:
+                raise HTTPException(status_code=404, detail="User not found or already disabled.")
+            await users.disable(user_id)
+            await conn.commit()
+            principal_cache.invalidate(row[0])
+            roster.bump(row[1], row[2])
+        # long-lived cashier tokens must stop working even if the account is re-enabled later
+        await revocations.revoke_user(row[0])
     except HTTPException: 
         raise
     except Exception as e:
         logger.error(f"Error in disable_user: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="An internal server error occurred during user deletion.")
-    finally:
-        if cursor: await cursor.close()
-        if conn: await conn.close()
+    await search.index.refresh(ids=[user_id])
     return {'message': 'User disabled successfully'}
 
 # oos signup
@@ -383,32 +698,26 @@ async def signup_oos_user(
     system = 'OOS'
     if not password.strip() or not username.strip():
         raise HTTPException(status_code=400, detail="Username and Password are required")
-    conn = None
-    cursor = None
     try:
-        conn = await get_db_connection()
-        cursor = await conn.cursor()
-        await cursor.execute("SELECT 1 FROM Users WHERE Username = ? AND System = ? AND isDisabled = 0", (username, system))
-        if await cursor.fetchone():
-            raise HTTPException(status_code=400, detail="Username is already taken")
-        await cursor.execute("SELECT 1 FROM Users WHERE Email = ? AND System = ? AND isDisabled = 0", (email, system))
-        if await cursor.fetchone():
-            raise HTTPException(status_code=400, detail="Email is already used")
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-        
-        await cursor.execute('''
-            INSERT INTO Users (UserPassword, Email, UserRole, isDisabled, CreatedAt, System, Username, PhoneNumber, FirstName, MiddleName, LastName, Suffix, Pin)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, NULL)
-        ''', (hashed_password, email, userRole, 0, datetime.utcnow(), system, username, phoneNumber, firstName, middleName, lastName, suffix))
-        await conn.commit()
+        async with db_connection() as conn:
+            users = UserRepository(conn)
+            if await users.username_taken(username, system=system):
+                raise HTTPException(status_code=400, detail="Username is already taken")
+            if await users.email_taken(email, system=system):
+                raise HTTPException(status_code=400, detail="Email is already used")
+            hashed_password = await hashing.hash_password(password)
+            algorithm, cost = hashing.describe(hashed_password)
+
+            await users.insert((hashed_password, algorithm, cost, email, userRole, 0, datetime.utcnow(), system, username, phoneNumber, firstName, middleName, lastName, suffix, None, None))
+            await conn.commit()
+            principal_cache.invalidate(username)
+            roster.bump(system, userRole)
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error in signup_oos_user: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="An internal server error occurred during signup.")
-    finally:
-        if cursor: await cursor.close()
-        if conn: await conn.close()
+    await search.index.refresh(usernames=[username])
     return {'message': 'OOS user account created successfully!'}
 
 # verify manager pin pos
@@ -421,7 +730,7 @@ async def verify_manager_pin(
     request: PinVerificationRequest,
 
     # ensures only authenticated users can access this endpoint
-    current_user: dict = Depends(get_current_active_user)
+    current_user = Depends(get_current_active_user)
 ):
     if not request.pin or not request.pin.isdigit() or len(request.pin) != 4:
         raise HTTPException(
@@ -429,43 +738,68 @@ async def verify_manager_pin(
             detail="A valid 4-digit PIN is required."
         )
 
-    conn = None
+    lookup = hashing.pin_lookup(request.pin)
     try:
-        conn = await get_db_connection()
-        async with conn.cursor() as cursor:
-
-            # fetch all active POS managers with a PIN
-            await cursor.execute("""
-                SELECT Username, Pin FROM Users
-                WHERE UserRole = 'manager'
-                  AND System = 'POS'
-                  AND isDisabled = 0
-                  AND Pin IS NOT NULL
-                  AND Pin != ''
-            """)
-            
-            managers = await cursor.fetchall()
-
-            if not managers:
+        async with db_connection() as conn:
+            users = UserRepository(conn)
+
+            # managers whose pin lookup matches, plus any not yet migrated to PinLookup
+            candidates = await users.pin_candidates(lookup)
+
+            indexed = [m for m in candidates if m.PinLookup == lookup]
+            legacy = [m for m in candidates if m.PinLookup is None] if PIN_LEGACY_FALLBACK else []
+
+            # managers sharing a pin cannot be told apart, refuse instead of crediting whichever row comes first
+            if len(indexed) > 1:
+                logger.warning(f"PIN verification by {current_user.username} matched {len(indexed)} managers: {', '.join(m.Username for m in indexed)}")
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail=PIN_SHARED
+                )
+
+            # an indexed hit costs a single slow hash, every legacy row is checked so a shared pin is never
+            # credited to whichever manager comes first
+            matches = await matching_pin_managers(request.pin, indexed + legacy)
+            if len(matches) > 1:
+                logger.warning(f"PIN verification by {current_user.username} matched {len(matches)} managers: {', '.join(m.Username for m in matches)}")
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail=PIN_SHARED
+                )
+
+            if matches:
+                manager = matches[0]
+                if manager.PinLookup is None:
+                    # backfill the legacy row, unless a manager given this pin since then already holds the lookup
+                    conflict = await users.pin_taken(lookup, exclude_id=manager.UserID)
+                    if not conflict:
+                        try:
+                            await users.set_pin_lookup(manager.UserID, lookup)
+                            await conn.commit()
+                        except Exception as e:
+                            # the unique index, the same race one statement later
+                            logger.warning(f"PinLookup backfill for manager '{manager.Username}' failed: {e}")
+                            conflict = True
+                    if conflict:
+                        raise HTTPException(
+                            status_code=status.HTTP_409_CONFLICT,
+                            detail=PIN_SHARED
+                        )
+                    logger.info(f"Manager PIN verified successfully for manager: {manager.Username} (PinLookup backfilled)")
+                else:
+                    logger.info(f"Manager PIN verified successfully for manager: {manager.Username}")
+                return ManagerPinVerifyResponse(managerUsername=manager.Username)
+
+            if not candidates and await users.count_pin_managers() == 0:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail="No active POS managers with a PIN are configured in the system."
                 )
 
-            for manager in managers:
-                username = manager.Username
-                hashed_pin_from_db = manager.Pin
-                
-                # verify the provided PIN against the stored hash
-                try:
-                    if bcrypt.checkpw(request.pin.encode('utf-8'), hashed_pin_from_db.encode('utf-8')):
-                        logger.info(f"Manager PIN verified successfully for manager: {username}")
-                        return ManagerPinVerifyResponse(managerUsername=username)
-                except ValueError:
-                    logger.warning(f"Skipping PIN check for manager '{username}' due to an invalid hash format in the database.")
-                    continue
-        
-        logger.warning(f"Failed PIN verification attempt by user: {current_user.get('username')}")
+        if not indexed and not legacy:
+            await hashing.dummy_verify(request.pin)
+
+        logger.warning(f"Failed PIN verification attempt by user: {current_user.username}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid PIN."
@@ -479,48 +813,42 @@ async def verify_manager_pin(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="An unexpected error occurred during PIN verification."
         )
-    finally:
-        if conn:
-            await conn.close()
 
 # get own profile oos
 @router.get("/profile")
-async def get_profile(current_user=Depends(get_current_active_user)):
-    conn = await get_db_connection()
-    cursor = await conn.cursor()
-    try:
-        await cursor.execute("""
-            SELECT UserID, Username, FirstName, MiddleName, LastName,
-                   Email, PhoneNumber, Block, Street, Subdivision,
-                   City, Province, Landmark, Birthday, ProfileImage
-            FROM Users
-            WHERE Username = ?
-        """, (current_user.username,))
-        row = await cursor.fetchone()
-        if not row:
-            raise HTTPException(status_code=404, detail="User not found")
-
-        return {
-            "userID": row[0],
-            "username": row[1],
-            "firstName": row[2],
-            "middleName": row[3],
-            "lastName": row[4],
-            "email": row[5],
-            "phoneNumber": row[6],
-            "block": row[7],
-            "street": row[8],
-            "subdivision": row[9],
-            "city": row[10],
-            "province": row[11],
-            "landmark": row[12],
-            "birthday": row[13],
-            "profileImage": f"http://localhost:4000/uploads/profile_pictures/{row[14]}" if row[14] else None
-
-        }
-    finally:
-        await cursor.close()
-        await conn.close()
+async def get_profile(
+    current_user=Depends(get_current_active_user),
+    fields: Optional[str] = Query(None, description=FIELDS_QUERY),
+):
+    projection = PROFILE_VIEW.project(fields)
+    async with db_connection() as conn:
+        row = await UserRepository(conn).profile(current_user.username, projection.columns)
+    if not row:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    return ORJSONResponse(projection.row(row))
+
+# build missing thumbnails/webp for every stored profile picture, existing variants are skipped
+@router.post("/profile/variants/rebuild", dependencies=[Depends(role_required(['superadmin']))])
+async def rebuild_profile_variants():
+    async with db_connection() as conn:
+        names = await UserRepository(conn).profile_images()
+    built, skipped, missing, failed = 0, 0, 0, 0
+    for name in names:
+        if not os.path.exists(os.path.join(media.PROFILE_PHOTO_DIR, name)):
+            missing += 1
+            continue
+        try:
+            written = await media.build_variants(name)
+        except Exception as e:
+            logger.error(f"Failed to build variants for {name}: {e}", exc_info=True)
+            failed += 1
+            continue
+        if written:
+            built += 1
+        else:
+            skipped += 1
+    return {"images": len(names), "built": built, "skipped": skipped, "missing": missing, "failed": failed}
 
 # update own profile oos
 @router.put('/profile/update')
@@ -539,113 +867,83 @@ async def update_own_profile(
     birthday: Optional[str] = Form(None),   
     current_user=Depends(get_current_active_user)
 ):
-    conn = None
-    cursor = None
     try:
-        conn = await get_db_connection()
-        cursor = await conn.cursor()
-
-        # fetch UserID via username
-        await cursor.execute("SELECT UserID FROM Users WHERE Username = ?", (current_user.username,))
-        row = await cursor.fetchone()
-        if not row:
-            raise HTTPException(status_code=404, detail="User not found")
-        user_id = row[0]
-
-        updates = []
-        values = []
-
-        if email:
-            await cursor.execute("SELECT 1 FROM Users WHERE Email = ? AND UserID != ? AND isDisabled = 0", (email, user_id))
-            if await cursor.fetchone():
-                raise HTTPException(status_code=400, detail="Email is already used by another user")
-            updates.append('Email = ?')
-            values.append(email)
-        
-        if phoneNumber is not None:
-            updates.append('PhoneNumber = ?')
-            values.append(phoneNumber)
-
-        if city is not None:
-            updates.append('City = ?')
-            values.append(city)
-
-        if province is not None:
-            updates.append('Province = ?')
-            values.append(province)
-
-        if landmark is not None:
-            updates.append('Landmark = ?')
-            values.append(landmark)
-
-        if block is not None:
-            updates.append('Block = ?')
-            values.append(block)
-
-        if street is not None:
-            updates.append('Street = ?')
-            values.append(street)
-
-        if subdivision is not None:
-            updates.append('Subdivision = ?')
-            values.append(subdivision)
-
-        if firstName is not None:
-            updates.append('FirstName = ?')
-            values.append(firstName)
-
-        if lastName is not None:
-            updates.append('LastName = ?')
-            values.append(lastName)
-
-        if username is not None:
-            updates.append('Username = ?')
-            values.append(username)
-
-        if birthday is not None:
-            try:
-                # ensure proper format YYYY-MM-DD
-                datetime.strptime(birthday, "%Y-%m-%d")
-                updates.append('Birthday = ?')
-                values.append(birthday)
-            except ValueError:
-                raise HTTPException(status_code=400, detail="Invalid birthday format")
-
-        if not updates:
-            return {'message': 'No fields to update'}
-
-        values.append(user_id)
-        
-        await cursor.execute(f"UPDATE Users SET {', '.join(updates)} WHERE UserID = ?", tuple(values))
-        await conn.commit()
-                
+        async with db_connection() as conn:
+            users = UserRepository(conn)
+
+            # fetch UserID via username
+            user_id = await users.id_by_username(current_user.username)
+            if user_id is None:
+                raise HTTPException(status_code=404, detail="User not found")
+
+            fields = {}
+
+            if email:
+                if await users.email_taken(email, exclude_id=user_id):
+                    raise HTTPException(status_code=400, detail="Email is already used by another user")
+                fields['Email'] = email
+
+            if phoneNumber is not None:
+                fields['PhoneNumber'] = phoneNumber
+
+            if city is not None:
+                fields['City'] = city
+
+            if province is not None:
+                fields['Province'] = province
+
+            if landmark is not None:
+                fields['Landmark'] = landmark
+
+            if block is not None:
+                fields['Block'] = block
+
+            if street is not None:
+                fields['Street'] = street
+
+            if subdivision is not None:
+                fields['Subdivision'] = subdivision
+
+            if firstName is not None:
+                fields['FirstName'] = firstName
+
+            if lastName is not None:
+                fields['LastName'] = lastName
+
+            if username is not None:
+                fields['Username'] = username
+
+            if birthday is not None:
+                try:
+                    # ensure proper format YYYY-MM-DD
+                    datetime.strptime(birthday, "%Y-%m-%d")
+                    fields['Birthday'] = birthday
+                except ValueError:
+                    raise HTTPException(status_code=400, detail="Invalid birthday format")
+
+            if not fields:
+                return {'message': 'No fields to update'}
+
+            await users.update(user_id, fields)
+            await conn.commit()
+            principal_cache.invalidate(current_user.username, username)
+            roster.bump(current_user.system, current_user.userRole)
+
     except HTTPException:
         raise
     except Exception as e:
         print(f"Error in update_own_profile: {e}")
         raise HTTPException(status_code=500, detail="An internal server error occurred during user update.")
-    finally:
-        if cursor: 
-            await cursor.close()
-        if conn: 
-            await conn.close()
 
+    await search.index.refresh(ids=[user_id])
     return {'message': 'User updated successfully'}
 
 # get cashiers
 @router.get("/cashiers")
-async def get_cashiers():
-    conn = await get_db_connection()
-    cursor = await conn.cursor()
-    try:
-        await cursor.execute("""
-            SELECT UserID, FirstName, LastName, Username, PhoneNumber
-            FROM Users
-            WHERE UserRole = 'cashier' AND System = 'POS' AND isDisabled = 0
-            ORDER BY FirstName, LastName
-        """)
-        rows = await cursor.fetchall()
-        
+async def get_cashiers(request: Request):
+    async def load():
+        async with db_connection() as conn:
+            rows = await UserRepository(conn).cashiers()
         return [
             {
                 "UserID": r.UserID,
@@ -655,9 +953,9 @@ async def get_cashiers():
             }
             for r in rows
         ]
+
+    try:
+        return await roster.respond(request, 'POS', 'cashier', load)
     except Exception as e:
         logger.error(f"Error fetching cashiers: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to retrieve cashiers.")
-    finally:
-        await cursor.close()
-        await conn.close()
\ No newline at end of file
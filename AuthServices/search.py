@@ -0,0 +1,293 @@
+import asyncio
+import bisect
+import logging
+import re
+from array import array
+from database import db_connection
+from repositories import UserRepository
+import bus
+import stats
+
+logger = logging.getLogger(__name__)
+
+# a user's search text is username, email, phone and full name, each opened and closed by _SEP
+_SEP = "\x01"
+_FILTER = "\x02"
+_CONTROL = re.compile(r"[\x00-\x1f]")
+_PHONE_QUERY = re.compile(r"[\d\s()+\-.]+")
+
+# a filter or a further gram is applied by checking the remaining candidates one by one once the
+# candidate set is this many times smaller than the posting list
+_CHECK_RATIO = 8
+
+# filter name -> position in a record
+_RECORD_FIELDS = {"role": 1, "system": 2, "is_disabled": 3}
+
+def _normalize(value: str | None) -> str:
+    return " ".join(_CONTROL.sub(" ", value).split()).casefold() if value else ""
+
+def _digits(value: str | None) -> str:
+    return "".join(ch for ch in value if ch.isdigit()) if value else ""
+
+# queries that look like a phone number match the digits only, as phones are indexed
+def normalize_query(query: str) -> str:
+    q = _normalize(query)
+    if _PHONE_QUERY.fullmatch(q) and any(ch.isdigit() for ch in q):
+        return _digits(q)
+    return q
+
+def _filter_key(name: str, value) -> str:
+    return f"{_FILTER}{name}:{int(value) if isinstance(value, bool) else value}"
+
+# (UserID, record) from a users.search_rows row, record is (text, role, system, disabled)
+def _record(row) -> tuple[int, tuple[str, str, str, int]]:
+    user_id, username, email, phone, first, middle, last, suffix, role, system, disabled = row
+    full_name = " ".join(part for part in (_normalize(first), _normalize(middle), _normalize(last), _normalize(suffix)) if part)
+    text = _SEP + _SEP.join((_normalize(username), _normalize(email), _digits(phone), full_name)) + _SEP
+    return user_id, (text, role, system, int(bool(disabled)))
+
+# every trigram of each field opened by a separator (so field starts have grams of their own), the word-start
+# bigrams for one-character queries and one key per filter value
+def _keys(record: tuple[str, str, str, int]) -> set[str]:
+    text, role, system, disabled = record
+    keys = {_filter_key("role", role), _filter_key("system", system), _filter_key("is_disabled", disabled)}
+    for field in text[1:-1].split(_SEP):
+        if not field:
+            continue
+        field = _SEP + field
+        keys.update([field[i:i + 3] for i in range(len(field) - 2)])
+        keys.add(field[:2])
+        if " " in field:
+            keys.update(" " + word[0] for word in field.split(" ")[1:] if word)
+    return keys
+
+# rows ordered by UserID, so every posting list comes out sorted
+def _build(rows) -> tuple[dict[str, array], dict[int, tuple]]:
+    lists: dict[str, list[int]] = {}
+    records = {}
+    for row in rows:
+        user_id, record = _record(row)
+        records[user_id] = record
+        for key in _keys(record):
+            try:
+                lists[key].append(user_id)
+            except KeyError:
+                lists[key] = [user_id]
+    return {key: array("i", ids) for key, ids in lists.items()}, records
+
+# in-memory n-gram index over every user, the user-management search runs on it without touching the db.
+# posting lists are sorted int arrays (4 bytes per entry), loaded after boot and kept current by the write
+# endpoints through refresh(), which also hands the rows to the other workers over the bus
+class SearchIndex:
+    def __init__(self):
+        self._postings: dict[str, array] = {}
+        self._records: dict[int, tuple[str, str, str, int]] = {}
+        self._pending: list | None = None   # changes that arrived while a load was running, replayed onto its result
+        self._task = None
+        self.loaded = False
+        bus.subscribe("search.rows", self._apply)
+        # whatever was published while the link was down is lost, reload in the background
+        bus.on_reconnect(self.schedule_reload)
+
+    def _add(self, key: str, user_id: int):
+        ids = self._postings.get(key)
+        if ids is None:
+            self._postings[key] = array("i", (user_id,))
+        elif ids[-1] < user_id:
+            ids.append(user_id)
+        else:
+            i = bisect.bisect_left(ids, user_id)
+            if i == len(ids) or ids[i] != user_id:
+                ids.insert(i, user_id)
+
+    def _discard(self, key: str, user_id: int):
+        ids = self._postings.get(key)
+        if ids is None:
+            return
+        i = bisect.bisect_left(ids, user_id)
+        if i < len(ids) and ids[i] == user_id:
+            del ids[i]
+            if not ids:
+                del self._postings[key]
+
+    def _upsert(self, row):
+        user_id, record = _record(row)
+        old = self._records.get(user_id)
+        if old == record:
+            return
+        keys = _keys(record)
+        old_keys = _keys(old) if old is not None else set()
+        for key in old_keys - keys:
+            self._discard(key, user_id)
+        for key in keys - old_keys:
+            self._add(key, user_id)
+        self._records[user_id] = record
+
+    def _remove(self, user_id: int):
+        old = self._records.pop(user_id, None)
+        if old is not None:
+            for key in _keys(old):
+                self._discard(key, user_id)
+
+    # data is {"rows": users.search_rows rows, "gone": ids no longer in Users}
+    def _apply(self, data: dict):
+        if self._pending is not None:
+            self._pending.append(data)
+            return
+        for row in data["rows"]:
+            self._upsert(row)
+        for user_id in data["gone"]:
+            self._remove(user_id)
+
+    async def load(self):
+        self._pending = []
+        built = None
+        try:
+            with stats.timed("search.load"):
+                async with db_connection() as conn:
+                    rows = await UserRepository(conn).search_rows()
+                # pure python, off the loop so requests keep being answered meanwhile
+                built = await asyncio.to_thread(_build, rows)
+        finally:
+            pending, self._pending = self._pending, None
+            if built is not None:
+                self._postings, self._records = built
+            for data in pending:
+                self._apply(data)
+        self.loaded = True
+        logger.info(f"Search index loaded: {len(self._records)} users, {len(self._postings)} keys")
+
+    def schedule_reload(self):
+        if self.loaded and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._reload())
+
+    async def _reload(self):
+        try:
+            await self.load()
+        except Exception as e:
+            logger.error(f"Search index reload failed: {e}", exc_info=True)
+
+    # re-read users after a write and pass the rows on to the other workers, a failure is logged and never
+    # fails the write itself
+    async def refresh(self, ids: list[int] | None = None, usernames: list[str] | None = None):
+        try:
+            async with db_connection() as conn:
+                rows = [list(row) for row in await UserRepository(conn).search_rows(ids=ids, usernames=usernames)]
+            data = {"rows": rows, "gone": sorted(set(ids or ()) - {row[0] for row in rows})}
+            self._apply(data)
+            bus.publish("search.rows", data)
+        except Exception as e:
+            logger.error(f"Search index refresh failed: {e}", exc_info=True)
+
+    # narrow candidates to one posting list, walking the list or checking the candidates, whichever is shorter
+    def _narrow(self, candidates: set[int] | None, ids: array, check) -> set[int]:
+        if candidates is None:
+            return set(ids)
+        if len(candidates) * _CHECK_RATIO < len(ids):
+            return {user_id for user_id in candidates if check(user_id)}
+        candidates.intersection_update(ids)
+        return candidates
+
+    # users holding every gram of every word of the query (a superset of the matches, _tiers checks the text)
+    # and every filter
+    def _match(self, q: str, filters: dict) -> set[int]:
+        postings = self._postings
+        records = self._records
+        for name, value in filters.items():
+            if _filter_key(name, value) not in postings:
+                return set()
+
+        candidates = None
+        words = q.split(" ")
+        grams = {word[i:i + 3] for word in words for i in range(len(word) - 2)}
+        if grams:
+            lists = []
+            for gram in grams:
+                ids = postings.get(gram)
+                if ids is None:
+                    return set()
+                lists.append(ids)
+            lists.sort(key=len)
+            candidates = set(lists[0])
+            for ids in lists[1:]:
+                # _tiers checks the text of what is left once a gram stops paying for itself
+                if len(candidates) * _CHECK_RATIO < len(ids):
+                    break
+                before = len(candidates)
+                candidates.intersection_update(ids)
+                if len(candidates) * 10 > before * 9:
+                    break
+        elif q:
+            # one or two characters only match the start of a field or of a name part
+            word = max(words, key=len)
+            candidates = set(postings.get(_SEP + word, ())).union(postings.get(" " + word, ()))
+
+        for name, value in sorted(filters.items(), key=lambda item: len(postings[_filter_key(*item)])):
+            position, expected = _RECORD_FIELDS[name], int(value) if isinstance(value, bool) else value
+            candidates = self._narrow(
+                candidates, postings[_filter_key(name, value)], lambda user_id: records[user_id][position] == expected
+            )
+        return set(records) if candidates is None else candidates
+
+    # exact field matches, then field prefixes, then name-part prefixes, then the rest. candidates of a query
+    # longer than three characters are checked for it in the same pass, every gram can be present without it.
+    # a query of several words also matches text holding each of them anywhere ("maria santos" finds
+    # "maria cruz santos"), those rank last
+    def _tiers(self, candidates: set[int], q: str) -> list[list[int]]:
+        if not q:
+            return [sorted(candidates)]
+        records = self._records
+        start, exact_needle, word_needle = _SEP + q, _SEP + q + _SEP, " " + q
+        words = q.split(" ")
+        if len(words) > 1:
+            contains = lambda text: all(word in text for word in words)
+        elif len(q) > 3:
+            contains = lambda text: q in text
+        else:
+            contains = None
+        # nobody has a field or name part starting like the query (an email domain, digits from the middle of a
+        # phone), everything lands in the last tier
+        if start[:3] not in self._postings and word_needle[:3] not in self._postings:
+            if contains is None:
+                return [sorted(candidates)]
+            return [sorted(user_id for user_id in candidates if contains(records[user_id][0]))]
+        exact, prefix, word, rest = [], [], [], []
+        for user_id in candidates:
+            text = records[user_id][0]
+            if start in text:
+                (exact if exact_needle in text else prefix).append(user_id)
+            elif word_needle in text:
+                word.append(user_id)
+            elif contains is None or contains(text):
+                rest.append(user_id)
+        for tier in (exact, prefix, word, rest):
+            tier.sort()
+        return [exact, prefix, word, rest]
+
+    # (total matches, UserIDs of the requested page in rank order), filters maps role/system/is_disabled to values
+    def search(self, query: str, filters: dict, offset: int, limit: int) -> tuple[int, list[int]]:
+        with stats.timed("search.query"):
+            q = normalize_query(query)
+            tiers = self._tiers(self._match(q, filters), q)
+            page = []
+            for tier in tiers:
+                if offset >= len(tier):
+                    offset -= len(tier)
+                    continue
+                page.extend(tier[offset:offset + limit - len(page)])
+                offset = 0
+                if len(page) >= limit:
+                    break
+            return sum(len(tier) for tier in tiers), page
+
+    def stats(self):
+        info = {
+            "loaded": self.loaded,
+            "users": len(self._records),
+            "keys": len(self._postings),
+            "posting_bytes": sum(ids.itemsize * len(ids) for ids in self._postings.values()),
+        }
+        info.update(stats.snapshot("search."))
+        return info
+
+index = SearchIndex()
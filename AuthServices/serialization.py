@@ -0,0 +1,73 @@
+from operator import itemgetter
+from typing import Any, Callable, NamedTuple, Sequence
+import orjson
+from fastapi import HTTPException
+
+# projections a view keeps compiled, ?fields= is caller input so the cache is bounded
+VIEW_PROJECTION_CACHE = 256
+
+# same bytes ORJSONResponse sends, for bodies cached ahead of the response
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+# one output key of a view, built from its columns' values (a single column without build is passed through).
+# datetimes and dates are passed through too, orjson writes them in isoformat.
+class Field(NamedTuple):
+    columns: tuple[str, ...]
+    build: Callable | None = None
+    legacy: bool = False    # duplicate key kept for older clients, left out in compact mode
+
+# the keys one request asked for, the columns to select for them and how to turn a row into a dict
+class Projection(NamedTuple):
+    keys: tuple[str, ...]
+    columns: tuple[str, ...]
+    getters: tuple[Callable, ...]
+
+    def row(self, row: Sequence) -> dict:
+        return {key: get(row) for key, get in zip(self.keys, self.getters)}
+
+    def rows(self, rows: list[Sequence]) -> list[dict]:
+        pairs = tuple(zip(self.keys, self.getters))
+        return [{key: get(row) for key, get in pairs} for row in rows]
+
+def _getter(field: Field, index: dict[str, int]) -> Callable:
+    pick = itemgetter(*(index[column] for column in field.columns))
+    if field.build is None:
+        return pick
+    build = field.build
+    if len(field.columns) == 1:
+        return lambda row: build(pick(row))
+    return lambda row: build(*pick(row))
+
+# output shape of an endpoint, ?fields= picks keys out of it and only their columns are selected
+class View:
+    def __init__(self, fields: dict[str, Field], key_columns: tuple[str, ...] = ()):
+        self.fields = fields
+        self.key_columns = key_columns   # always selected first, e.g. the keyset cursor
+        self._order = list(dict.fromkeys((*key_columns, *(column for field in fields.values() for column in field.columns))))
+        self._projections: dict[tuple, Projection] = {}
+
+    def project(self, fields: str | None = None, compact: bool = False) -> Projection:
+        cache_key = (fields, compact)
+        projection = self._projections.get(cache_key)
+        if projection is not None:
+            return projection
+
+        if fields:
+            names = tuple(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+            unknown = [name for name in names if name not in self.fields]
+            if unknown or not names:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Unknown fields: {', '.join(unknown) or fields}. Available: {', '.join(self.fields)}"
+                )
+        else:
+            names = tuple(name for name, field in self.fields.items() if not (compact and field.legacy))
+
+        needed = set(self.key_columns).union(*(self.fields[name].columns for name in names))
+        columns = tuple(column for column in self._order if column in needed)
+        index = {column: i for i, column in enumerate(columns)}
+        projection = Projection(names, columns, tuple(_getter(self.fields[name], index) for name in names))
+        if len(self._projections) < VIEW_PROJECTION_CACHE:
+            self._projections[cache_key] = projection
+        return projection
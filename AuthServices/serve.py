@@ -0,0 +1,181 @@
+# production launcher: binds the port once, runs WEB_CONCURRENCY uvicorn workers on it and hosts the invalidation bus.
+# SIGHUP restarts the workers one at a time (new code included), an old worker is stopped only once its replacement is ready.
+# SIGTERM / SIGINT drain every worker and exit. dead workers are respawned.
+# run from AuthServices/: python serve.py
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import tempfile
+import threading
+import time
+import uuid
+import uvicorn
+from bus import Hub
+import hashing
+import signing
+
+logger = logging.getLogger("serve")
+
+# launcher config
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", 10000))
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))          # worker processes, one per core by default
+GRACEFUL_TIMEOUT = float(os.getenv("GRACEFUL_TIMEOUT", 30))                      # seconds a stopping worker gets for in-flight requests
+WORKER_READY_TIMEOUT = float(os.getenv("WORKER_READY_TIMEOUT", 120))             # seconds a replacement gets to report ready
+RESPAWN_BACKOFF_MAX = float(os.getenv("RESPAWN_BACKOFF_MAX", 30))                # longest wait before respawning a crash-looping worker
+BUS_SOCKET = os.getenv("BUS_SOCKET") or os.path.join(tempfile.gettempdir(), f"authsvc-bus-{os.getpid()}.sock")
+
+# worker process entry point, runs under spawn so it imports main fresh
+def _serve(sock: socket.socket, bootstrap_admin: bool):
+    # the superadmin bootstrap is a check-then-insert, one worker is enough
+    os.environ["BOOTSTRAP_ADMIN"] = "true" if bootstrap_admin else "false"
+    threading.Thread(target=_watch_parent, args=(os.getppid(),), daemon=True).start()
+    config = uvicorn.Config("main:app", timeout_graceful_shutdown=int(GRACEFUL_TIMEOUT))
+    uvicorn.Server(config).run(sockets=[sock])
+
+# a worker whose launcher died drains and exits instead of serving on unsupervised
+def _watch_parent(parent: int):
+    while os.getppid() == parent:
+        time.sleep(1)
+    os.kill(os.getpid(), signal.SIGTERM)
+
+class _Worker:
+    def __init__(self, slot: int, process):
+        self.slot = slot
+        self.process = process
+        self.started = time.monotonic()
+        self.ready = asyncio.Event()
+        self.retiring = False
+
+class Launcher:
+    def __init__(self, workers: int):
+        self.size = workers
+        self.workers: dict[int, _Worker] = {}
+        self._context = multiprocessing.get_context("spawn")
+        self._sock = None
+        self._stopping = asyncio.Event()
+        self._restarting = False
+        self._backoff: dict[int, float] = {}
+
+    def _spawn(self, slot: int) -> _Worker:
+        process = self._context.Process(target=_serve, args=(self._sock, slot == 0), name=f"authsvc-worker-{slot}")
+        process.start()
+        worker = self.workers[process.pid] = _Worker(slot, process)
+        logger.info(f"Started worker {process.pid} in slot {slot}")
+        return worker
+
+    def _on_message(self, message: dict):
+        if message.get("t") == "worker.ready":
+            worker = self.workers.get(message.get("d"))
+            if worker is not None:
+                worker.ready.set()
+                logger.info(f"Worker {worker.process.pid} ready after {time.monotonic() - worker.started:.2f}s")
+
+    async def _retire(self, worker: _Worker):
+        worker.retiring = True
+        # uvicorn stops accepting and finishes in-flight requests on SIGTERM
+        worker.process.terminate()
+        await asyncio.to_thread(worker.process.join, GRACEFUL_TIMEOUT + 5)
+        if worker.process.is_alive():
+            logger.warning(f"Worker {worker.process.pid} did not stop in time, killing it")
+            worker.process.kill()
+            await asyncio.to_thread(worker.process.join)
+        self.workers.pop(worker.process.pid, None)
+
+    # rolling restart, capacity never drops below the configured size
+    async def restart(self):
+        if self._restarting or self._stopping.is_set():
+            return
+        self._restarting = True
+        logger.info("Rolling restart")
+        try:
+            for old in [w for w in self.workers.values() if not w.retiring]:
+                new = self._spawn(old.slot)
+                try:
+                    await asyncio.wait_for(new.ready.wait(), WORKER_READY_TIMEOUT)
+                except asyncio.TimeoutError:
+                    logger.error(f"Worker {new.process.pid} not ready after {WORKER_READY_TIMEOUT}s, keeping the old workers")
+                    await self._retire(new)
+                    return
+                await self._retire(old)
+            logger.info("Rolling restart done")
+        finally:
+            self._restarting = False
+
+    # respawn workers that died on their own, backing off when a slot keeps crashing
+    async def _supervise(self):
+        while not self._stopping.is_set():
+            for worker in list(self.workers.values()):
+                if worker.retiring or worker.process.is_alive():
+                    continue
+                self.workers.pop(worker.process.pid, None)
+                crashed_early = time.monotonic() - worker.started < 10
+                delay = min(self._backoff.get(worker.slot, 0.5) * 2, RESPAWN_BACKOFF_MAX) if crashed_early else 0.5
+                self._backoff[worker.slot] = delay
+                logger.error(f"Worker {worker.process.pid} in slot {worker.slot} exited with {worker.process.exitcode}, respawning in {delay:.1f}s")
+                asyncio.get_running_loop().call_later(delay, lambda slot=worker.slot: self._stopping.is_set() or self._spawn(slot))
+            try:
+                await asyncio.wait_for(self._stopping.wait(), 0.5)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self._sock = socket.socket(socket.AF_INET6 if ":" in HOST else socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((HOST, PORT))
+        self._sock.listen(2048)
+        self._sock.set_inheritable(True)
+        hub = Hub(BUS_SOCKET, on_message=self._on_message)
+        await hub.start()
+        loop.add_signal_handler(signal.SIGHUP, lambda: asyncio.ensure_future(self.restart()))
+        loop.add_signal_handler(signal.SIGTERM, self._stopping.set)
+        loop.add_signal_handler(signal.SIGINT, self._stopping.set)
+        logger.info(f"Listening on {HOST}:{PORT} with {self.size} workers, bus at {BUS_SOCKET}")
+        try:
+            for slot in range(self.size):
+                self._spawn(slot)
+            await self._supervise()
+        finally:
+            logger.info("Stopping workers")
+            await asyncio.gather(*(self._retire(w) for w in list(self.workers.values())))
+            await hub.close()
+            self._sock.close()
+
+# measured once here and handed to every worker through the environment: workers calibrating on their own
+# measure under each other's boot load, land on different costs and keep rehashing each other's users
+def _calibrate_hashing():
+    if not hashing.HASH_CALIBRATE:
+        return
+    try:
+        policy = asyncio.run(hashing.calibrate())
+    except Exception as e:
+        policy = hashing.policy()
+        logger.error(f"Hash cost calibration failed, keeping {hashing.describe_policy(policy)}: {e}", exc_info=True)
+    finally:
+        hashing.shutdown()
+    os.environ["BCRYPT_ROUNDS"] = str(policy.bcrypt_rounds)
+    os.environ["ARGON2_TIME_COST"] = str(policy.argon2_time_cost)
+    os.environ["HASH_CALIBRATE"] = "false"
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    # workers would fail it one after another in a respawn loop, refuse here instead
+    hashing.check_pin_lookup_key()
+    signing.check_legacy_config()
+    # the first key is made here, once, instead of by every worker racing on an empty keys dir
+    signing.load()
+    _calibrate_hashing()
+    workers = max(WEB_CONCURRENCY, 1)
+    # shared by every worker of this launch: roster etags stay valid across workers and rolling restarts
+    os.environ["AUTHSVC_LAUNCH_ID"] = uuid.uuid4().hex[:12]
+    os.environ["BUS_SOCKET"] = BUS_SOCKET
+    # each worker has its own hashing pool, split the cores between them unless sized explicitly
+    os.environ.setdefault("HASH_WORKERS", str(max((os.cpu_count() or 1) // workers, 1)))
+    asyncio.run(Launcher(workers).run())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+import calendar
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import JWTError, jwk, jwt
+import bus
+import stats
+
+logger = logging.getLogger(__name__)
+
+# signing key config
+JWT_ALGORITHM = "RS256"
+# every worker and every replica has to see the same keys dir (a shared volume): a token is only accepted by a
+# process that can read the key that signed it. replicas that do not share one must not each mint their own first
+# key, run them with JWT_KEYS_CREATE=0 and provision the dir, startup then fails instead of splitting the keys
+JWT_KEYS_DIR = os.getenv("JWT_KEYS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "keys"))
+JWT_KEYS_CREATE = os.getenv("JWT_KEYS_CREATE", "1") == "1"              # generate the first key when the dir has none
+JWT_KEY_ROTATE_DAYS = int(os.getenv("JWT_KEY_ROTATE_DAYS", 90))         # age at which startup generates a fresh signing key
+JWT_KEY_PUBLISH_AHEAD = int(os.getenv("JWT_KEY_PUBLISH_AHEAD", 600))    # seconds a new key sits in the jwks before it signs anything
+JWT_KEY_RETAIN_DAYS = int(os.getenv("JWT_KEY_RETAIN_DAYS", 3660))       # days a superseded key keeps verifying, covers 10 year cashier tokens
+JWT_KEY_RELOAD_SECONDS = int(os.getenv("JWT_KEY_RELOAD_SECONDS", 60))   # how often the keys dir is rescanned for keys made by other workers
+JWT_KEY_MISS_RELOAD_SECONDS = float(os.getenv("JWT_KEY_MISS_RELOAD_SECONDS", 1))  # least time between rescans forced by unknown kids
+JWKS_MAX_AGE = int(os.getenv("JWKS_MAX_AGE", 300))
+
+# tokens issued before the switch to RS256 carry no kid and are checked against the old shared secret. off by
+# default, turning it on needs the secret and the utc time of the switch: legacy tokens were all minted before it and
+# none lives longer than a cashier token, anything else signed with the secret is refused
+JWT_ACCEPT_HS256 = os.getenv("JWT_ACCEPT_HS256", "0") == "1"
+LEGACY_SECRET_KEY = os.getenv("JWT_LEGACY_SECRET", "")
+JWT_HS256_CUTOVER = os.getenv("JWT_HS256_CUTOVER", "")                  # e.g. 2025-01-31T00:00:00
+LEGACY_ALGORITHM = "HS256"
+LEGACY_MAX_LIFETIME = timedelta(days=365 * 10)
+
+_legacy_cutover = None
+
+# refuse to start with legacy acceptance on but not fully configured
+def check_legacy_config():
+    global _legacy_cutover
+    if not JWT_ACCEPT_HS256:
+        return
+    if not LEGACY_SECRET_KEY:
+        raise RuntimeError("JWT_ACCEPT_HS256=1 needs JWT_LEGACY_SECRET, the secret the HS256 tokens were signed with")
+    try:
+        _legacy_cutover = datetime.fromisoformat(JWT_HS256_CUTOVER)
+    except ValueError:
+        raise RuntimeError("JWT_ACCEPT_HS256=1 needs JWT_HS256_CUTOVER, the utc time RS256 signing started (ISO 8601)")
+
+class _SigningKey:
+    __slots__ = ("kid", "created", "private", "public", "jwk")
+
+    def __init__(self, kid: str, created: datetime, pem: bytes):
+        self.kid = kid
+        self.created = created
+        self.private = jwk.construct(pem, JWT_ALGORITHM)
+        self.public = self.private.public_key()
+        self.jwk = {**self.public.to_dict(), "kid": kid, "use": "sig"}
+
+_keys: dict[str, _SigningKey] = {}
+_active = None
+_loaded_at = 0.0
+_jwks_body = b'{"keys":[]}'
+_jwks_etag = '""'
+
+# kids sort by creation time, the prefix is the utc timestamp the key was made
+def _new_kid() -> str:
+    return f"{datetime.utcnow().strftime('%Y%m%d%H%M%S')}-{os.urandom(3).hex()}"
+
+def _kid_created(kid: str) -> datetime:
+    return datetime.strptime(kid.split("-", 1)[0], "%Y%m%d%H%M%S")
+
+def _write_key(kid: str):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()
+    )
+    os.makedirs(JWT_KEYS_DIR, exist_ok=True)
+    path = os.path.join(JWT_KEYS_DIR, f"{kid}.pem")
+    tmp = f"{path}.tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(pem)
+    os.replace(tmp, path)
+
+# rescan the keys dir: publish every key still inside its retention window, sign with the newest one past its publish-ahead delay
+def load():
+    global _active, _loaded_at, _jwks_body, _jwks_etag
+    now = datetime.utcnow()
+    kids = []
+    if os.path.isdir(JWT_KEYS_DIR):
+        for name in os.listdir(JWT_KEYS_DIR):
+            if not name.endswith(".pem"):
+                continue
+            kid = name[:-4]
+            try:
+                _kid_created(kid)
+            except ValueError:
+                logger.warning(f"Ignoring signing key with unexpected name: {name}")
+                continue
+            kids.append(kid)
+    kids.sort()
+
+    keys = {}
+    for i, kid in enumerate(kids):
+        # a key is retired once the key after it has been signing for longer than the retention window
+        superseded = _kid_created(kids[i + 1]) + timedelta(seconds=JWT_KEY_PUBLISH_AHEAD) if i + 1 < len(kids) else None
+        if superseded and now - superseded > timedelta(days=JWT_KEY_RETAIN_DAYS):
+            continue
+        key = _keys.get(kid)
+        if key is None:
+            with open(os.path.join(JWT_KEYS_DIR, f"{kid}.pem"), "rb") as f:
+                key = _SigningKey(kid, _kid_created(kid), f.read())
+        keys[kid] = key
+
+    if not keys:
+        if not JWT_KEYS_CREATE:
+            raise RuntimeError(f"No signing key in {JWT_KEYS_DIR} and JWT_KEYS_CREATE=0, provision the shared keys dir")
+        kid = _new_kid()
+        _write_key(kid)
+        logger.info(f"Generated first signing key {kid}")
+        return load()
+
+    ready = [k for k in keys.values() if now - k.created >= timedelta(seconds=JWT_KEY_PUBLISH_AHEAD)]
+    # on first boot nothing has been published ahead yet, so the newest key signs straight away
+    active = max(ready or keys.values(), key=lambda k: k.kid)
+
+    _keys.clear()
+    _keys.update(keys)
+    _active = active
+    _loaded_at = time.monotonic()
+    _jwks_body = json.dumps({"keys": [k.jwk for k in sorted(keys.values(), key=lambda k: k.kid, reverse=True)]}, separators=(",", ":")).encode("utf-8")
+    _jwks_etag = f'"{hashlib.sha1(_jwks_body).hexdigest()}"'
+
+# make a new key, it is published now and starts signing after JWT_KEY_PUBLISH_AHEAD seconds
+def rotate() -> dict:
+    kid = _new_kid()
+    _write_key(kid)
+    load()
+    bus.publish("signing.rotated", kid)
+    logger.info(f"Rotated signing key, {kid} signs from {_kid_created(kid) + timedelta(seconds=JWT_KEY_PUBLISH_AHEAD)}")
+    return {"kid": kid, "signs_from": _kid_created(kid) + timedelta(seconds=JWT_KEY_PUBLISH_AHEAD), "active_kid": _active.kid}
+
+# other workers publish the new key in their jwks straight away instead of at the next rescan
+bus.subscribe("signing.rotated", lambda kid: load())
+
+# called once on startup, rotates when the newest key is older than JWT_KEY_ROTATE_DAYS
+def start():
+    check_legacy_config()
+    load()
+    newest = max(_keys.values(), key=lambda k: k.kid)
+    if datetime.utcnow() - newest.created > timedelta(days=JWT_KEY_ROTATE_DAYS):
+        rotate()
+
+def _maybe_reload(interval: float = JWT_KEY_RELOAD_SECONDS):
+    if time.monotonic() - _loaded_at > interval:
+        load()
+
+def sign(claims: dict) -> str:
+    _maybe_reload()
+    with stats.timed("jwt.sign"):
+        return jwt.encode(claims, _active.private, algorithm=JWT_ALGORITHM, headers={"kid": _active.kid})
+
+# verify a token and return its claims, raises JWTError on anything invalid
+def verify(token: str) -> dict:
+    header = jwt.get_unverified_header(token)
+    kid = header.get("kid")
+    if kid is None:
+        if JWT_ACCEPT_HS256 and header.get("alg") == LEGACY_ALGORITHM:
+            return _verify_legacy(token)
+        raise JWTError("Token has no key id")
+
+    key = _keys.get(kid)
+    if key is None:
+        # a sibling worker or another replica may have rotated since our last scan, the floor keeps a stream of
+        # made-up kids from rescanning the dir on every request
+        _maybe_reload(JWT_KEY_MISS_RELOAD_SECONDS)
+        key = _keys.get(kid)
+        if key is None:
+            raise JWTError("Unknown key id")
+    with stats.timed("jwt.verify"):
+        return jwt.decode(token, key.public, algorithms=[JWT_ALGORITHM])
+
+def _verify_legacy(token: str) -> dict:
+    if _legacy_cutover is None:
+        check_legacy_config()
+    with stats.timed("jwt.verify.legacy"):
+        claims = jwt.decode(token, LEGACY_SECRET_KEY, algorithms=[LEGACY_ALGORITHM])
+    cutover = calendar.timegm(_legacy_cutover.utctimetuple())
+    iat, exp = claims.get("iat"), claims.get("exp")
+    if (iat is not None and iat > cutover) or exp is None or exp > cutover + LEGACY_MAX_LIFETIME.total_seconds():
+        stats.incr("jwt.verify.legacy_outside_window")
+        raise JWTError("HS256 token issued after the RS256 cutover")
+    return claims
+
+def jwks() -> tuple[bytes, str]:
+    _maybe_reload()
+    return _jwks_body, _jwks_etag
+
+def signing_stats():
+    info = {
+        "active_kid": _active.kid if _active else None,
+        "published_kids": sorted(_keys, reverse=True),
+        "accept_hs256": JWT_ACCEPT_HS256,
+        "hs256_cutover": _legacy_cutover.isoformat() if _legacy_cutover else None,
+    }
+    info.update(stats.snapshot("jwt."))
+    return info
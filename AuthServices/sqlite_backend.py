@@ -0,0 +1,247 @@
+import asyncio
+import logging
+import os
+import sqlite3
+from datetime import datetime
+from functools import lru_cache
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+# sqlite stand-in config, used when DB_BACKEND=sqlite
+SQLITE_PATH = os.getenv("SQLITE_PATH", "authservice.sqlite3")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))   # how long a writer waits for the file lock
+SQLITE_STATEMENT_CACHE = int(os.getenv("SQLITE_STATEMENT_CACHE", 256))     # compiled statements kept per connection
+
+# the tables the service touches, typed loosely after the sql server ones (see migrations/)
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS Users (
+    UserID INTEGER PRIMARY KEY AUTOINCREMENT,
+    UserPassword TEXT,
+    PasswordAlgorithm TEXT,
+    PasswordCost TEXT,
+    Email TEXT,
+    UserRole TEXT,
+    isDisabled INTEGER NOT NULL DEFAULT 0,
+    CreatedAt TIMESTAMP,
+    System TEXT,
+    Username TEXT,
+    PhoneNumber TEXT,
+    FirstName TEXT,
+    MiddleName TEXT,
+    LastName TEXT,
+    Suffix TEXT,
+    Pin TEXT,
+    PinLookup TEXT,
+    Block TEXT,
+    Street TEXT,
+    Subdivision TEXT,
+    City TEXT,
+    Province TEXT,
+    Landmark TEXT,
+    Birthday TEXT,
+    ProfileImage TEXT
+);
+CREATE INDEX IF NOT EXISTS IX_Users_Username ON Users (Username);
+CREATE INDEX IF NOT EXISTS IX_Users_Email ON Users (Email);
+CREATE INDEX IF NOT EXISTS IX_Users_PinLookup ON Users (PinLookup);
+CREATE UNIQUE INDEX IF NOT EXISTS UX_Users_ManagerPinLookup ON Users (PinLookup)
+    WHERE UserRole = 'manager' AND System = 'POS' AND isDisabled = 0 AND PinLookup IS NOT NULL;
+CREATE INDEX IF NOT EXISTS IX_Users_Role_System_Disabled ON Users (UserRole, System, isDisabled, UserID);
+CREATE INDEX IF NOT EXISTS IX_Users_CreatedAt ON Users (CreatedAt, UserID);
+
+CREATE TABLE IF NOT EXISTS FailedLogins (
+    Username TEXT PRIMARY KEY,
+    Attempts INTEGER,
+    LastAttempt TIMESTAMP,
+    IsLockedOut INTEGER NOT NULL DEFAULT 0,
+    LockoutUntil TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS RevokedTokens (
+    Jti TEXT PRIMARY KEY,
+    Username TEXT,
+    ExpiresAt TIMESTAMP NOT NULL,
+    RevokedAt TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS IX_RevokedTokens_RevokedAt ON RevokedTokens (RevokedAt);
+CREATE INDEX IF NOT EXISTS IX_RevokedTokens_ExpiresAt ON RevokedTokens (ExpiresAt);
+
+CREATE TABLE IF NOT EXISTS TokenRevocationCutoffs (
+    Username TEXT PRIMARY KEY,
+    RevokedBefore TIMESTAMP NOT NULL,
+    UpdatedAt TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS PasswordResetTokens (
+    TokenHash TEXT PRIMARY KEY,
+    Email TEXT NOT NULL,
+    CreatedAt TIMESTAMP NOT NULL,
+    ExpiresAt TIMESTAMP NOT NULL,
+    UsedAt TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS IX_PasswordResetTokens_ExpiresAt ON PasswordResetTokens (ExpiresAt);
+CREATE INDEX IF NOT EXISTS IX_PasswordResetTokens_Email ON PasswordResetTokens (Email) WHERE UsedAt IS NULL;
+"""
+
+# datetimes round-trip like they do through pyodbc
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+sqlite3.register_converter("TIMESTAMP", lambda value: datetime.fromisoformat(value.decode("utf-8")))
+
+# tuple rows with pyodbc-style attribute access (row.Username)
+@lru_cache(maxsize=256)
+def _row_class(names: tuple[str, ...]):
+    attrs = {"__slots__": ()}
+    for i, name in enumerate(names):
+        attrs[name] = property(lambda self, i=i: self[i])
+    return type("Row", (tuple,), attrs)
+
+def _row_factory(cursor, values):
+    return _row_class(tuple(column[0] for column in cursor.description))(values)
+
+# aioodbc-shaped cursor: parameters as one sequence or positional, the sql arrives already in sqlite's
+# spelling (repositories._SQLITE_STATEMENTS and the sqlite branches of the generated statements)
+class Cursor:
+    def __init__(self, conn, cursor: aiosqlite.Cursor):
+        self._conn = conn
+        self._cursor = cursor
+
+    async def execute(self, sql: str, *params):
+        if len(params) == 1 and isinstance(params[0], (tuple, list)):
+            params = params[0]
+        self._conn.last_usage = self._conn.loop.time()
+        await self._cursor.execute(sql, tuple(params))
+        return self
+
+    async def executemany(self, sql: str, seq):
+        self._conn.last_usage = self._conn.loop.time()
+        await self._cursor.executemany(sql, [tuple(params) for params in seq])
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    async def fetchone(self):
+        return await self._cursor.fetchone()
+
+    async def fetchall(self):
+        return await self._cursor.fetchall()
+
+    async def fetchmany(self, size: int):
+        return await self._cursor.fetchmany(size)
+
+    async def close(self):
+        await self._cursor.close()
+
+# awaitable and async context manager, like aioodbc's conn.cursor()
+class _CursorContext:
+    def __init__(self, coro):
+        self._coro = coro
+        self._cursor = None
+
+    def __await__(self):
+        return self._coro.__await__()
+
+    async def __aenter__(self):
+        self._cursor = await self._coro
+        return self._cursor
+
+    async def __aexit__(self, *exc):
+        await self._cursor.close()
+
+class Connection:
+    def __init__(self, db: aiosqlite.Connection):
+        self._db = db
+        self.loop = asyncio.get_running_loop()
+        self.last_usage = self.loop.time()
+        self.closed = False
+
+    async def _cursor(self):
+        return Cursor(self, await self._db.cursor())
+
+    def cursor(self):
+        return _CursorContext(self._cursor())
+
+    # every statement autocommits, same as the aioodbc pool
+    async def commit(self):
+        pass
+
+    async def rollback(self):
+        pass
+
+    async def close(self):
+        if not self.closed:
+            self.closed = True
+            await self._db.close()
+
+async def connect(path: str = SQLITE_PATH) -> Connection:
+    db = await aiosqlite.connect(path, isolation_level=None, detect_types=sqlite3.PARSE_DECLTYPES, cached_statements=SQLITE_STATEMENT_CACHE)
+    db.row_factory = _row_factory
+    await db.execute("PRAGMA journal_mode=WAL")
+    await db.execute("PRAGMA synchronous=NORMAL")
+    await db.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    return Connection(db)
+
+# create any missing tables, safe to run on every start
+def create_schema(path: str = SQLITE_PATH):
+    with sqlite3.connect(path) as db:
+        db.executescript(SCHEMA)
+
+# the subset of aioodbc.Pool that database.py relies on
+class Pool:
+    def __init__(self, path: str, minsize: int, maxsize: int):
+        self.path = path
+        self.minsize = minsize
+        self.maxsize = maxsize
+        self._free: list[Connection] = []
+        self._used: set[Connection] = set()
+        self._slots = asyncio.Semaphore(maxsize)
+
+    @property
+    def size(self):
+        return len(self._free) + len(self._used)
+
+    @property
+    def freesize(self):
+        return len(self._free)
+
+    async def fill(self):
+        while self.size < self.minsize:
+            self._free.append(await connect(self.path))
+
+    async def acquire(self) -> Connection:
+        await self._slots.acquire()
+        try:
+            conn = self._free.pop() if self._free else await connect(self.path)
+        except BaseException:
+            self._slots.release()
+            raise
+        self._used.add(conn)
+        return conn
+
+    async def release(self, conn: Connection):
+        if conn in self._used:
+            self._used.discard(conn)
+            if not conn.closed:
+                self._free.append(conn)
+            self._slots.release()
+
+    def close(self):
+        pass
+
+    async def wait_closed(self):
+        free, self._free = self._free, []
+        for conn in free + list(self._used):
+            await conn.close()
+        self._used.clear()
+
+async def create_pool(path: str = SQLITE_PATH, minsize: int = 1, maxsize: int = 10) -> Pool:
+    await asyncio.to_thread(create_schema, path)
+    pool = Pool(path, minsize, maxsize)
+    await pool.fill()
+    logger.info(f"SQLite stand-in database at {os.path.abspath(path)}")
+    return pool
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import os
+import time
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+import bus
+import database
+import hashing
+import lockout
+import mailer
+import reset_tokens
+import search
+from revocation import revocations
+
+logger = logging.getLogger(__name__)
+
+_T0 = time.perf_counter()
+
+# boot config
+STARTUP_DB_RETRY_MAX = float(os.getenv("STARTUP_DB_RETRY_MAX", 30))   # longest wait between pool connect attempts
+BOOTSTRAP_ADMIN = os.getenv("BOOTSTRAP_ADMIN", "true").lower() == "true"   # serve.py leaves it on for one worker only
+
+router = APIRouter()
+
+_task = None
+_ready = False
+_steps: dict[str, float] = {}
+_errors: dict[str, str] = {}
+_time_to_ready = None
+
+async def _step(name: str, coro):
+    start = time.perf_counter()
+    await coro
+    _steps[name] = round(time.perf_counter() - start, 3)
+
+# run a boot step until it succeeds, waiting longer after each failure. the last error shows in /readyz
+async def _retrying(name: str, what: str, fn):
+    delay = 0.5
+    while True:
+        try:
+            await fn()
+            _errors.pop(name, None)
+            return
+        except Exception as e:
+            _errors[name] = str(e)
+            logger.error(f"{what} failed, retrying in {delay:.1f}s: {e}", exc_info=True)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, STARTUP_DB_RETRY_MAX)
+
+# keep trying to open the pool, an unreachable sql server must not crash the process
+async def _connect_db():
+    await _retrying("db", "DB pool connect", database.init_pool)
+
+async def _warm_hashing():
+    try:
+        await hashing.warm()
+    except Exception:
+        # a broken process pool stays broken, the next attempt starts a fresh one
+        hashing.shutdown()
+        raise
+
+# state that must be in memory before authenticated traffic is served, each load is retried on its own
+async def _load_state():
+    await asyncio.gather(
+        _step("lockout", _retrying("lockout", "Lockout state load", lockout.engine.load)),
+        _step("revocation", _retrying("revocation", "Revocation list load", revocations.load)),
+    )
+    lockout.engine.start()
+    revocations.start()
+    reset_tokens.store.start()
+
+# measured on the warmed pool once traffic is allowed, hashes made before it finishes use the configured costs
+# (under serve.py the launcher has measured once for every worker and turned this off)
+async def _calibrate_hashing():
+    try:
+        await hashing.calibrate()
+    except Exception as e:
+        logger.error(f"Hash cost calibration failed, keeping {hashing.describe_policy(hashing.policy())}: {e}", exc_info=True)
+
+# user search answers 503 until this is done, a failed load is retried
+async def _load_search_index():
+    await _retrying("search", "Search index load", search.index.load)
+
+async def _bootstrap_admin():
+    if not BOOTSTRAP_ADMIN:
+        return
+    from routers import auth
+    try:
+        await auth.create_admin_user()
+    except Exception as e:
+        logger.error(f"Admin bootstrap failed: {e}", exc_info=True)
+
+async def _boot():
+    global _ready, _time_to_ready
+    # the pool, the hashing processes and the link to the other workers come up side by side
+    steps = [_step("db_pool", _connect_db()), _step("hashing", _retrying("hashing", "Hash worker warmup", _warm_hashing))]
+    if bus.BUS_SOCKET:
+        steps.append(_step("bus", bus.wait_connected()))
+    await asyncio.gather(*steps)
+    await _load_state()
+    _ready = True
+    _time_to_ready = round(time.perf_counter() - _T0, 3)
+    logger.info(f"Ready in {_time_to_ready}s {_steps}")
+    # serve.py waits for this before retiring the worker this one replaces
+    bus.publish("worker.ready", os.getpid())
+    # nothing waits on these
+    await _step("search_index", _load_search_index())
+    await _step("hash_calibration", _calibrate_hashing())
+    await _step("admin_bootstrap", _bootstrap_admin())
+
+# called from the lifespan, returns straight away so the server starts accepting connections
+def begin():
+    global _task
+    mailer.dispatcher.start()
+    if _task is None:
+        _task = asyncio.create_task(_boot())
+
+async def stop():
+    global _task
+    if _task is not None and not _task.done():
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+    _task = None
+
+def is_ready() -> bool:
+    return _ready
+
+def startup_stats():
+    return {"ready": _ready, "time_to_ready_s": _time_to_ready, "steps_s": dict(_steps), "errors": dict(_errors)}
+
+# liveness: the process is up and the loop is answering
+@router.get("/healthz")
+async def healthz():
+    return {"status": "ok", "uptime_s": round(time.perf_counter() - _T0, 3)}
+
+# readiness: the pool is open and lockout/revocation state is loaded
+@router.get("/readyz")
+async def readyz():
+    body = startup_stats()
+    return JSONResponse(content=body, status_code=200 if _ready else 503)
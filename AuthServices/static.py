@@ -0,0 +1,107 @@
+import mimetypes
+import os
+import re
+import stat
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+# static serving config
+UPLOADS_IMMUTABLE_MAX_AGE = int(os.getenv("UPLOADS_IMMUTABLE_MAX_AGE", 365 * 24 * 3600))
+
+# <sha256>[.<size>].<ext>, written by media.py, the bytes behind such a name never change
+_CONTENT_ADDRESSED = re.compile(r"^[0-9a-f]{64}(\.\d+)?\.[a-z0-9]+$")
+_WEBP_SOURCES = (".jpg", ".jpeg", ".png")
+_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+# true if the Accept / Accept-Encoding header lists token explicitly with a non-zero q
+def _accepts(header: str, token: str) -> bool:
+    for item in header.split(","):
+        value, *params = item.split(";")
+        if value.strip() != token:
+            continue
+        for param in params:
+            key, _, q = param.strip().partition("=")
+            if key == "q":
+                try:
+                    return float(q) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+class _UploadFileResponse(FileResponse):
+    # starlette only honours If-Range against its own mtime etag
+    def _should_use_range(self, http_if_range, stat_result):
+        return http_if_range == self.headers.get("etag") or super()._should_use_range(http_if_range, stat_result)
+
+# StaticFiles for /uploads: immutable caching and strong etags on content-addressed names,
+# plus a .webp sibling for image requests and .br/.gz siblings for everything else when the client accepts them
+class UploadFiles(StaticFiles):
+    async def get_response(self, path: str, scope):
+        if scope["method"] in ("GET", "HEAD"):
+            response = await self._variant_response(path, scope)
+            if response is not None:
+                return response
+        return await super().get_response(path, scope)
+
+    async def _lookup_file(self, path: str):
+        try:
+            full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path)
+        except OSError:
+            return None, None
+        if stat_result is None or not stat.S_ISREG(stat_result.st_mode):
+            return None, None
+        return full_path, stat_result
+
+    async def _variant_response(self, path: str, scope):
+        request_headers = Headers(scope=scope)
+        root, ext = os.path.splitext(path)
+        if ext.lower() in _WEBP_SOURCES:
+            if _accepts(request_headers.get("accept", ""), "image/webp"):
+                full_path, stat_result = await self._lookup_file(f"{root}.webp")
+                if full_path is not None:
+                    return self.file_response(full_path, stat_result, scope, vary="Accept")
+            return None
+
+        accept_encoding = request_headers.get("accept-encoding", "")
+        for encoding, suffix in _ENCODINGS:
+            if _accepts(accept_encoding, encoding):
+                full_path, stat_result = await self._lookup_file(f"{path}{suffix}")
+                if full_path is not None:
+                    return self.file_response(
+                        full_path, stat_result, scope,
+                        vary="Accept-Encoding", encoding=encoding, served_name=os.path.basename(path)
+                    )
+        return None
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200, *, vary: str | None = None, encoding: str | None = None, served_name: str | None = None):
+        name = os.path.basename(full_path)
+        served_name = served_name or name
+        headers = {}
+        if _CONTENT_ADDRESSED.match(served_name):
+            # the file name is the content hash, so it doubles as a strong validator
+            headers["etag"] = f'"{name}"'
+            headers["cache-control"] = f"public, max-age={UPLOADS_IMMUTABLE_MAX_AGE}, immutable"
+        else:
+            headers["cache-control"] = "no-cache"
+        if vary is not None:
+            headers["vary"] = vary
+        elif os.path.splitext(served_name)[1].lower() in _WEBP_SOURCES:
+            headers["vary"] = "Accept"
+        else:
+            headers["vary"] = "Accept-Encoding"
+        if encoding is not None:
+            headers["content-encoding"] = encoding
+
+        response = _UploadFileResponse(
+            full_path,
+            status_code=status_code,
+            headers=headers,
+            media_type=mimetypes.guess_type(served_name)[0] or "text/plain",
+            stat_result=stat_result,
+        )
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
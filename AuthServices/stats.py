@@ -0,0 +1,65 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# histogram bucket upper bounds in seconds, shared by every timing so /metrics can aggregate them
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# lightweight timing counters shared by the db pool, hashing and login paths
+class Timing:
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        # per-bucket counts, the last slot is +Inf
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.buckets[bisect_left(BUCKETS, seconds)] += 1
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "max_ms": round(self.max * 1000, 3),
+            "total_s": round(self.total, 3),
+        }
+
+_timings: dict[str, Timing] = {}
+_counters: dict[str, int] = {}
+
+# get or create a named timing
+def timing(name: str) -> Timing:
+    t = _timings.get(name)
+    if t is None:
+        t = _timings[name] = Timing()
+    return t
+
+# time a block of code into a named timing
+@contextmanager
+def timed(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing(name).observe(time.perf_counter() - start)
+
+# bump a named event counter
+def incr(name: str, amount: int = 1):
+    _counters[name] = _counters.get(name, 0) + amount
+
+# snapshot of every timing whose name starts with prefix
+def snapshot(prefix: str = ""):
+    return {name: t.snapshot() for name, t in _timings.items() if name.startswith(prefix)}
+
+def timings():
+    return _timings
+
+def counters():
+    return _counters
@@ -0,0 +1,66 @@
+# settings go in before any service module is imported: a throwaway sqlite stand-in and keys dir, cheap bcrypt,
+# one hashing process and no bus. run from AuthServices/: python -m pytest -q
+import os
+import secrets
+import sys
+import tempfile
+import time
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_WORKDIR = tempfile.mkdtemp(prefix="authsvc-tests-")
+os.environ.update(
+    DB_BACKEND="sqlite",
+    SQLITE_PATH=os.path.join(_WORKDIR, "tests.sqlite3"),
+    JWT_KEYS_DIR=os.path.join(_WORKDIR, "keys"),
+    PIN_LOOKUP_KEY=secrets.token_hex(32),
+    HASH_WORKERS="1",
+    HASH_CALIBRATE="false",
+    BCRYPT_ROUNDS="4",
+    BCRYPT_MIN_ROUNDS="4",
+    DB_POOL_MIN_SIZE="1",
+    BUS_SOCKET="",
+)
+
+ADMIN = ("superadmin", "superadmin123")
+PASSWORD = "test-password-123"
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+# one running app for the whole session, tests pick usernames of their own
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    import main
+    with TestClient(main.app) as client:
+        deadline = time.monotonic() + 60
+        while "admin_bootstrap" not in client.get("/readyz").json()["steps_s"]:
+            assert time.monotonic() < deadline, "service did not finish booting"
+            time.sleep(0.05)
+        yield client
+
+def login(client, username: str, password: str) -> dict:
+    response = client.post("/auth/token", data={"username": username, "password": password})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+@pytest.fixture(scope="session")
+def admin(client) -> dict:
+    return login(client, *ADMIN)
+
+# create a user through /users/create, returns the form that was sent
+def create_user(client, admin: dict, username: str, role: str = "rider", system: str = "OOS", **fields) -> dict:
+    form = {
+        "firstName": "Test", "lastName": username.capitalize(), "username": username, "password": PASSWORD,
+        "email": f"{username}@example.com", "userRole": role, "system": system, **fields,
+    }
+    response = client.post("/users/create", headers=admin, data=form)
+    assert response.status_code == 200, response.text
+    return form
+
+def user_id(client, admin: dict, username: str) -> int:
+    response = client.get("/users/search", headers=admin, params={"q": username, "fields": "userID,username"})
+    return next(user["userID"] for user in response.json() if user["username"] == username)
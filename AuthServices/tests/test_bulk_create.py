@@ -0,0 +1,80 @@
+import os
+import sqlite3
+from contextlib import closing
+import routers.users
+from repositories import UserRepository
+from conftest import create_user, login
+
+def _row(username: str, **fields) -> dict:
+    return {"firstName": "Bulk", "lastName": "User", "username": username, "password": "bulk-password-1",
+            "email": f"{username}@example.com", "userRole": "rider", "system": "OOS", **fields}
+
+def test_row_errors_do_not_stop_the_import(client, admin):
+    create_user(client, admin, "bulkexisting")
+    rows = [
+        _row("bulkok1"),
+        _row("bulkbadrole", userRole="owner"),
+        _row("bulkshort", password="short"),
+        _row("bulkok1", email="other@example.com"),
+        _row("bulkexisting", email="fresh@example.com"),
+        _row("bulkemail", email="bulkexisting@example.com"),
+        _row("bulkmissing", firstName=None),
+        "not an object",
+        _row("bulkok2", phoneNumber="09170000000"),
+    ]
+    body = client.post("/users/bulk-create", headers=admin, json=rows).json()
+    assert body["created"] == 2 and body["failed"] == 7
+    by_row = {r["row"]: r for r in body["results"]}
+    assert [by_row[i].get("status") for i in range(len(rows))] == [
+        "created", "error", "error", "error", "error", "error", "error", "error", "created",
+    ]
+    assert by_row[1]["detail"] == "Invalid role"
+    assert "12 characters" in by_row[2]["detail"]
+    assert "more than once" in by_row[3]["detail"]
+    assert "already taken" in by_row[4]["detail"]
+    assert by_row[5]["detail"] == "Email is already used"
+    assert "firstName" in by_row[6]["detail"]
+    assert set(body["timings"]) >= {"validate_ms", "duplicate_check_ms", "hash_ms", "insert_ms", "total_ms"}
+    # created users can log in with the imported password
+    login(client, "bulkok2", "bulk-password-1")
+
+def test_csv_upload(client, admin):
+    csv = "firstName,lastName,username,password,email,userRole,system,pin\n" \
+          "Csv,One,bulkcsv1,bulk-password-1,bulkcsv1@example.com,rider,OOS,\n" \
+          "Csv,Two,bulkcsv2,bulk-password-1,bulkcsv2@example.com,manager,POS,\n"
+    response = client.post("/users/bulk-create", headers=admin, files={"file": ("users.csv", csv, "text/csv")})
+    results = response.json()["results"]
+    assert [r.get("status") for r in results] == ["created", "error"]
+    assert "PIN" in results[1]["detail"]
+    response = client.post("/users/bulk-create", headers={**admin, "Content-Type": "text/csv"}, content=csv.replace("bulkcsv", "bulkraw"))
+    assert response.json()["created"] == 1
+
+def test_rejected_payloads(client, admin, monkeypatch):
+    assert client.post("/users/bulk-create", headers=admin, json={"username": "x"}).status_code == 400
+    assert client.post("/users/bulk-create", headers={**admin, "Content-Type": "application/json"}, content=b"{").status_code == 400
+    monkeypatch.setattr(routers.users, "BULK_CREATE_MAX_ROWS", 2)
+    assert client.post("/users/bulk-create", headers=admin, json=[_row(f"bulkmax{i}") for i in range(3)]).status_code == 400
+
+def test_batches_are_inserted_separately(client, admin, monkeypatch):
+    monkeypatch.setattr(routers.users, "BULK_INSERT_BATCH_SIZE", 2)
+    body = client.post("/users/bulk-create", headers=admin, json=[_row(f"bulkbatch{i}") for i in range(5)]).json()
+    assert body["created"] == 5
+    listed = client.get("/users/search", headers=admin, params={"q": "bulkbatch", "fields": "username"}).json()
+    assert sorted(user["username"] for user in listed) == [f"bulkbatch{i}" for i in range(5)]
+
+def test_failed_batch_leaves_none_of_its_rows(client, admin, monkeypatch):
+    monkeypatch.setattr(routers.users, "BULK_INSERT_BATCH_SIZE", 2)
+    real = UserRepository.insert_many
+
+    # the second batch writes its rows, then the connection drops
+    async def partial(self, rows):
+        await real(self, rows)
+        if rows[0][8] == "bulkpartial2":
+            raise RuntimeError("connection lost")
+
+    monkeypatch.setattr(UserRepository, "insert_many", partial)
+    body = client.post("/users/bulk-create", headers=admin, json=[_row(f"bulkpartial{i}") for i in range(5)]).json()
+    assert body["created"] == 3
+    with closing(sqlite3.connect(os.environ["SQLITE_PATH"], isolation_level=None)) as db:
+        stored = db.execute("SELECT Username FROM Users WHERE Username LIKE 'bulkpartial%' ORDER BY Username").fetchall()
+    assert [username for username, in stored] == ["bulkpartial0", "bulkpartial1", "bulkpartial4"]
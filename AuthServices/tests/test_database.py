@@ -0,0 +1,26 @@
+import re
+import time
+import database
+import repositories
+
+async def _raw_connection():
+    async with database.db_connection() as conn:
+        return conn._conn
+
+def test_connections_past_their_lifetime_are_replaced(client):
+    first = client.portal.call(_raw_connection)
+    assert first._born <= time.monotonic()
+    assert client.portal.call(_raw_connection) is first
+
+    # the birth time lives on the connection, not in a table keyed by a reusable id()
+    first._born = time.monotonic() - database.POOL_MAX_LIFETIME - 1
+    replaced = client.portal.call(_raw_connection)
+    assert replaced is not first and first.closed
+    assert replaced._born > first._born
+
+# the sqlite backend runs the sql as given, every t-sql-only statement needs its sqlite spelling
+def test_sqlite_statements_have_no_tsql():
+    generated = [repositories._page_sql(("role",), True, repositories.USER_LIST_COLUMNS),
+                 repositories._by_ids_sql(repositories.USER_LIST_COLUMNS)]
+    for sql in [*repositories.STATEMENTS.values(), *generated]:
+        assert not re.search(r"\bTOP\b|OPENJSON|SYSUTCDATETIME|GETDATE|\bMERGE\b", sql), sql
@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+from conftest import create_user
+
+# staff in AUTH are only created here, so the filtered list is exactly these
+def _staff(client, admin):
+    names = [f"keysetstaff{i}" for i in range(5)]
+    for name in names:
+        create_user(client, admin, name, role="staff", system="AUTH")
+    return names
+
+def test_keyset_pages_cover_every_row_once(client, admin):
+    names = _staff(client, admin)
+    seen, after, pages = [], None, 0
+    while True:
+        params = {"role": "staff", "system": "AUTH", "limit": 2, "include_total": True}
+        if after is not None:
+            params["after"] = after
+        response = client.get("/users/list-users", headers=admin, params=params)
+        assert response.status_code == 200
+        assert response.headers["X-Total-Count"] == "5"
+        page = response.json()
+        seen.extend(page)
+        pages += 1
+        after = response.headers.get("X-Next-Cursor")
+        if after is None:
+            break
+        assert int(after) == page[-1]["userID"]
+    assert pages == 3
+    assert [user["username"] for user in seen] == names
+    ids = [user["userID"] for user in seen]
+    assert ids == sorted(set(ids))
+
+def test_filters(client, admin):
+    for name in ("filteradmin1", "filteradmin2"):
+        create_user(client, admin, name, role="admin", system="IMS")
+    admins = client.get("/users/list-users", headers=admin, params={"role": "admin", "system": "IMS"}).json()
+    assert [user["username"] for user in admins] == ["filteradmin1", "filteradmin2"]
+    assert client.put(f"/users/disable/{admins[0]['userID']}", headers=admin).status_code == 200
+
+    def usernames(**params):
+        response = client.get("/users/list-users", headers=admin, params={"role": "admin", "system": "IMS", **params})
+        return [user["username"] for user in response.json()]
+
+    assert usernames(is_disabled=True) == ["filteradmin1"]
+    assert usernames(is_disabled=False) == ["filteradmin2"]
+    assert usernames(system="POS") == []
+    assert usernames(created_from=(datetime.utcnow() + timedelta(days=1)).isoformat()) == []
+    assert usernames(created_to=(datetime.utcnow() + timedelta(days=1)).isoformat()) == ["filteradmin1", "filteradmin2"]
+
+def test_limit_is_bounded(client, admin):
+    assert client.get("/users/list-users", headers=admin, params={"limit": 0}).status_code == 422
+    assert client.get("/users/list-users", headers=admin, params={"limit": 100000}).status_code == 422
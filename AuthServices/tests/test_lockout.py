@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+import lockout
+from conftest import create_user
+
+def test_threshold_failures_lock_the_account():
+    engine = lockout.LockoutEngine()
+    for _ in range(lockout.LOCKOUT_THRESHOLD - 1):
+        assert engine.record_failure("alice") is False
+    assert engine.check("alice")[:2] == (False, lockout.LOCKOUT_THRESHOLD - 1)
+    assert engine.record_failure("alice") is True
+    is_locked, attempts, remaining = engine.check("alice")
+    assert is_locked and attempts == lockout.LOCKOUT_THRESHOLD
+    assert 0 < remaining <= lockout.LOCKOUT_MINUTES * 60
+    # further failures do not count as new lockouts
+    assert engine.record_failure("alice") is False
+    assert engine.lockouts == 1
+
+def test_failures_outside_the_window_stop_counting():
+    engine = lockout.LockoutEngine()
+    old = datetime.utcnow() - timedelta(seconds=lockout.LOCKOUT_WINDOW_SECONDS + 1)
+    for _ in range(lockout.LOCKOUT_THRESHOLD - 1):
+        engine._failure("bob", None, old)
+    assert engine.record_failure("bob") is False
+    assert engine.check("bob") == (False, 1, None)
+
+def test_success_resets_and_lock_expires():
+    engine = lockout.LockoutEngine()
+    engine.record_failure("carol")
+    engine.record_success("carol")
+    assert engine.check("carol") == (False, 0, None)
+
+    for _ in range(lockout.LOCKOUT_THRESHOLD):
+        engine.record_failure("carol")
+    engine._users["carol"].locked_until = datetime.utcnow() - timedelta(seconds=1)
+    assert engine.check("carol") == (False, 0, None)
+    assert engine.status("carol") == {"failed_attempts": 0, "is_locked": False, "remaining_seconds": 0}
+    assert "carol" in engine._dirty
+
+def test_ip_throttling_spans_usernames():
+    engine = lockout.LockoutEngine()
+    for i in range(lockout.IP_MAX_FAILURES - 1):
+        engine.record_failure(f"user{i}", "10.0.0.1")
+    assert engine.ip_retry_after("10.0.0.1") == 0
+    engine.record_failure("someone", "10.0.0.1")
+    assert 0 < engine.ip_retry_after("10.0.0.1") <= lockout.IP_WINDOW_SECONDS
+    assert engine.ip_retry_after("10.0.0.2") == 0
+
+def test_prune_keeps_only_live_state():
+    engine = lockout.LockoutEngine()
+    engine._failure("dave", "10.0.0.3", datetime.utcnow() - timedelta(seconds=lockout.LOCKOUT_WINDOW_SECONDS + 1))
+    engine._prune()
+    assert engine.stats()["tracked_usernames"] == 0 and engine.stats()["tracked_ips"] == 0
+
+def test_flushed_entries_are_pruned(client):
+    engine = lockout.LockoutEngine()
+    old = datetime.utcnow() - timedelta(seconds=lockout.LOCKOUT_WINDOW_SECONDS + 1)
+    for i in range(50):
+        engine._failure(f"prunedrider{i}", None, old)
+        engine._dirty.add(f"prunedrider{i}")
+    for _ in range(lockout.LOCKOUT_THRESHOLD):
+        engine.record_failure("prunedlocked")
+    client.portal.call(engine.flush)
+    # written to FailedLogins, then dropped once their window is empty, the locked one stays
+    assert list(engine._users) == ["prunedlocked"]
+    assert engine.stats()["pending_writes"] == 0
+
+def test_login_lockout_end_to_end(client, admin):
+    form = create_user(client, admin, "lockoutrider")
+    for _ in range(lockout.LOCKOUT_THRESHOLD):
+        response = client.post("/auth/token", data={"username": form["username"], "password": "wrong-password"})
+        assert response.status_code == 401
+    status = client.get("/auth/lockout-status", params={"username": form["username"]}).json()
+    assert status["is_locked"] and status["failed_attempts"] == lockout.LOCKOUT_THRESHOLD
+    # locked even with the right password
+    response = client.post("/auth/token", data={"username": form["username"], "password": form["password"]})
+    assert response.status_code == 403
@@ -0,0 +1,130 @@
+import asyncio
+import socket
+from email.message import EmailMessage
+import pytest
+from aiosmtpd.controller import Controller
+import mailer
+
+pytestmark = pytest.mark.anyio
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+# answers each DATA with the next scripted reply, then 250
+class _Server:
+    def __init__(self, replies=()):
+        self.replies = list(replies)
+        self.received = []
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.replies:
+            return self.replies.pop(0)
+        self.received.append(envelope.rcpt_tos)
+        return "250 OK"
+
+@pytest.fixture
+def smtp_server():
+    servers = []
+
+    def start(replies=()):
+        handler = _Server(replies)
+        port = _free_port()
+        controller = Controller(handler, hostname="127.0.0.1", port=port)
+        controller.start()
+        servers.append(controller)
+        return handler, port
+
+    yield start
+    for controller in servers:
+        controller.stop()
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(mailer, "MAIL_RETRY_BASE", 0.01)
+    monkeypatch.setattr(mailer, "MAIL_MAX_ATTEMPTS", 3)
+
+def _message(to="rider@example.com"):
+    message = EmailMessage()
+    message["From"] = "noreply@example.com"
+    message["To"] = to
+    message["Subject"] = "test"
+    message.set_content("hello")
+    return message
+
+async def _settle(dispatcher, timeout=5):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while dispatcher._queue.qsize() or dispatcher._in_flight or dispatcher._retries:
+        assert loop.time() < deadline, dispatcher.stats()
+        await asyncio.sleep(0.01)
+
+def _dispatcher(port, **kwargs):
+    return mailer.MailDispatcher(hostname="127.0.0.1", port=port, username="", start_tls=False, **kwargs)
+
+async def test_sends_over_one_connection(smtp_server):
+    handler, port = smtp_server()
+    dispatcher = _dispatcher(port, pool_size=1)
+    dispatcher.start()
+    for i in range(3):
+        assert dispatcher.enqueue(_message(f"user{i}@example.com"))
+    await _settle(dispatcher)
+    assert handler.received == [["user0@example.com"], ["user1@example.com"], ["user2@example.com"]]
+    assert dispatcher.stats()["connections"] == 1
+    await dispatcher.stop()
+    assert (dispatcher.sent, dispatcher.retried, dispatcher.failed) == (3, 0, 0)
+
+async def test_transient_failure_is_retried_with_backoff(smtp_server):
+    handler, port = smtp_server(["451 Try again later", "421 Busy"])
+    dispatcher = _dispatcher(port, pool_size=1)
+    dispatcher.start()
+    assert dispatcher.enqueue(_message())
+    await _settle(dispatcher)
+    await dispatcher.stop()
+    assert handler.received == [["rider@example.com"]]
+    assert (dispatcher.sent, dispatcher.retried, dispatcher.failed) == (1, 2, 0)
+
+async def test_gives_up_after_max_attempts(smtp_server):
+    handler, port = smtp_server(["451 Try again later"] * 3)
+    dispatcher = _dispatcher(port, pool_size=1)
+    dispatcher.start()
+    dispatcher.enqueue(_message())
+    await _settle(dispatcher)
+    await dispatcher.stop()
+    assert handler.received == []
+    assert (dispatcher.sent, dispatcher.retried, dispatcher.failed) == (0, 2, 1)
+
+async def test_permanent_failure_is_not_retried(smtp_server):
+    handler, port = smtp_server(["550 No such user"])
+    dispatcher = _dispatcher(port, pool_size=1)
+    dispatcher.start()
+    dispatcher.enqueue(_message())
+    dispatcher.enqueue(_message("next@example.com"))
+    await _settle(dispatcher)
+    await dispatcher.stop()
+    # the session survives the 5xx and carries the next message
+    assert handler.received == [["next@example.com"]]
+    assert (dispatcher.sent, dispatcher.retried, dispatcher.failed) == (1, 0, 1)
+
+async def test_full_queue_drops_new_messages(smtp_server):
+    handler, port = smtp_server()
+    dispatcher = _dispatcher(port, pool_size=1, queue_size=2)
+    dispatcher.start()
+    # the sender has not run yet, so nothing leaves the queue
+    assert dispatcher.enqueue(_message("a@example.com"))
+    assert dispatcher.enqueue(_message("b@example.com"))
+    assert not dispatcher.enqueue(_message("c@example.com"))
+    assert dispatcher.stats()["dropped"] == 1
+    await _settle(dispatcher)
+    await dispatcher.stop()
+    assert handler.received == [["a@example.com"], ["b@example.com"]]
+
+async def test_unreachable_server_is_retried_then_failed():
+    dispatcher = _dispatcher(_free_port(), pool_size=1)
+    dispatcher.start()
+    dispatcher.enqueue(_message())
+    await _settle(dispatcher)
+    await dispatcher.stop()
+    assert (dispatcher.sent, dispatcher.retried, dispatcher.failed) == (0, 2, 1)
+    assert dispatcher.stats()["connections"] == 0
@@ -0,0 +1,69 @@
+import asyncio
+import os
+import pytest
+import media
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+def photo_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(media, "PROFILE_PHOTO_DIR", str(tmp_path))
+    yield tmp_path
+    media._failed.clear()
+
+def _write_png(path):
+    from PIL import Image
+    Image.new("RGB", (600, 400), (200, 30, 30)).save(path, "PNG")
+
+async def test_variants_are_built_once(photo_dir):
+    _write_png(photo_dir / "good.png")
+    written = await media.build_variants("good.png", str(photo_dir))
+    assert sorted(written) == sorted(media._variant_names("good.png"))
+    assert await media.build_variants("good.png", str(photo_dir)) == []
+    media._ready.discard("good.png")
+
+async def test_failed_build_is_not_rescheduled(photo_dir):
+    # passes the upload sniffing but does not decode
+    (photo_dir / "broken.png").write_bytes(b"\x89PNG\r\n\x1a\n" + b"\x00" * 64)
+    with pytest.raises(Exception):
+        await media.build_variants("broken.png", str(photo_dir))
+    assert "broken.png" in media._failed
+    assert media.media_stats()["failed_cached"] == 1
+
+    media.schedule_variants("broken.png", str(photo_dir))
+    assert not media._background and "broken.png" not in media._inflight
+
+    original, variants = media.profile_image_urls("broken.png")
+    assert original.endswith("/profile_pictures/broken.png") and variants is None
+    assert not media._background
+
+async def test_missing_original_keeps_the_original_url(photo_dir):
+    media.schedule_variants("gone.jpg", str(photo_dir))
+    while media._background:
+        await asyncio.sleep(0.01)
+    assert "gone.jpg" in media._failed
+    assert media.profile_image_urls("gone.jpg")[1] is None
+    assert not media._background
+
+async def test_reupload_retries_a_failed_build(photo_dir):
+    name = "later.png"
+    with pytest.raises(Exception):
+        await media.build_variants(name, str(photo_dir))
+    assert name in media._failed
+
+    # a fresh upload of the file schedules it again
+    _write_png(photo_dir / name)
+    media.schedule_variants(name, str(photo_dir), retry=True)
+    while media._background:
+        await asyncio.sleep(0.01)
+    assert name not in media._failed and media.variants_ready(name, str(photo_dir))
+    assert all(os.path.exists(photo_dir / v) for v in media._variant_names(name))
+    media._ready.discard(name)
+
+async def test_oversized_image_is_refused_before_decoding(photo_dir, monkeypatch):
+    _write_png(photo_dir / "huge.png")
+    monkeypatch.setattr(media, "MEDIA_MAX_IMAGE_PIXELS", 600 * 400 - 1)
+    with pytest.raises(ValueError, match="pixel limit"):
+        await media.build_variants("huge.png", str(photo_dir))
+    assert "huge.png" in media._failed
+    assert not any(os.path.exists(photo_dir / v) for v in media._variant_names("huge.png"))
@@ -0,0 +1,148 @@
+import os
+import sqlite3
+from contextlib import closing
+import pytest
+from fastapi.testclient import TestClient
+import hashing
+import main
+from conftest import create_user, login, user_id
+
+def test_pin_lookup_is_keyed(monkeypatch):
+    first = hashing.pin_lookup("1234")
+    assert first == hashing.pin_lookup("1234")
+    assert first != hashing.pin_lookup("1235")
+    monkeypatch.setattr(hashing, "PIN_LOOKUP_KEY", "x" * 64)
+    assert hashing.pin_lookup("1234") != first
+
+@pytest.mark.parametrize("key", ["", "a3f1c07d5be24e6f"])
+def test_pin_lookup_refuses_missing_or_short_key(monkeypatch, key):
+    monkeypatch.setattr(hashing, "PIN_LOOKUP_KEY", key)
+    with pytest.raises(RuntimeError, match="PIN_LOOKUP_KEY"):
+        hashing.pin_lookup("1234")
+
+def test_service_refuses_to_start_without_key(monkeypatch):
+    monkeypatch.setattr(hashing, "PIN_LOOKUP_KEY", "")
+    with pytest.raises(RuntimeError, match="PIN_LOOKUP_KEY"):
+        with TestClient(main.app):
+            pass
+
+def test_verify_pin(client, admin):
+    create_user(client, admin, "pinmanager", role="manager", system="POS", pin="4821")
+    cashier = create_user(client, admin, "pincashier", role="cashier", system="POS")
+    headers = login(client, cashier["username"], cashier["password"])
+    response = client.post("/users/verify-pin", headers=headers, json={"pin": "4821"})
+    assert response.status_code == 200
+    assert response.json() == {"managerUsername": "pinmanager"}
+    assert client.post("/users/verify-pin", headers=headers, json={"pin": "4822"}).status_code == 401
+    assert client.post("/users/verify-pin", headers=headers, json={"pin": "48a1"}).status_code == 400
+
+def test_duplicate_pin_is_rejected_on_create_update_and_bulk(client, admin):
+    create_user(client, admin, "dupmanager1", role="manager", system="POS", pin="1111")
+    form = {"firstName": "Dup", "lastName": "Manager", "username": "dupmanager2", "password": "p" * 12,
+            "email": "dupmanager2@example.com", "userRole": "manager", "system": "POS", "pin": "1111"}
+    response = client.post("/users/create", headers=admin, data=form)
+    assert response.status_code == 400
+    assert "PIN" in response.json()["detail"]
+
+    create_user(client, admin, "dupmanager3", role="manager", system="POS", pin="2222")
+    target = user_id(client, admin, "dupmanager3")
+    assert client.put(f"/users/update/{target}", headers=admin, data={"pin": "1111"}).status_code == 400
+    # keeping one's own pin is not a conflict
+    assert client.put(f"/users/update/{target}", headers=admin, data={"pin": "2222"}).status_code == 200
+
+    rows = [
+        {**form, "username": "bulkmanager1", "email": "bulkmanager1@example.com", "pin": "1111"},
+        {**form, "username": "bulkmanager2", "email": "bulkmanager2@example.com", "pin": "3333"},
+        {**form, "username": "bulkmanager3", "email": "bulkmanager3@example.com", "pin": "3333"},
+    ]
+    results = client.post("/users/bulk-create", headers=admin, json=rows).json()["results"]
+    assert [r.get("status") for r in results] == ["error", "created", "error"]
+    assert "PIN" in results[0]["detail"] and "more than once" in results[2]["detail"]
+
+def test_disabled_manager_frees_the_pin(client, admin):
+    create_user(client, admin, "oldmanager", role="manager", system="POS", pin="5555")
+    assert client.put(f"/users/disable/{user_id(client, admin, 'oldmanager')}", headers=admin).status_code == 200
+    create_user(client, admin, "newmanager", role="manager", system="POS", pin="5555")
+    cashier = create_user(client, admin, "pincashier2", role="cashier", system="POS")
+    headers = login(client, cashier["username"], cashier["password"])
+    response = client.post("/users/verify-pin", headers=headers, json={"pin": "5555"})
+    assert response.json() == {"managerUsername": "newmanager"}
+
+# rows from before the pin checks (or written around them) are refused, not credited to the first one
+def test_verify_pin_refuses_a_shared_pin(client, admin):
+    create_user(client, admin, "sharedmanager1", role="manager", system="POS", pin="6014")
+    create_user(client, admin, "sharedmanager2", role="manager", system="POS", pin="6015")
+    with closing(sqlite3.connect(os.environ["SQLITE_PATH"], isolation_level=None)) as db:
+        db.execute("DROP INDEX UX_Users_ManagerPinLookup")
+        try:
+            db.execute(
+                "UPDATE Users SET Pin = (SELECT Pin FROM Users WHERE Username = 'sharedmanager1'), PinLookup = ? WHERE Username = 'sharedmanager2'",
+                (hashing.pin_lookup("6014"),)
+            )
+            cashier = create_user(client, admin, "pincashier3", role="cashier", system="POS")
+            headers = login(client, cashier["username"], cashier["password"])
+            assert client.post("/users/verify-pin", headers=headers, json={"pin": "6014"}).status_code == 409
+        finally:
+            db.execute("UPDATE Users SET isDisabled = 1 WHERE Username IN ('sharedmanager1', 'sharedmanager2')")
+            db.execute(
+                "CREATE UNIQUE INDEX UX_Users_ManagerPinLookup ON Users (PinLookup) "
+                "WHERE UserRole = 'manager' AND System = 'POS' AND isDisabled = 0 AND PinLookup IS NOT NULL"
+            )
+
+def _sql(statement: str, *params):
+    with closing(sqlite3.connect(os.environ["SQLITE_PATH"], isolation_level=None)) as db:
+        return db.execute(statement, params).fetchall()
+
+# managers from before PinLookup, found only by their bcrypt hash
+def _unmigrate(*usernames):
+    _sql(f"UPDATE Users SET PinLookup = NULL WHERE Username IN ({', '.join('?' * len(usernames))})", *usernames)
+
+def _cashier_headers(client, admin, username):
+    cashier = create_user(client, admin, username, role="cashier", system="POS")
+    return login(client, cashier["username"], cashier["password"])
+
+def test_legacy_pin_is_verified_and_backfilled(client, admin):
+    create_user(client, admin, "legacymanager", role="manager", system="POS", pin="7301")
+    _unmigrate("legacymanager")
+    headers = _cashier_headers(client, admin, "legacycashier")
+    response = client.post("/users/verify-pin", headers=headers, json={"pin": "7301"})
+    assert response.json() == {"managerUsername": "legacymanager"}
+    assert _sql("SELECT PinLookup FROM Users WHERE Username = 'legacymanager'") == [(hashing.pin_lookup("7301"),)]
+
+def test_legacy_pin_is_taken_on_create_update_and_bulk(client, admin):
+    create_user(client, admin, "legacyholder", role="manager", system="POS", pin="7302")
+    _unmigrate("legacyholder")
+    form = {"firstName": "Legacy", "lastName": "Manager", "username": "legacyclash", "password": "p" * 12,
+            "email": "legacyclash@example.com", "userRole": "manager", "system": "POS", "pin": "7302"}
+    response = client.post("/users/create", headers=admin, data=form)
+    assert response.status_code == 400 and "PIN" in response.json()["detail"]
+
+    create_user(client, admin, "legacyother", role="manager", system="POS", pin="7303")
+    assert client.put(f"/users/update/{user_id(client, admin, 'legacyother')}", headers=admin, data={"pin": "7302"}).status_code == 400
+    # the legacy manager keeping their own pin is not a conflict
+    assert client.put(f"/users/update/{user_id(client, admin, 'legacyholder')}", headers=admin, data={"pin": "7302"}).status_code == 200
+    _unmigrate("legacyholder")
+
+    results = client.post("/users/bulk-create", headers=admin, json=[{**form, "username": "legacybulk", "email": "legacybulk@example.com"}]).json()["results"]
+    assert results[0]["status"] == "error" and "PIN" in results[0]["detail"]
+    _sql("UPDATE Users SET isDisabled = 1 WHERE Username IN ('legacyholder', 'legacyother')")
+
+def test_shared_legacy_pin_is_refused_not_backfilled(client, admin):
+    create_user(client, admin, "legacyshared1", role="manager", system="POS", pin="7304")
+    create_user(client, admin, "legacyshared2", role="manager", system="POS", pin="7305")
+    create_user(client, admin, "legacyshared3", role="manager", system="POS", pin="7306")
+    _unmigrate("legacyshared1", "legacyshared2")
+    pin_of_first = "(SELECT Pin FROM Users WHERE Username = 'legacyshared1')"
+    _sql(f"UPDATE Users SET Pin = {pin_of_first} WHERE Username IN ('legacyshared2', 'legacyshared3')")
+    headers = _cashier_headers(client, admin, "legacycashier2")
+    try:
+        # two legacy rows match
+        assert client.post("/users/verify-pin", headers=headers, json={"pin": "7304"}).status_code == 409
+        assert _sql("SELECT COUNT(*) FROM Users WHERE Username LIKE 'legacyshared_' AND PinLookup IS NULL") == [(2,)]
+        # one legacy row matches and so does an indexed one
+        _unmigrate("legacyshared3")
+        _sql("UPDATE Users SET isDisabled = 1 WHERE Username = 'legacyshared2'")
+        _sql("UPDATE Users SET PinLookup = ? WHERE Username = 'legacyshared3'", hashing.pin_lookup("7304"))
+        assert client.post("/users/verify-pin", headers=headers, json={"pin": "7304"}).status_code == 409
+    finally:
+        _sql("UPDATE Users SET isDisabled = 1 WHERE Username LIKE 'legacyshared_'")
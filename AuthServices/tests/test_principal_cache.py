@@ -0,0 +1,37 @@
+import time
+from cache import TTLCache
+from conftest import create_user, login, user_id
+
+def test_lru_bound_and_ttl(monkeypatch):
+    cache = TTLCache(maxsize=2, ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    # b was the least recently used
+    assert cache.get("b") is None and cache.get("a") == 1 and cache.get("c") == 3
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 11)
+    assert cache.get("a") is None
+    assert cache.stats()["size"] == 1
+
+def test_invalidate():
+    cache = TTLCache()
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.invalidate("a", None)
+    assert cache.get("a") is None and cache.get("b") == 2
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+def test_writes_reach_cached_principals(client, admin):
+    form = create_user(client, admin, "cachedrider")
+    headers = login(client, form["username"], form["password"])
+    assert client.get("/auth/users/me", headers=headers).json()["userRole"] == "rider"
+    target = user_id(client, admin, "cachedrider")
+    assert client.put(f"/users/update/{target}", headers=admin, data={"userRole": "staff"}).status_code == 200
+    assert client.get("/auth/users/me", headers=headers).json()["userRole"] == "staff"
+
+    assert client.put(f"/users/disable/{target}", headers=admin).status_code == 200
+    assert client.get("/auth/users/me", headers=headers).status_code == 401
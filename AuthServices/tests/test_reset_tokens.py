@@ -0,0 +1,73 @@
+import pytest
+import hashing
+import reset_tokens
+from repositories import UserRepository
+from routers import auth
+from conftest import PASSWORD, create_user
+
+def _issue(client, email: str) -> str:
+    return client.portal.call(reset_tokens.store.issue, email)
+
+def _reset(client, email: str, token: str, new_password: str):
+    return client.post("/auth/reset-password", params={"email": email, "token": token, "new_password": new_password})
+
+def _login_status(client, username: str, password: str) -> int:
+    return client.post("/auth/token", data={"username": username, "password": password}).status_code
+
+def test_token_is_single_use(client, admin):
+    form = create_user(client, admin, "resetonce", role="user")
+    token = _issue(client, form["email"])
+
+    assert _reset(client, form["email"], "not-the-token", "new-password-1").status_code == 400
+    assert _reset(client, "someone@example.com", token, "new-password-1").status_code == 400
+
+    response = _reset(client, form["email"], token, "new-password-1")
+    assert response.status_code == 200, response.text
+    assert _login_status(client, "resetonce", "new-password-1") == 200
+    assert _login_status(client, "resetonce", PASSWORD) == 401
+
+    assert _reset(client, form["email"], token, "new-password-2").status_code == 400
+    assert _login_status(client, "resetonce", "new-password-1") == 200
+
+def test_consuming_one_link_kills_the_others(client, admin):
+    form = create_user(client, admin, "resetmany", role="user")
+    first, second = _issue(client, form["email"]), _issue(client, form["email"])
+    assert _reset(client, form["email"], second, "new-password-1").status_code == 200
+    assert _reset(client, form["email"], first, "new-password-2").status_code == 400
+
+def test_expired_token_is_refused(client, admin, monkeypatch):
+    form = create_user(client, admin, "resetlate", role="user")
+    monkeypatch.setattr(reset_tokens, "RESET_TOKEN_EXP_MINUTES", -1)
+    token = _issue(client, form["email"])
+    assert _reset(client, form["email"], token, "new-password-1").status_code == 400
+    assert _login_status(client, "resetlate", PASSWORD) == 200
+
+def test_busy_hasher_leaves_the_token_usable(client, admin, monkeypatch):
+    form = create_user(client, admin, "resetbusy", role="user")
+    token = _issue(client, form["email"])
+
+    async def full(password):
+        raise hashing.HashQueueFull()
+
+    with monkeypatch.context() as patch:
+        patch.setattr(auth, "get_password_hash", full)
+        assert _reset(client, form["email"], token, "new-password-1").status_code == 503
+
+    assert _reset(client, form["email"], token, "new-password-1").status_code == 200
+    assert _login_status(client, "resetbusy", "new-password-1") == 200
+
+def test_failed_update_leaves_the_token_usable(client, admin, monkeypatch):
+    form = create_user(client, admin, "resetdbfail", role="user")
+    token = _issue(client, form["email"])
+
+    async def broken(self, *args):
+        raise RuntimeError("connection lost")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(UserRepository, "reset_oos_password", broken)
+        with pytest.raises(RuntimeError):
+            _reset(client, form["email"], token, "new-password-1")
+
+    assert _login_status(client, "resetdbfail", PASSWORD) == 200
+    assert _reset(client, form["email"], token, "new-password-1").status_code == 200
+    assert _login_status(client, "resetdbfail", "new-password-1") == 200
@@ -0,0 +1,111 @@
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import closing
+from datetime import datetime, timedelta
+import revocation
+from conftest import create_user, login
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = revocation.BloomFilter(1000, 0.01)
+    keys = [uuid.uuid4().bytes for _ in range(1000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+    false_positives = sum(uuid.uuid4().bytes in bloom for _ in range(10000))
+    assert false_positives < 300
+
+def test_is_revoked_by_jti_and_cutoff():
+    revoked = revocation.RevocationList()
+    jti = uuid.uuid4().hex
+    revoked._add(revocation._key(jti))
+    assert revoked.is_revoked({"sub": "alice", "jti": jti, "iat": 100})
+    assert not revoked.is_revoked({"sub": "alice", "jti": uuid.uuid4().hex, "iat": 100})
+
+    revoked._raise_cutoff("alice", 200)
+    assert revoked.is_revoked({"sub": "alice", "jti": uuid.uuid4().hex, "iat": 200})
+    assert not revoked.is_revoked({"sub": "alice", "jti": uuid.uuid4().hex, "iat": 201})
+    # tokens without iat predate every cutoff
+    assert revoked.is_revoked({"sub": "alice"})
+    assert not revoked.is_revoked({"sub": "bob"})
+
+def test_cutoffs_only_move_forward():
+    revoked = revocation.RevocationList()
+    revoked._raise_cutoff("alice", 200)
+    revoked._raise_cutoff("alice", 100)
+    assert revoked._cutoffs["alice"] == 200
+
+def test_filter_grows_past_capacity(monkeypatch):
+    monkeypatch.setattr(revocation, "REVOCATION_BLOOM_CAPACITY", 4)
+    revoked = revocation.RevocationList()
+    keys = [uuid.uuid4().bytes for _ in range(20)]
+    for key in keys:
+        revoked._add(key)
+    assert revoked._bloom.capacity >= 20
+    assert all(key in revoked._bloom for key in keys)
+
+def _stored_cutoff(username: str) -> datetime:
+    with closing(sqlite3.connect(os.environ["SQLITE_PATH"], detect_types=sqlite3.PARSE_DECLTYPES)) as db:
+        return db.execute("SELECT RevokedBefore FROM TokenRevocationCutoffs WHERE Username = ?", (username,)).fetchone()[0]
+
+def test_an_earlier_cutoff_never_lowers_the_stored_one(client, admin):
+    form = create_user(client, admin, "cutoffrider")
+    headers = login(client, form["username"], form["password"])
+    now = datetime.utcnow() + timedelta(seconds=1)
+    assert client.post("/auth/revoke", headers=admin, json={"username": "cutoffrider", "before": now.isoformat()}).status_code == 200
+    assert client.get("/auth/users/me", headers=headers).status_code == 401
+
+    earlier = now - timedelta(hours=1)
+    assert client.post("/auth/revoke", headers=admin, json={"username": "cutoffrider", "before": earlier.isoformat()}).status_code == 200
+    assert client.get("/auth/users/me", headers=headers).status_code == 401
+    assert _stored_cutoff("cutoffrider") == now
+    assert revocation.revocations._cutoffs["cutoffrider"] == revocation._epoch(now)
+
+    # tokens issued after the cutoff still work
+    time.sleep(max((now - datetime.utcnow()).total_seconds(), 0) + 1.1)
+    assert client.get("/auth/users/me", headers=login(client, form["username"], form["password"])).status_code == 200
+
+def test_logout_revokes_only_that_token(client, admin):
+    form = create_user(client, admin, "logoutrider")
+    first = login(client, form["username"], form["password"])
+    second = login(client, form["username"], form["password"])
+    assert client.post("/auth/logout", headers=first).status_code == 200
+    assert client.get("/auth/users/me", headers=first).status_code == 401
+    assert client.get("/auth/users/me", headers=second).status_code == 200
+
+def _stored_jtis() -> set[str]:
+    with closing(sqlite3.connect(os.environ["SQLITE_PATH"])) as db:
+        return {row[0] for row in db.execute("SELECT Jti FROM RevokedTokens")}
+
+def test_revoking_a_jti_twice_keeps_one_row(client):
+    jti = uuid.uuid4().hex
+    expires = datetime.utcnow() + timedelta(hours=1)
+    client.portal.call(revocation.revocations.revoke, jti, "twicerider", expires)
+    client.portal.call(revocation.revocations.revoke, jti, "twicerider", expires)
+    with closing(sqlite3.connect(os.environ["SQLITE_PATH"])) as db:
+        assert db.execute("SELECT COUNT(*) FROM RevokedTokens WHERE Jti = ?", (jti,)).fetchone()[0] == 1
+    assert revocation.revocations.is_revoked({"sub": "twicerider", "jti": jti, "iat": int(time.time())})
+
+def test_refresh_and_purge(client):
+    revoked = revocation.revocations
+    # written by another worker, picked up on the next refresh
+    other, expired = uuid.uuid4().hex, uuid.uuid4().hex
+    now = datetime.utcnow()
+    with closing(sqlite3.connect(os.environ["SQLITE_PATH"], isolation_level=None)) as db:
+        db.executemany(
+            "INSERT INTO RevokedTokens (Jti, Username, ExpiresAt, RevokedAt) VALUES (?, ?, ?, ?)",
+            [(other, "elsewhere", now + timedelta(hours=1), now), (expired, "elsewhere", now - timedelta(seconds=1), now)],
+        )
+        db.execute(
+            "INSERT INTO TokenRevocationCutoffs (Username, RevokedBefore, UpdatedAt) VALUES (?, ?, ?)",
+            ("elsewhere", now, now),
+        )
+    client.portal.call(revoked.refresh)
+    assert revoked.is_revoked({"sub": "someone", "jti": other, "iat": 0})
+    assert revoked._cutoffs["elsewhere"] == revocation._epoch(now)
+
+    client.portal.call(revoked.purge)
+    assert other in _stored_jtis() and expired not in _stored_jtis()
+    assert revoked.is_revoked({"sub": "someone", "jti": other, "iat": 0})
+    assert not revoked.is_revoked({"sub": "someone", "jti": expired, "iat": 0})
@@ -0,0 +1,42 @@
+import roster
+from conftest import create_user
+
+def test_riders_etag_and_304(client, admin):
+    first = client.get("/users/riders")
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    assert first.headers["Cache-Control"] == "no-cache"
+
+    again = client.get("/users/riders", headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.content == b""
+    assert client.get("/users/riders", headers={"If-None-Match": f'W/{etag}, "other"'}).status_code == 304
+    assert client.get("/users/riders", headers={"If-None-Match": "*"}).status_code == 304
+
+    # a new rider moves the riders version, the old etag no longer matches
+    create_user(client, admin, "etagrider")
+    changed = client.get("/users/riders", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["ETag"] != etag
+    assert "etagrider" in [rider["Username"] for rider in changed.json()]
+
+def test_unrelated_roles_keep_the_etag(client, admin):
+    etag = client.get("/users/cashiers").headers["ETag"]
+    create_user(client, admin, "etagstaff", role="staff", system="IMS")
+    assert client.get("/users/cashiers", headers={"If-None-Match": etag}).status_code == 304
+    create_user(client, admin, "etagcashier", role="cashier", system="POS")
+    assert client.get("/users/cashiers", headers={"If-None-Match": etag}).status_code == 200
+
+def test_list_users_etag_follows_query(client, admin):
+    response = client.get("/users/list-users", headers=admin, params={"limit": 5})
+    etag = response.headers["ETag"]
+    assert client.get("/users/list-users", headers={**admin, "If-None-Match": etag}, params={"limit": 5}).status_code == 304
+    assert client.get("/users/list-users", headers={**admin, "If-None-Match": etag}, params={"limit": 6}).status_code == 200
+
+def test_versions_merge_by_max():
+    before = roster.version(None, "rider")
+    roster._apply("OOS", "rider", (10**9, "zzzz"))
+    assert roster.version(None, "rider") == f"{10**9}.zzzz"
+    # an older stamp arriving late changes nothing
+    roster._apply("OOS", "rider", (1, "aaaa"))
+    assert roster.version("OOS", "rider") == f"{10**9}.zzzz"
+    assert roster.version("POS", "cashier") != roster.version("OOS", "rider")
+    assert before != roster.version(None, "rider")
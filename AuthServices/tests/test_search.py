@@ -0,0 +1,109 @@
+import search
+from conftest import create_user, user_id
+
+# users.search_rows shape: UserID, Username, Email, Phone, First, Middle, Last, Suffix, Role, System, isDisabled
+ROWS = [
+    (1, "maria", "maria@shop.ph", "09171234567", "Maria", None, "Santos", None, "rider", "OOS", 0),
+    (2, "mariabelle", "mb@shop.ph", None, "Belle", None, "Reyes", None, "cashier", "POS", 0),
+    (3, "jdelacruz", "jd@mail.com", "0918 555 0000", "Juan", "Maria", "Dela Cruz", None, "rider", "OOS", 1),
+    (4, "anamaria", "ana@mail.com", None, "Ana", None, "Lim", None, "rider", "OOS", 0),
+    (5, "pedro", "pedro@mail.com", "09175550000", "Pedro", None, "Santos", "Jr.", "manager", "POS", 0),
+]
+
+def _index(rows=ROWS) -> search.SearchIndex:
+    index = search.SearchIndex()
+    index._postings, index._records = search._build(rows)
+    index.loaded = True
+    return index
+
+def _ids(index, q, filters=None, offset=0, limit=50):
+    return index.search(q, filters or {}, offset, limit)[1]
+
+def test_ranking_exact_prefix_word_substring():
+    # exact username, username prefix, middle name, inside a username
+    assert _ids(_index(), "maria") == [1, 2, 3, 4]
+
+def test_short_queries_match_starts_only():
+    index = _index()
+    assert _ids(index, "ma") == [1, 2, 3]
+    # "ri" is inside maria but starts nothing
+    assert _ids(index, "ri") == []
+    assert _ids(index, "s") == [1, 5]
+
+def test_phone_queries_match_digits():
+    index = _index()
+    assert _ids(index, "0917 123-4567") == [1]
+    assert _ids(index, "(0918) 555") == [3]
+    assert _ids(index, "5550000") == [3, 5]
+
+def test_several_words_match_anywhere():
+    index = _index()
+    assert _ids(index, "maria santos") == [1]
+    assert _ids(index, "dela cruz") == [3]
+    assert _ids(index, "SANTOS   jr.") == [5]
+
+def test_filters_narrow_the_matches():
+    index = _index()
+    assert _ids(index, "maria", {"role": "rider"}) == [1, 3, 4]
+    assert _ids(index, "maria", {"role": "rider", "is_disabled": False}) == [1, 4]
+    assert _ids(index, "", {"system": "POS"}) == [2, 5]
+    assert _ids(index, "maria", {"role": "admin"}) == []
+
+def test_pages_run_across_tiers():
+    index = _index()
+    total, first = index.search("maria", {}, 0, 3)
+    assert (total, first) == (4, [1, 2, 3])
+    assert index.search("maria", {}, 3, 3) == (4, [4])
+    assert index.search("maria", {}, 1, 2) == (4, [2, 3])
+
+def test_changes_update_the_postings():
+    index = _index()
+    renamed = (4, "anamarie", "ana@mail.com", None, "Ana", None, "Lim", None, "rider", "OOS", 0)
+    index._apply({"rows": [renamed], "gone": [2]})
+    assert _ids(index, "maria") == [1, 3]
+    assert _ids(index, "anamarie") == [4]
+    # every posting list stays sorted and free of removed users
+    assert all(list(ids) == sorted(set(ids)) and 2 not in ids for ids in index._postings.values())
+    rebuilt = sorted([row for row in ROWS if row[0] not in (2, 4)] + [renamed])
+    assert index._postings == _index(rebuilt)._postings
+
+def test_changes_during_a_load_are_replayed():
+    index = _index()
+    index._pending = []
+    index._apply({"rows": [], "gone": [1]})
+    assert _ids(index, "maria") == [1, 2, 3, 4]
+    pending, index._pending = index._pending, None
+    for data in pending:
+        index._apply(data)
+    assert _ids(index, "maria") == [2, 3, 4]
+
+def test_endpoint_follows_writes(client, admin):
+    create_user(client, admin, "zebrafinch", firstName="Zeb")
+    found = client.get("/users/search", headers=admin, params={"q": "zebraf", "fields": "username"})
+    assert found.json() == [{"username": "zebrafinch"}]
+    assert found.headers["X-Total-Count"] == "1"
+
+    response = client.put(f"/users/update/{user_id(client, admin, 'zebrafinch')}", headers=admin, data={"username": "quokkafinch"})
+    assert response.status_code == 200, response.text
+    assert [user["username"] for user in client.get("/users/search", headers=admin, params={"q": "quokka"}).json()] == ["quokkafinch"]
+    # still found by the last name, which did not change
+    assert [user["username"] for user in client.get("/users/search", headers=admin, params={"q": "zebraf"}).json()] == ["quokkafinch"]
+
+def test_endpoint_pages_and_waits_for_the_load(client, admin, monkeypatch):
+    for i in range(3):
+        create_user(client, admin, f"pagedheron{i}")
+    response = client.get("/users/search", headers=admin, params={"q": "pagedheron", "limit": 2, "fields": "username"})
+    assert [user["username"] for user in response.json()] == ["pagedheron0", "pagedheron1"]
+    assert response.headers["X-Next-Offset"] == "2"
+    response = client.get("/users/search", headers=admin, params={"q": "pagedheron", "offset": 2, "fields": "username"})
+    assert [user["username"] for user in response.json()] == ["pagedheron2"]
+    assert "X-Next-Offset" not in response.headers
+
+    monkeypatch.setattr(search.index, "loaded", False)
+    response = client.get("/users/search", headers=admin, params={"q": "pagedheron"})
+    assert response.status_code == 503 and response.headers["Retry-After"] == "1"
+
+def test_bootstrapped_admin_is_searchable(client, admin):
+    # created at boot, after the index load
+    found = client.get("/users/search", headers=admin, params={"q": "superadmin", "fields": "username"})
+    assert found.json() == [{"username": "superadmin"}]
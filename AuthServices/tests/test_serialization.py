@@ -0,0 +1,101 @@
+import json
+from datetime import datetime
+import pytest
+from fastapi import HTTPException
+import serialization
+from routers.users import PROFILE_VIEW, USER_LIST_VIEW
+from conftest import create_user, login, user_id
+
+LEGACY_KEYS = ["userID", "fullName", "userRole", "phoneNumber", "id", "role", "phone", "firstName", "middleName",
+               "lastName", "suffix", "username", "email", "createdAt", "system", "isDisabled"]
+
+# the dict list-users built by hand before views, from its fixed SELECT
+def _legacy_user(u) -> dict:
+    full_name = ' '.join(part for part in (u[8], u[9], u[10], u[11]) if part)
+    return {
+        "userID": u[0], "fullName": full_name, "userRole": u[2], "phoneNumber": u[7], "id": u[0], "role": u[2],
+        "phone": u[7], "firstName": u[8], "middleName": u[9], "lastName": u[10], "suffix": u[11], "username": u[6],
+        "email": u[1], "createdAt": u[4].isoformat() if u[4] else None, "system": u[5], "isDisabled": bool(u[3]),
+    }
+
+_LEGACY_COLUMNS = ("UserID", "Email", "UserRole", "isDisabled", "CreatedAt", "System", "Username", "PhoneNumber",
+                   "FirstName", "MiddleName", "LastName", "Suffix")
+
+def test_full_view_matches_the_legacy_bytes():
+    legacy_rows = [
+        (7, "ana@example.com", "rider", 0, datetime(2024, 5, 1, 8, 30, 15, 123456), "OOS", "ana", "09171234567",
+         "Ana", None, "Cruz", "Jr."),
+        (8, None, "staff", 1, None, "AUTH", "ñino", None, "Niño", "B", "Reyes", None),
+    ]
+    projection = USER_LIST_VIEW.project()
+    assert list(projection.keys) == LEGACY_KEYS
+    for legacy in legacy_rows:
+        by_column = dict(zip(_LEGACY_COLUMNS, legacy))
+        row = tuple(by_column[column] for column in projection.columns)
+        # what fastapi's JSONResponse wrote for the legacy dict
+        expected = json.dumps(_legacy_user(legacy), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        assert serialization.dumps(projection.row(row)) == expected
+
+def test_fields_select_only_their_columns():
+    projection = USER_LIST_VIEW.project("username, fullName,username")
+    assert projection.keys == ("username", "fullName")
+    # the keyset column always comes first, the rest in view order
+    assert projection.columns == ("UserID", "FirstName", "MiddleName", "LastName", "Suffix", "Username")
+    row = (3, "Jo", None, "Tan", None, "jotan")
+    assert projection.row(row) == {"username": "jotan", "fullName": "Jo Tan"}
+    assert PROFILE_VIEW.project("profileImage,profileImageVariants").columns == ("ProfileImage",)
+
+def test_compact_drops_legacy_keys():
+    keys = USER_LIST_VIEW.project(compact=True).keys
+    assert "id" not in keys and "role" not in keys and "phone" not in keys
+    assert [key for key in LEGACY_KEYS if key not in ("id", "role", "phone")] == list(keys)
+    # an explicit legacy key is still honoured in compact mode
+    assert USER_LIST_VIEW.project("id", compact=True).keys == ("id",)
+
+@pytest.mark.parametrize("fields", ["nope", "username,nope", ",", " "])
+def test_unknown_or_empty_fields_are_rejected(fields):
+    with pytest.raises(HTTPException) as info:
+        USER_LIST_VIEW.project(fields)
+    assert info.value.status_code == 400
+
+def test_projections_are_cached_and_bounded(monkeypatch):
+    view = serialization.View({"a": serialization.Field(("A",)), "b": serialization.Field(("B",))})
+    assert view.project("a") is view.project("a")
+    monkeypatch.setattr(serialization, "VIEW_PROJECTION_CACHE", 1)
+    view.project("b")
+    assert len(view._projections) == 1
+
+def test_list_users_fields_and_compact(client, admin):
+    create_user(client, admin, "projectedrider", phoneNumber="09170000001")
+    after = user_id(client, admin, "projectedrider") - 1
+    page = {"after": after, "limit": 1}
+
+    full = client.get("/users/list-users", headers=admin, params=page).json()[0]
+    assert list(full) == LEGACY_KEYS
+    assert full["id"] == full["userID"] and full["role"] == full["userRole"] == "rider"
+
+    response = client.get("/users/list-users", headers=admin, params={**page, "fields": "username,email"})
+    assert response.json() == [{"username": "projectedrider", "email": "projectedrider@example.com"}]
+    # the next cursor comes from the key column even when userID is not asked for
+    assert response.headers.get("X-Next-Cursor") in (None, str(after + 1))
+
+    compact = client.get("/users/list-users", headers=admin, params={**page, "compact": True}).json()[0]
+    assert {key: value for key, value in full.items() if key not in ("id", "role", "phone")} == compact
+
+    response = client.get("/users/list-users", headers=admin, params={"fields": "password"})
+    assert response.status_code == 400
+    assert "password" in response.json()["detail"]
+
+def test_search_and_profile_fields(client, admin):
+    form = create_user(client, admin, "projectedprofile", role="user")
+    found = client.get("/users/search", headers=admin, params={"q": "projectedprofile", "fields": "username,isDisabled"})
+    assert found.json() == [{"username": "projectedprofile", "isDisabled": False}]
+
+    headers = login(client, form["username"], form["password"])
+    profile = client.get("/users/profile", headers=headers).json()
+    assert list(profile) == list(PROFILE_VIEW.fields)
+    assert profile["profileImage"] is None and profile["profileImageVariants"] is None
+    assert client.get("/users/profile", headers=headers, params={"fields": "username,email"}).json() == {
+        "username": "projectedprofile", "email": "projectedprofile@example.com",
+    }
+    assert client.get("/users/profile", headers=headers, params={"fields": "pin"}).status_code == 400
@@ -0,0 +1,31 @@
+import os
+import pytest
+import hashing
+import serve
+
+@pytest.fixture
+def launcher_env(monkeypatch):
+    for name in ("BCRYPT_ROUNDS", "ARGON2_TIME_COST", "HASH_CALIBRATE"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setattr(hashing, "HASH_CALIBRATE", True)
+    # the app's pool belongs to the session client, not to this launcher
+    monkeypatch.setattr(hashing, "shutdown", lambda: None)
+    return monkeypatch
+
+def test_workers_inherit_one_calibrated_cost(launcher_env):
+    async def calibrate():
+        return hashing.policy()._replace(bcrypt_rounds=11, argon2_time_cost=4)
+
+    launcher_env.setattr(hashing, "calibrate", calibrate)
+    serve._calibrate_hashing()
+    assert (os.environ["BCRYPT_ROUNDS"], os.environ["ARGON2_TIME_COST"]) == ("11", "4")
+    assert os.environ["HASH_CALIBRATE"] == "false"
+
+def test_failed_calibration_still_stops_the_workers_calibrating(launcher_env):
+    async def calibrate():
+        raise RuntimeError("no cores")
+
+    launcher_env.setattr(hashing, "calibrate", calibrate)
+    serve._calibrate_hashing()
+    assert os.environ["BCRYPT_ROUNDS"] == str(hashing.policy().bcrypt_rounds)
+    assert os.environ["HASH_CALIBRATE"] == "false"
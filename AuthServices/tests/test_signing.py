@@ -0,0 +1,72 @@
+import time
+from datetime import datetime, timedelta
+import pytest
+from jose import JWTError, jwt
+import signing
+
+SECRET = "legacy-secret-for-tests"
+
+def _legacy(**claims) -> str:
+    return jwt.encode({"sub": "superadmin", "role": "superadmin", **claims}, SECRET, algorithm="HS256")
+
+@pytest.fixture
+def legacy(monkeypatch):
+    monkeypatch.setattr(signing, "JWT_ACCEPT_HS256", True)
+    monkeypatch.setattr(signing, "LEGACY_SECRET_KEY", SECRET)
+    monkeypatch.setattr(signing, "JWT_HS256_CUTOVER", "2025-01-01T00:00:00")
+    monkeypatch.setattr(signing, "_legacy_cutover", None)
+    signing.check_legacy_config()
+    return datetime(2025, 1, 1)
+
+def test_hs256_is_refused_by_default():
+    assert not signing.JWT_ACCEPT_HS256
+    with pytest.raises(JWTError):
+        signing.verify(_legacy(exp=datetime.utcnow() + timedelta(hours=1)))
+
+def test_legacy_acceptance_needs_secret_and_cutover(monkeypatch):
+    monkeypatch.setattr(signing, "JWT_ACCEPT_HS256", True)
+    monkeypatch.setattr(signing, "LEGACY_SECRET_KEY", "")
+    monkeypatch.setattr(signing, "JWT_HS256_CUTOVER", "2025-01-01T00:00:00")
+    with pytest.raises(RuntimeError, match="JWT_LEGACY_SECRET"):
+        signing.check_legacy_config()
+    monkeypatch.setattr(signing, "LEGACY_SECRET_KEY", SECRET)
+    monkeypatch.setattr(signing, "JWT_HS256_CUTOVER", "")
+    with pytest.raises(RuntimeError, match="JWT_HS256_CUTOVER"):
+        signing.check_legacy_config()
+
+def test_legacy_tokens_are_time_boxed(legacy):
+    # the old tokens carried exp only
+    assert signing.verify(_legacy(exp=datetime.utcnow() + timedelta(days=365 * 5)))["sub"] == "superadmin"
+    with pytest.raises(JWTError):
+        signing.verify(_legacy(exp=legacy + timedelta(days=365 * 10 + 1)))
+    with pytest.raises(JWTError):
+        signing.verify(_legacy(iat=legacy + timedelta(seconds=1), exp=datetime.utcnow() + timedelta(hours=1)))
+    with pytest.raises(JWTError):
+        signing.verify(jwt.encode({"sub": "superadmin", "exp": datetime.utcnow() + timedelta(hours=1)}, "guess", algorithm="HS256"))
+
+def test_unknown_kid_reloads_at_once(client, monkeypatch):
+    # another worker or replica wrote a key into the shared dir after our last scan
+    kid = signing._new_kid()
+    signing._write_key(kid)
+    with open(f"{signing.JWT_KEYS_DIR}/{kid}.pem", "rb") as f:
+        key = signing._SigningKey(kid, signing._kid_created(kid), f.read())
+    token = jwt.encode({"sub": "superadmin", "exp": datetime.utcnow() + timedelta(hours=1)}, key.private,
+                       algorithm="RS256", headers={"kid": kid})
+    signing._loaded_at = time.monotonic() - 2
+    assert signing.verify(token)["sub"] == "superadmin"
+
+    # made-up kids rescan at most once a second
+    loads = []
+    monkeypatch.setattr(signing, "load", lambda: loads.append(1))
+    signing._loaded_at = time.monotonic()
+    for _ in range(5):
+        with pytest.raises(JWTError):
+            signing.verify(jwt.encode({"sub": "x"}, key.private, algorithm="RS256", headers={"kid": signing._new_kid()}))
+    assert loads == []
+
+def test_replicas_without_a_shared_dir_refuse_to_mint(tmp_path, monkeypatch):
+    monkeypatch.setattr(signing, "JWT_KEYS_DIR", str(tmp_path))
+    monkeypatch.setattr(signing, "JWT_KEYS_CREATE", False)
+    with pytest.raises(RuntimeError, match="JWT_KEYS_CREATE"):
+        signing.load()
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,42 @@
+import hashing
+import startup
+from revocation import revocations
+
+def _fails_once(monkeypatch, owner, name: str):
+    real = getattr(owner, name)
+    calls = []
+
+    async def flaky(*args):
+        calls.append(dict(startup._errors))
+        if len(calls) == 1:
+            raise RuntimeError(f"{name} unavailable")
+        return await real(*args)
+
+    monkeypatch.setattr(owner, name, flaky)
+    return calls
+
+def test_ready_after_boot(client):
+    body = client.get("/readyz").json()
+    assert body["ready"] and body["errors"] == {}
+    for step in ("db_pool", "hashing", "lockout", "revocation"):
+        assert step in body["steps_s"]
+
+def test_failed_state_load_is_retried(client, monkeypatch):
+    calls = _fails_once(monkeypatch, revocations, "load")
+    client.portal.call(startup._load_state)
+    assert len(calls) == 2
+    # the failure was on /readyz while the retry waited, and is gone once the load went through
+    assert calls[1]["revocation"] == "load unavailable"
+    assert "revocation" not in startup._errors
+    assert revocations.loaded
+
+def test_failed_hash_warmup_is_retried_on_a_fresh_pool(client, monkeypatch):
+    executor = hashing.start()
+    calls = _fails_once(monkeypatch, hashing, "warm")
+    client.portal.call(startup._retrying, "hashing", "Hash worker warmup", startup._warm_hashing)
+    assert len(calls) == 2 and calls[1]["hashing"] == "warm unavailable"
+    assert "hashing" not in startup._errors
+    assert hashing.start() is not executor
+
+    response = client.post("/auth/token", data={"username": "superadmin", "password": "superadmin123"})
+    assert response.status_code == 200
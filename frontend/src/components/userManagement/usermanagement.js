@@ -28,6 +28,10 @@ function Usermanagement() {
   const [employees, setEmployees] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
+  const [page, setPage] = useState(1);
+  const [perPage, setPerPage] = useState(10);
+  const [totalRows, setTotalRows] = useState(0);
+  const [retry, setRetry] = useState(0);
   const navigate = useNavigate();
 
   // Track sidebar collapsed state
@@ -91,17 +95,25 @@ function Usermanagement() {
       return;
     }
 
-    const fetchEmployees = async () => {
+    // search runs on the server, one page at a time, the term is sent once typing pauses
+    const timer = setTimeout(async () => {
       setLoading(true);
       setError(null);
       try {
-        const response = await fetch("http://127.0.0.1:4000/users/list-users", {
+        const params = new URLSearchParams({ offset: String((page - 1) * perPage), limit: String(perPage) });
+        if (searchTerm.trim()) params.set("q", searchTerm.trim());
+        if (roleFilter) params.set("role", roleFilter);
+        if (systemFilter) params.set("system", systemFilter);
+        const response = await fetch(`http://127.0.0.1:4000/users/search?${params}`, {
           headers: { Authorization: `Bearer ${token}` },
         });
+        if (response.status === 503) {
+          // the search index is still loading after a restart
+          setTimeout(() => setRetry((n) => n + 1), 1000 * Number(response.headers.get("Retry-After") || 1));
+          return;
+        }
         if (!response.ok) throw new Error(`Failed to fetch data: ${response.status}`);
-        let apiData = await response.json();
-        if (apiData && !Array.isArray(apiData)) apiData = [apiData];
-        else if (!apiData) apiData = [];
+        const apiData = (await response.json()) || [];
 
         const mappedEmployees = apiData.map((user) => ({
           id: user.userID,
@@ -114,15 +126,21 @@ function Usermanagement() {
           phone: user.phoneNumber || "N/A",
         }));
         setEmployees(mappedEmployees);
+        setTotalRows(Number(response.headers.get("X-Total-Count")) || 0);
       } catch (e) {
         console.error("Fetch error:", e);
         setError(e.message);
       } finally {
         setLoading(false);
       }
-    };
-    fetchEmployees();
-  }, [navigate]);
+    }, 250);
+    return () => clearTimeout(timer);
+  }, [navigate, searchTerm, roleFilter, systemFilter, page, perPage, retry]);
+
+  // a new search or filter starts again from the first page
+  useEffect(() => {
+    setPage(1);
+  }, [searchTerm, roleFilter, systemFilter]);
 
   const toggleDropdown = () => setDropdownOpen(!isDropdownOpen);
   const currentDate = new Date().toLocaleString("en-US", {
@@ -172,14 +190,6 @@ function Usermanagement() {
     }
   };
 
-  const filteredData = employees.filter((emp) => {
-    const nameMatch = emp.name?.toLowerCase().includes(searchTerm.toLowerCase());
-    const emailMatch = emp.email?.toLowerCase().includes(searchTerm.toLowerCase());
-    const roleMatch = roleFilter ? emp.role === roleFilter : true;
-    const systemMatch = systemFilter ? emp.system === systemFilter : true;
-    return (nameMatch || emailMatch) && roleMatch && systemMatch;
-  });
-
   const columns = [
     { name: "EMPLOYEE", selector: (row) => row.name, sortable: true, width: "20%" },
     { name: "System", selector: (row) => row.system, width: "10%" },
@@ -229,7 +239,7 @@ function Usermanagement() {
           <div className="filter-bar">
             <input
               type="text"
-              placeholder="Search Employees..."
+              placeholder="Search name, username, email or phone..."
               value={searchTerm}
               onChange={(e) => setSearchTerm(e.target.value)}
             />
@@ -275,8 +285,16 @@ function Usermanagement() {
 
           <DataTable
             columns={columns}
-            data={filteredData}
+            data={employees}
             pagination
+            paginationServer
+            paginationTotalRows={totalRows}
+            paginationDefaultPage={page}
+            onChangePage={setPage}
+            onChangeRowsPerPage={(rows, currentPage) => {
+              setPerPage(rows);
+              setPage(currentPage);
+            }}
             highlightOnHover
             responsive
             progressPending={loading}